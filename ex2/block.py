@@ -1,32 +1,81 @@
 from .utils import BlockHash
 from .transaction import Transaction
-from typing import List
+from typing import List, Optional
 import hashlib
 
+# The number of bytes of the nonce of a proof-of-work block (see pow.py).
+NONCE_SIZE = 8
+
+
+class BlockHeader:
+    """The part of a block that links it into a chain: its hash and the hash of the previous block.
+    Headers are served by Node.get_headers() so that a node can learn the shape of a peer's chain
+    before downloading any block bodies. The claimed hash is only trusted once the body arrives and
+    hashes to the same value."""
+
+    def __init__(self, block_hash: BlockHash, prev_block_hash: BlockHash, nonce: Optional[int] = None) -> None:
+        self.block_hash = block_hash
+        self.prev_block_hash = prev_block_hash
+        self.nonce = nonce
+
+    def get_block_hash(self) -> BlockHash:
+        """Gets the hash of the block this header describes"""
+        return self.block_hash
+
+    def get_prev_block_hash(self) -> BlockHash:
+        """Gets the hash of the previous block"""
+        return self.prev_block_hash
+
+    def get_nonce(self) -> Optional[int]:
+        """Gets the proof-of-work nonce of the block (None for blocks without proof of work)"""
+        return self.nonce
+
+
 class Block:
-    def __init__(self, prev_block_hash: BlockHash, transactions: List[Transaction]):
+    def __init__(self, prev_block_hash: BlockHash, transactions: List[Transaction], nonce: Optional[int] = None):
         """
         Initializes a block with a list of transactions and the hash of the previous block.
 
         :param prev_block_hash: The hash of the previous block in the chain.
         :param transactions: List of transactions included in this block.
+        :param nonce: The proof-of-work nonce, or None for blocks without proof of work.
         """
         self.transactions = transactions
         self.prev_block_hash = prev_block_hash
+        self.nonce = nonce
 
     def get_block_hash(self) -> BlockHash:
         """Gets the hash of this block. 
         This function is used by the tests. Make sure to compute the result from the data in the block every time 
         and not to cache the result"""
+        return self._compute_block_hash()
+
+    def _compute_block_hash(self) -> BlockHash:
+        # Stream the previous block's hash and the txids into the hasher, instead of concatenating them first
+        hasher = hashlib.sha256(self.prev_block_hash)
+        for tx in self.transactions:
+            hasher.update(tx.get_txid())
+
+        # The nonce of a proof-of-work block comes last, so miners can hash the rest only once
+        if self.nonce is not None:
+            hasher.update(self.nonce.to_bytes(NONCE_SIZE, "big"))
+        return BlockHash(hasher.digest())
+
+    def get_hash_prefix(self) -> bytes:
+        """Gets the data hashed into the block hash before the nonce: the previous block's hash and the txids"""
         # Serialize all transactions
         serialized_transactions = b"".join(tx.get_txid() for tx in self.transactions)
 
         # Combine the serialized transactions with the previous block's hash
-        block_content = self.prev_block_hash + serialized_transactions
+        return self.prev_block_hash + serialized_transactions
+
+    def get_header(self) -> BlockHeader:
+        """Gets the header of this block (computed from the data in the block, like the hash)"""
+        return BlockHeader(self.get_block_hash(), self.prev_block_hash, self.nonce)
 
-        # Compute the block hash using SHA256
-        block_hash = hashlib.sha256(block_content).digest()
-        return BlockHash(block_hash)
+    def get_nonce(self) -> Optional[int]:
+        """Gets the proof-of-work nonce of the block (None for blocks without proof of work)"""
+        return self.nonce
 
     def get_transactions(self) -> List[Transaction]:
         """
@@ -37,3 +86,38 @@ class Block:
     def get_prev_block_hash(self) -> BlockHash:
         """Gets the hash of the previous block"""
         return self.prev_block_hash
+
+
+class SealedBlock(Block):
+    """
+    A block that is not modified after it is created, so its hash is computed only once (opt-in, see Node.seal_blocks).
+    Assigning to its fields raises an AttributeError. The transactions themselves can still be changed in place,
+    so for debugging, set SealedBlock.integrity_checks: every get_block_hash() call then recomputes the hash
+    and raises a RuntimeError if the block changed since it was sealed.
+    """
+    integrity_checks = False
+    # set once, when the block is sealed
+    block_hash: BlockHash
+
+    def __init__(self, prev_block_hash: BlockHash, transactions: List[Transaction], nonce: Optional[int] = None):
+        super().__init__(prev_block_hash, list(transactions), nonce)
+        object.__setattr__(self, "block_hash", self._compute_block_hash())
+        object.__setattr__(self, "sealed", True)
+
+    @staticmethod
+    def seal(block: Block) -> 'SealedBlock':
+        """Returns a sealed copy of the block (or the block itself if it is already sealed)."""
+        if isinstance(block, SealedBlock):
+            return block
+        return SealedBlock(block.get_prev_block_hash(), block.get_transactions(), block.get_nonce())
+
+    def __setattr__(self, name: str, value: object) -> None:
+        if getattr(self, "sealed", False):
+            raise AttributeError(f"Cannot set {name}: the block is sealed")
+        super().__setattr__(name, value)
+
+    def get_block_hash(self) -> BlockHash:
+        """Gets the hash of this block, computed when the block was sealed."""
+        if SealedBlock.integrity_checks and self._compute_block_hash() != self.block_hash:
+            raise RuntimeError("The block was modified after it was sealed")
+        return self.block_hash
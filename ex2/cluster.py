@@ -0,0 +1,290 @@
+"""
+Cluster runner: launches nodes as separate processes on this machine, connects them over TCP (see transport.py)
+in a topology, and drives a workload of mining and payments on every node, so that the network runs without
+sharing one interpreter. When the workload ends, the runner waits for the nodes to agree on a tip, collects
+their statistics and shuts them down, and reports the throughput (transactions confirmed per second) and the
+time to consistency.
+
+    python -m ex2.cluster --nodes 8 --topology random --duration 30 --seed 1 --report cluster.json
+
+Ctrl-C (or SIGTERM) stops the workload early, and still shuts the nodes down gracefully and reports.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import queue
+import random
+import signal
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .node import Node
+from .simulator import TOPOLOGIES, make_topology
+from .transport import NodeServer
+
+# Seconds to wait for the nodes to agree on a tip after the workload ends.
+DEFAULT_CONSISTENCY_TIMEOUT = 30.0
+# Seconds to wait for a node process to exit after asking it to, before terminating it.
+SHUTDOWN_TIMEOUT = 10.0
+
+MINE = "mine"
+PAY = "pay"
+
+
+def workload_events(rng: random.Random, mine_interval: float, pay_interval: float) -> Iterator[Tuple[float, str]]:
+    """
+    The workload of one node: an endless sequence of (seconds from start, MINE or PAY), with exponentially
+    distributed gaps of the given means (an interval of 0 disables that kind of event).
+    """
+    next_times = {}
+    if mine_interval > 0:
+        next_times[MINE] = rng.expovariate(1 / mine_interval)
+    if pay_interval > 0:
+        next_times[PAY] = rng.expovariate(1 / pay_interval)
+    while next_times:
+        kind = min(next_times, key=next_times.__getitem__)
+        yield next_times[kind], kind
+        next_times[kind] += rng.expovariate(1 / (mine_interval if kind == MINE else pay_interval))
+
+
+class NodeProcess:
+    """The state of a node in its own process. run() follows the commands the cluster sends through the pipe."""
+
+    def __init__(self, index: int, commands: Connection, reports: 'multiprocessing.Queue[Any]') -> None:
+        self.index = index
+        self.commands = commands
+        self.reports = reports
+        self.server = NodeServer(Node())
+        self.server.listeners.append(lambda tip: reports.put(("tip", index, tip)))
+        self.addresses: List[bytes] = []
+        self.blocks_mined = 0
+        self.transactions_created = 0
+        self.workload: Optional[asyncio.Task] = None
+
+    async def run(self) -> None:
+        self.reports.put(("port", self.index, await self.server.start()))
+        loop = asyncio.get_running_loop()
+        while True:
+            command, argument = await loop.run_in_executor(None, self.commands.recv)
+            if command == "connect":
+                for port in argument:
+                    await self.server.connect_to("127.0.0.1", port)
+                self.commands.send(self.server.node.get_address())
+            elif command == "start":
+                self.addresses = argument["addresses"]
+                self.workload = asyncio.ensure_future(self._run_workload(**argument["workload"]))
+                self.commands.send(None)
+            elif command == "stop":
+                if self.workload is not None:
+                    self.workload.cancel()
+                    await asyncio.gather(self.workload, return_exceptions=True)
+                self.commands.send(None)
+            elif command == "stats":
+                self.commands.send(await self.server.call(self._get_stats))
+            elif command == "shutdown":
+                await self.server.close()
+                self.commands.send(None)
+                return
+
+    async def _run_workload(self, seed: int, mine_interval: float, pay_interval: float) -> None:
+        rng = random.Random(seed)
+        began = time.monotonic()
+        for at, kind in workload_events(rng, mine_interval, pay_interval):
+            target = rng.choice(self.addresses)
+            await asyncio.sleep(max(0.0, began + at - time.monotonic()))
+            if kind == MINE:
+                if await self.server.mine() is not None:
+                    self.blocks_mined += 1
+            elif await self.server.call(self.server.node.create_transaction, target) is not None:
+                self.transactions_created += 1
+
+    def _get_stats(self) -> Dict[str, Any]:
+        node = self.server.node
+        return {
+            "index": self.index,
+            "height": len(node.blockchain),
+            "tip": node.get_latest_hash().hex(),
+            "blocks_mined": self.blocks_mined,
+            "transactions_created": self.transactions_created,
+            "confirmed_transactions": sum(1 for block in node.blockchain for tx in block.get_transactions()
+                                          if tx.input is not None),
+            "mempool": len(node.mem_pool),
+            "balance": node.get_balance(),
+            "peers": len(self.server.peers),
+            "relay_stats": dict(node.relay_stats),
+            "validation_stats": dict(node.validation_stats),
+            "frames_sent": sum(self.server.frames_sent.values()),
+            "frames_received": sum(self.server.frames_received.values()),
+            "errors": [repr(error) for error in self.server.errors],
+        }
+
+
+def run_node_process(index: int, commands: Connection, reports: 'multiprocessing.Queue[Any]') -> None:
+    """The main function of a node process."""
+    # the cluster decides when to stop, so an interrupt only reaches the runner
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(NodeProcess(index, commands, reports).run())
+
+
+class Cluster:
+    """
+    A run of nodes in separate processes. The network mines a block every block_interval seconds on average and
+    creates tx_rate payments per second (each node does its share, at random times drawn from its own seed),
+    for duration seconds.
+    """
+
+    def __init__(self, nodes: int = 8, topology: str = "random", degree: int = 4, block_interval: float = 1.0,
+                 tx_rate: float = 10.0, duration: float = 30.0, seed: int = 0,
+                 consistency_timeout: float = DEFAULT_CONSISTENCY_TIMEOUT) -> None:
+        self.config: Dict[str, Any] = {"nodes": nodes, "topology": topology, "degree": degree,
+                                       "block_interval": block_interval, "tx_rate": tx_rate,
+                                       "duration": duration, "seed": seed}
+        self.consistency_timeout = consistency_timeout
+        self.links = make_topology(topology, nodes, degree, random.Random(seed))
+        self.reports: 'multiprocessing.Queue[Any]' = multiprocessing.Queue()
+        self.pipes: List[Connection] = []
+        self.processes: List[multiprocessing.Process] = []
+        self.tips: Dict[int, bytes] = {}
+        self.stopping = False
+
+    def stop(self) -> None:
+        """Ends the workload early (the run still waits for consistency, collects statistics and shuts down)."""
+        self.stopping = True
+
+    def _command(self, index: int, command: str, argument: Any = None) -> Any:
+        self.pipes[index].send((command, argument))
+        return self.pipes[index].recv()
+
+    def _drain_reports(self, timeout: float) -> None:
+        """Records the tip changes reported by the nodes, waiting up to timeout seconds for the first one."""
+        try:
+            report = self.reports.get(timeout=timeout)
+            while True:
+                if report[0] == "tip":
+                    self.tips[report[1]] = report[2]
+                report = self.reports.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _is_consistent(self) -> bool:
+        return len(self.tips) == len(self.processes) and len(set(self.tips.values())) == 1
+
+    def run(self) -> Dict[str, Any]:
+        """Runs the cluster and returns the report (see get_report)."""
+        began = time.perf_counter()
+        count = self.config["nodes"]
+        for index in range(count):
+            parent_end, child_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_node_process, args=(index, child_end, self.reports),
+                                              daemon=True)
+            process.start()
+            self.pipes.append(parent_end)
+            self.processes.append(process)
+        try:
+            ports: Dict[int, int] = {}
+            while len(ports) < count:
+                kind, index, value = self.reports.get()
+                if kind == "port":
+                    ports[index] = value
+            addresses = [self._command(index, "connect", [ports[b] for a, b in self.links if a == index])
+                         for index in range(count)]
+
+            seeds = random.Random(self.config["seed"])
+            for index in range(count):
+                self._command(index, "start", {"addresses": addresses, "workload": {
+                    "seed": seeds.getrandbits(64),
+                    "mine_interval": self.config["block_interval"] * count,
+                    "pay_interval": count / self.config["tx_rate"] if self.config["tx_rate"] > 0 else 0}})
+            workload_began = time.perf_counter()
+            while not self.stopping and time.perf_counter() - workload_began < self.config["duration"]:
+                self._drain_reports(0.1)
+            for index in range(count):
+                self._command(index, "stop")
+            workload_seconds = time.perf_counter() - workload_began
+
+            stopped = time.perf_counter()
+            time_to_consistency: Optional[float] = None
+            while time.perf_counter() - stopped < self.consistency_timeout:
+                self._drain_reports(0.01)
+                if self._is_consistent():
+                    time_to_consistency = time.perf_counter() - stopped
+                    break
+            stats = [self._command(index, "stats") for index in range(count)]
+        finally:
+            self._shutdown()
+        return self.get_report(stats, workload_seconds, time_to_consistency, time.perf_counter() - began)
+
+    def _shutdown(self) -> None:
+        """Asks every node process to close its connections and exit, and terminates the ones that don't."""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                try:
+                    self._command(index, "shutdown")
+                except (EOFError, OSError):
+                    pass
+        for process in self.processes:
+            process.join(SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+
+    def get_report(self, stats: List[Dict[str, Any]], workload_seconds: float,
+                   time_to_consistency: Optional[float], wall_seconds: float) -> Dict[str, Any]:
+        """
+        Returns a JSON serializable report of the run: the statistics of every node, and in aggregate the blocks
+        mined and on the final chain (of the first node), the transactions created and confirmed (per second of
+        workload), and the seconds from the end of the workload until all nodes had the same tip (None if they
+        didn't agree within the timeout).
+        """
+        final = stats[0]
+        blocks_mined = sum(node["blocks_mined"] for node in stats)
+        return {
+            "config": self.config,
+            "links": len(self.links),
+            "nodes": stats,
+            "blocks": {"mined": blocks_mined, "final_height": final["height"],
+                       "stale": blocks_mined - final["height"]},
+            "transactions": {"created": sum(node["transactions_created"] for node in stats),
+                             "confirmed": final["confirmed_transactions"],
+                             "confirmed_per_second": final["confirmed_transactions"] / workload_seconds},
+            "consistent": len({node["tip"] for node in stats}) == 1,
+            "time_to_consistency": time_to_consistency,
+            "workload_seconds": workload_seconds,
+            "wall_seconds": wall_seconds,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=8)
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="random")
+    parser.add_argument("--degree", type=int, default=4)
+    parser.add_argument("--block-interval", type=float, default=1.0, help="mean seconds between blocks")
+    parser.add_argument("--tx-rate", type=float, default=10.0, help="mean payments per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of workload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    cluster = Cluster(nodes=args.nodes, topology=args.topology, degree=args.degree,
+                      block_interval=args.block_interval, tx_rate=args.tx_rate, duration=args.duration,
+                      seed=args.seed)
+    signal.signal(signal.SIGINT, lambda *_: cluster.stop())
+    signal.signal(signal.SIGTERM, lambda *_: cluster.stop())
+    report = cluster.run()
+
+    print(f"{args.nodes} processes, {args.topology} topology ({report['links']} links), "
+          f"{report['workload_seconds']:.1f}s of workload")
+    print(f"blocks: {report['blocks']['mined']} mined, {report['blocks']['final_height']} on the final chain")
+    print(f"transactions: {report['transactions']['created']} created, {report['transactions']['confirmed']} "
+          f"confirmed ({report['transactions']['confirmed_per_second']:.1f}/s)")
+    consistency = report["time_to_consistency"]
+    print(f"time to consistency: {f'{consistency * 1e3:.0f}ms' if consistency is not None else 'not reached'}")
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compact block relay: instead of announcing a new block by its hash (after which the peer downloads the full block),
+a node sends the block header, the transactions the peer can't have (the coinbase) and a short id for every other
+transaction. The peer rebuilds the block from its own mempool and only requests the transactions it is missing.
+"""
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .block import Block, BlockHeader, NONCE_SIZE
+from .transaction import Transaction
+from .utils import BlockHash, TxID
+
+# The number of bytes of a short transaction id.
+SHORT_ID_LENGTH = 6
+
+# Wire sizes (in bytes) of the fields of the objects nodes exchange, used to compare bandwidth.
+HASH_SIZE = 32
+SIGNATURE_SIZE = 64
+HEADER_SIZE = 2 * HASH_SIZE
+TRANSACTION_INDEX_SIZE = 2
+
+
+def get_short_id(txid: TxID, block_hash: BlockHash) -> bytes:
+    """Returns the short id of a transaction within the given block. The ids are salted with the block hash,
+    so a collision that was crafted against one block does not carry over to other blocks."""
+    return hashlib.sha256(block_hash + txid).digest()[:SHORT_ID_LENGTH]
+
+
+def get_transaction_size(transaction: Transaction) -> int:
+    """The number of bytes a transaction takes on the wire."""
+    input_size = HASH_SIZE if transaction.input is not None else 0
+    return input_size + len(transaction.output) + len(transaction.signature)
+
+
+def get_block_size(block: Block) -> int:
+    """The number of bytes a full block takes on the wire."""
+    nonce_size = NONCE_SIZE if block.get_nonce() is not None else 0
+    return HASH_SIZE + nonce_size + sum(get_transaction_size(tx) for tx in block.get_transactions())
+
+
+class CompactBlock:
+    """A block announcement made of the block header, some prefilled transactions (by their index in the block)
+    and the short ids of the rest of the transactions, in block order."""
+
+    def __init__(self, header: BlockHeader, prefilled: List[Tuple[int, Transaction]], short_ids: List[bytes]) -> None:
+        self.header = header
+        self.prefilled = prefilled
+        self.short_ids = short_ids
+
+    @staticmethod
+    def from_block(block: Block) -> 'CompactBlock':
+        """Builds the compact form of a block. Coinbase transactions are prefilled, since no mempool has them."""
+        block_hash = block.get_block_hash()
+        prefilled: List[Tuple[int, Transaction]] = []
+        short_ids: List[bytes] = []
+        for index, tx in enumerate(block.get_transactions()):
+            if tx.input is None:
+                prefilled.append((index, tx))
+            else:
+                short_ids.append(get_short_id(tx.get_txid(), block_hash))
+        return CompactBlock(block.get_header(), prefilled, short_ids)
+
+    def get_header(self) -> BlockHeader:
+        return self.header
+
+    def get_transaction_count(self) -> int:
+        return len(self.prefilled) + len(self.short_ids)
+
+    def get_size(self) -> int:
+        """The number of bytes this compact block takes on the wire."""
+        nonce_size = NONCE_SIZE if self.header.get_nonce() is not None else 0
+        return (HEADER_SIZE + nonce_size + len(self.short_ids) * SHORT_ID_LENGTH +
+                sum(TRANSACTION_INDEX_SIZE + get_transaction_size(tx) for _, tx in self.prefilled))
+
+    def reconstruct(self, mempool: Iterable[Transaction]) -> Tuple[List[Optional[Transaction]], List[int]]:
+        """
+        Fills in the transactions of the block from the given mempool.
+        Returns the transactions in block order (None where a transaction was not found) and the indexes of the
+        missing transactions. A short id that matches more than one mempool transaction counts as missing.
+        """
+        indexes = [index for index, _ in self.prefilled]
+        if len(set(indexes)) != len(indexes) or any(not 0 <= i < self.get_transaction_count() for i in indexes):
+            raise ValueError("Malformed compact block")
+
+        block_hash = self.header.get_block_hash()
+        candidates: Dict[bytes, Optional[Transaction]] = {}
+        for tx in mempool:
+            short_id = get_short_id(tx.get_txid(), block_hash)
+            candidates[short_id] = None if short_id in candidates else tx
+
+        transactions: List[Optional[Transaction]] = [None] * self.get_transaction_count()
+        for index, tx in self.prefilled:
+            transactions[index] = tx
+        short_ids = iter(self.short_ids)
+        missing: List[int] = []
+        for index in range(len(transactions)):
+            if transactions[index] is None:
+                transactions[index] = candidates.get(next(short_ids))
+                if transactions[index] is None:
+                    missing.append(index)
+        return transactions, missing
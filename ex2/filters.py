@@ -0,0 +1,155 @@
+"""
+Compact block filters (in the spirit of BIP 158): for every block, a Golomb-coded set of the addresses it pays
+and the coins (txids) it spends. A light wallet (see light_wallet.py) downloads the filters of a chain, and only
+downloads the blocks whose filter matches its address or one of its coins. A filter may match a block that is
+not relevant (about once in FILTER_M items), but never misses one that is.
+Nodes keep the filters of their chain in a FilterIndex (Node.enable_block_filters) and serve them with
+Node.get_filters.
+"""
+import hashlib
+from typing import Dict, Iterable, List, Set, Tuple
+
+from .block import Block
+from .utils import BlockHash
+
+# The number of low bits of every delta written as is (the Golomb-Rice parameter).
+FILTER_P = 19
+# Items are hashed to [0, n * FILTER_M), so an unrelated item matches with probability about 1 / FILTER_M.
+FILTER_M = 784931
+# The maximal number of filters returned from a single get_filters() call.
+MAX_FILTERS_PER_REQUEST = 1000
+
+
+def get_filter_items(block: Block) -> Set[bytes]:
+    """The items a block filter commits to: the output addresses of the block's transactions and the coins
+    they spend."""
+    items: Set[bytes] = set()
+    for tx in block.get_transactions():
+        items.add(tx.output)
+        if tx.input is not None:
+            items.add(tx.input)
+    return items
+
+
+def _hash_to_range(item: bytes, key: bytes, limit: int) -> int:
+    """Maps an item to [0, limit), with a hash keyed by the block (so colliding items differ between blocks)."""
+    digest = int.from_bytes(hashlib.blake2b(item, digest_size=8, key=key).digest(), "big")
+    return (digest * limit) >> 64
+
+
+def _get_key(block_hash: BlockHash) -> bytes:
+    return block_hash[:16]
+
+
+def _write_varint(parts: List[bytes], value: int) -> None:
+    while value >= 0x80:
+        parts.append(bytes([value & 0x7F | 0x80]))
+        value >>= 7
+    parts.append(bytes([value]))
+
+
+def _read_varint(data: bytes) -> Tuple[int, int]:
+    value, shift, offset = 0, 0, 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("Truncated filter")
+        byte = data[offset]
+        value |= (byte & 0x7F) << shift
+        offset += 1
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def build_filter(block_hash: BlockHash, items: Iterable[bytes]) -> bytes:
+    """
+    Encodes the items as the number of items, followed by the sorted hashes of the items as deltas, each one
+    Golomb-Rice coded: the delta divided by 2 ** FILTER_P in unary, then its remainder in FILTER_P bits.
+    """
+    unique = set(items)
+    key = _get_key(block_hash)
+    values = sorted(_hash_to_range(item, key, len(unique) * FILTER_M) for item in unique)
+    parts: List[bytes] = []
+    _write_varint(parts, len(values))
+    bits, bit_count, previous = 0, 0, 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        quotient = delta >> FILTER_P
+        # quotient ones and a zero, then the remainder
+        bits = (bits << (quotient + 1)) | (((1 << quotient) - 1) << 1)
+        bits = (bits << FILTER_P) | (delta & ((1 << FILTER_P) - 1))
+        bit_count += quotient + 1 + FILTER_P
+    padding = -bit_count % 8
+    parts.append((bits << padding).to_bytes((bit_count + padding) // 8, "big"))
+    return b"".join(parts)
+
+
+def build_block_filter(block: Block) -> bytes:
+    """Builds the filter of a block (see get_filter_items)."""
+    return build_filter(block.get_block_hash(), get_filter_items(block))
+
+
+def decode_filter(block_hash: BlockHash, data: bytes) -> Tuple[int, Set[int]]:
+    """Returns the number of items in the filter and their hashes. Raises ValueError if the filter is malformed."""
+    count, offset = _read_varint(data)
+    bits = int.from_bytes(data[offset:], "big")
+    position = (len(data) - offset) * 8
+    values: Set[int] = set()
+    value = 0
+    for _ in range(count):
+        quotient = 0
+        while True:
+            position -= 1
+            if position < 0:
+                raise ValueError("Truncated filter")
+            if not (bits >> position) & 1:
+                break
+            quotient += 1
+        position -= FILTER_P
+        if position < 0:
+            raise ValueError("Truncated filter")
+        value += (quotient << FILTER_P) | ((bits >> position) & ((1 << FILTER_P) - 1))
+        values.add(value)
+    return count, values
+
+
+def filter_matches_any(block_hash: BlockHash, data: bytes, items: Iterable[bytes]) -> bool:
+    """Checks whether any of the items may be in the block the filter was built for."""
+    count, values = decode_filter(block_hash, data)
+    if count == 0:
+        return False
+    key = _get_key(block_hash)
+    return any(_hash_to_range(item, key, count * FILTER_M) in values for item in items)
+
+
+class FilterIndex:
+    """The filters of the blocks of a node's chain, by block hash."""
+
+    def __init__(self) -> None:
+        self.filters: Dict[BlockHash, bytes] = {}
+        self.size_bytes = 0
+
+    def add(self, block: Block) -> bytes:
+        """Builds and stores the filter of the block, and returns it."""
+        block_hash = block.get_block_hash()
+        block_filter = self.filters.get(block_hash)
+        if block_filter is None:
+            block_filter = self.filters[block_hash] = build_block_filter(block)
+            self.size_bytes += len(block_filter)
+        return block_filter
+
+    def get(self, block_hash: BlockHash) -> bytes:
+        """Returns the stored filter of the block, or raises KeyError."""
+        return self.filters[block_hash]
+
+    def remove(self, block_hash: BlockHash) -> None:
+        block_filter = self.filters.pop(block_hash, None)
+        if block_filter is not None:
+            self.size_bytes -= len(block_filter)
+
+    def __len__(self) -> int:
+        return len(self.filters)
+
+    def __contains__(self, block_hash: object) -> bool:
+        return block_hash in self.filters
@@ -0,0 +1,84 @@
+"""
+Side-chain retention: blocks of competing branches that are not (or no longer) on a node's chain, kept with the
+length of the chain they end, so that when their branch overtakes ours the node connects them without fetching
+them again. Blocks that were on our chain before a reorg disconnected them are marked as validated, and their
+signatures are not verified again when they are reconnected (whether their coins exist is still checked).
+"""
+from typing import Any, Dict, Optional, Set
+
+from .block import Block
+from .utils import BlockHash
+
+# The default number of blocks below the tip of our chain down to which side-chain blocks are kept.
+DEFAULT_MAX_FORK_DEPTH = 100
+
+
+class SideChains:
+    """
+    The side-chain blocks of a node, by hash. A block is kept while the chain it ends is at most max_depth blocks
+    shorter than ours (a max_depth of 0 keeps nothing). The peer that served each block is kept with it, so that it is
+    the one penalised if the block turns out invalid.
+    """
+
+    def __init__(self, max_depth: int = DEFAULT_MAX_FORK_DEPTH) -> None:
+        self.max_depth = max_depth
+        self.blocks: Dict[BlockHash, Block] = {}
+        # the length of the chain that ends with each block (its height + 1)
+        self.lengths: Dict[BlockHash, int] = {}
+        self.validated: Set[BlockHash] = set()
+        self.sources: Dict[BlockHash, Any] = {}
+        self.stats: Dict[str, int] = {"retained": 0, "reused": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __contains__(self, block_hash: object) -> bool:
+        return block_hash in self.blocks
+
+    def add(self, block: Block, length: int, validated: bool, source: Any = None) -> None:
+        """Keeps a block served by the given peer (None if unknown, e.g. for a block we disconnected)."""
+        if self.max_depth <= 0:
+            return
+        block_hash = block.get_block_hash()
+        if block_hash not in self.blocks:
+            self.stats["retained"] += 1
+        self.blocks[block_hash] = block
+        self.lengths[block_hash] = length
+        self.sources[block_hash] = source
+        if validated:
+            self.validated.add(block_hash)
+
+    def get(self, block_hash: BlockHash) -> Optional[Block]:
+        return self.blocks.get(block_hash)
+
+    def is_validated(self, block_hash: BlockHash) -> bool:
+        return block_hash in self.validated
+
+    def get_source(self, block_hash: BlockHash) -> Any:
+        """Returns the peer that served the block (None if unknown or if the block is not kept)."""
+        return self.sources.get(block_hash)
+
+    def take(self, block_hash: BlockHash) -> Optional[Block]:
+        """Removes a block that joins our chain, and returns it (or None if it wasn't kept)."""
+        block = self.remove(block_hash)
+        if block is not None:
+            self.stats["reused"] += 1
+        return block
+
+    def remove(self, block_hash: BlockHash) -> Optional[Block]:
+        self.lengths.pop(block_hash, None)
+        self.validated.discard(block_hash)
+        self.sources.pop(block_hash, None)
+        return self.blocks.pop(block_hash, None)
+
+    def trim(self, chain_length: int) -> None:
+        """Drops the blocks that are more than max_depth blocks below the tip of a chain of the given length."""
+        for block_hash in [block_hash for block_hash, length in self.lengths.items()
+                           if length <= chain_length - self.max_depth]:
+            self.remove(block_hash)
+            self.stats["evicted"] += 1
+
+    def get_tips(self) -> Dict[BlockHash, int]:
+        """The blocks that no kept block builds on, with the length of the chain each one ends."""
+        parents = {block.get_prev_block_hash() for block in self.blocks.values()}
+        return {block_hash: length for block_hash, length in self.lengths.items() if block_hash not in parents}
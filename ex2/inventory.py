@@ -0,0 +1,32 @@
+from typing import Dict
+
+# The default number of block hashes and txids remembered per peer before the oldest are forgotten.
+DEFAULT_MAX_KNOWN_INVENTORY = 50000
+
+
+class KnownInventory:
+    """
+    The block hashes and txids a single peer is known to have, because it announced them to us
+    or because we announced them to it. Used to avoid announcing an item to a peer twice.
+    The set is bounded: when it is full, the item that was added first is forgotten
+    (which at worst causes one redundant announcement).
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_KNOWN_INVENTORY) -> None:
+        self.max_size = max_size
+        # insertion ordered, so the first key is the oldest item
+        self.items: Dict[bytes, None] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item: bytes) -> bool:
+        return item in self.items
+
+    def add(self, item: bytes) -> None:
+        """Remembers that the peer has the given item."""
+        if item in self.items:
+            return
+        if len(self.items) >= self.max_size:
+            del self.items[next(iter(self.items))]
+        self.items[item] = None
@@ -0,0 +1,132 @@
+"""
+A light wallet: follows the chain of a full node through its headers and compact block filters (see filters.py),
+and downloads only the blocks whose filter matches its address or one of its coins, to keep track of its coins.
+It trusts the node to serve the filters of its chain honestly (the blocks it downloads are checked against
+their headers).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from .block import Block, BlockHeader
+from .filters import MAX_FILTERS_PER_REQUEST, filter_matches_any
+from .node import LOCATOR_DENSE_BLOCKS, MAX_HEADERS_PER_REQUEST
+from .transaction import Transaction
+from .utils import BlockHash, GENESIS_BLOCK_PREV, PublicKey, TxID
+
+
+class LightWallet:
+    """The coins of an address, as far as the chain of the node the wallet last synced with goes."""
+
+    def __init__(self, address: PublicKey) -> None:
+        self.address = address
+        self.headers: List[BlockHeader] = []
+        self.heights: Dict[BlockHash, int] = {}
+        self.coins: Dict[TxID, Transaction] = {}
+        # the coins each downloaded block created and spent, by height, to undo it in a reorg
+        self.changes: Dict[int, Tuple[List[Transaction], List[Transaction]]] = {}
+        self.stats: Dict[str, int] = {"headers": 0, "filters": 0, "filter_bytes": 0, "blocks": 0,
+                                      "false_positives": 0}
+
+    def get_balance(self) -> int:
+        return len(self.coins)
+
+    def get_latest_hash(self) -> BlockHash:
+        return self.headers[-1].get_block_hash() if self.headers else GENESIS_BLOCK_PREV
+
+    def _get_locator(self) -> List[BlockHash]:
+        """Hashes of our headers from the tip backwards, in growing steps (like Node._get_block_locator)."""
+        locator: List[BlockHash] = []
+        step = 1
+        height = len(self.headers) - 1
+        while height >= 0:
+            locator.append(self.headers[height].get_block_hash())
+            if len(locator) >= LOCATOR_DENSE_BLOCKS:
+                step *= 2
+            height -= step
+        locator.append(GENESIS_BLOCK_PREV)
+        return locator
+
+    def sync(self, peer: Any) -> None:
+        """
+        Catches up with the chain of the peer: downloads the new headers, rewinds the blocks the peer's chain
+        no longer has, and checks the filters of the new blocks. Raises ValueError if the peer doesn't serve
+        filters or serves data that doesn't fit together.
+        """
+        if getattr(peer, "SUPPORTS_BLOCK_FILTERS", False) is not True:
+            raise ValueError("The peer doesn't serve block filters")
+        fork_point, new_headers = self._download_headers(peer)
+        self._rewind(fork_point)
+        for header in new_headers:
+            self.heights[header.get_block_hash()] = len(self.headers)
+            self.headers.append(header)
+        for start in range(fork_point + 1, len(self.headers), MAX_FILTERS_PER_REQUEST):
+            stop = min(start + MAX_FILTERS_PER_REQUEST, len(self.headers)) - 1
+            filters = peer.get_filters(start, self.headers[stop].get_block_hash())
+            if len(filters) != stop - start + 1:
+                raise ValueError("The peer served the wrong number of filters")
+            for height, block_filter in enumerate(filters, start):
+                self.stats["filters"] += 1
+                self.stats["filter_bytes"] += len(block_filter)
+                block_hash = self.headers[height].get_block_hash()
+                # the coins a block created are only spent by later blocks, so blocks are checked in order
+                if filter_matches_any(block_hash, block_filter, [self.address, *self.coins]):
+                    self._process_block(height, peer)
+
+    def _download_headers(self, peer: Any) -> Tuple[int, List[BlockHeader]]:
+        """Returns the height of the last of our headers the peer's chain shares, and the peer's headers after it."""
+        headers: List[BlockHeader] = []
+        fork_point: Optional[int] = None
+        locator = self._get_locator()
+        while True:
+            batch = peer.get_headers(locator)
+            self.stats["headers"] += len(batch)
+            for header in batch:
+                if fork_point is None:
+                    prev_hash = header.get_prev_block_hash()
+                    fork_point = -1 if prev_hash == GENESIS_BLOCK_PREV else self.heights.get(prev_hash)
+                    if fork_point is None:
+                        raise ValueError("The headers don't connect to our chain")
+                elif header.get_prev_block_hash() != headers[-1].get_block_hash():
+                    raise ValueError("The headers don't link to each other")
+                headers.append(header)
+            if len(batch) < MAX_HEADERS_PER_REQUEST:
+                break
+            locator = [batch[-1].get_block_hash()]
+        if fork_point is None:
+            # no new headers: the peer has our chain (or is behind on it)
+            fork_point = len(self.headers) - 1
+        return fork_point, headers
+
+    def _process_block(self, height: int, peer: Any) -> None:
+        header = self.headers[height]
+        [block] = peer.get_blocks([header.get_block_hash()])
+        if (block.get_block_hash() != header.get_block_hash() or
+                block.get_prev_block_hash() != header.get_prev_block_hash()):
+            raise ValueError("The peer served a block that doesn't match its header")
+        self.stats["blocks"] += 1
+        created, spent = self._apply(block)
+        if created or spent:
+            self.changes[height] = (created, spent)
+        else:
+            self.stats["false_positives"] += 1
+
+    def _apply(self, block: Block) -> Tuple[List[Transaction], List[Transaction]]:
+        created: List[Transaction] = []
+        spent: List[Transaction] = []
+        for tx in block.get_transactions():
+            if tx.input is not None and tx.input in self.coins:
+                spent.append(self.coins.pop(tx.input))
+            if tx.output == self.address:
+                self.coins[tx.get_txid()] = tx
+                created.append(tx)
+        return created, spent
+
+    def _rewind(self, fork_point: int) -> None:
+        """Undoes the blocks above the fork point, from the tip down."""
+        for height in range(len(self.headers) - 1, fork_point, -1):
+            created, spent = self.changes.pop(height, ([], []))
+            for coin in spent:
+                self.coins[coin.get_txid()] = coin
+            for tx in created:
+                self.coins.pop(tx.get_txid(), None)
+            del self.heights[self.headers[height].get_block_hash()]
+        del self.headers[fork_point + 1:]
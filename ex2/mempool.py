@@ -0,0 +1,117 @@
+from .utils import TxID
+from .block import Block
+from .transaction import Transaction
+from .compact import get_transaction_size
+from typing import Callable, Dict, Iterator, List, Optional
+
+# The default cap on the estimated memory used by a mempool (in bytes).
+DEFAULT_MAX_MEMPOOL_BYTES = 300 * 1000 * 1000
+# Estimated memory a mempool entry takes beyond the transaction's wire size (the Python objects and index entries).
+MEMPOOL_ENTRY_OVERHEAD = 600
+
+
+def get_entry_size(transaction: Transaction) -> int:
+    """Estimated memory (in bytes) a transaction takes in the mempool."""
+    return get_transaction_size(transaction) + MEMPOOL_ENTRY_OVERHEAD
+
+
+class Mempool:
+    """
+    The transactions waiting to enter a block, indexed by txid and by the coin (txid of the output) they spend.
+    Transactions are kept in arrival order. The estimated memory use is capped: when adding a transaction
+    goes over the cap, the oldest transactions are evicted (there are no fees to prefer one transaction over another).
+    Callers are responsible for validating transactions before adding them.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_MEMPOOL_BYTES) -> None:
+        self.max_bytes = max_bytes
+        # insertion ordered, so the first key is the oldest transaction
+        self.transactions: Dict[TxID, Transaction] = {}
+        self.spenders: Dict[TxID, TxID] = {}
+        self.size_bytes = 0
+        self.evictions = 0
+        # called with every transaction added (True) or removed (False), including evictions
+        self.on_change: Optional[Callable[[Transaction, bool], None]] = None
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+    def __iter__(self) -> Iterator[Transaction]:
+        return iter(self.transactions.values())
+
+    def __contains__(self, transaction: Transaction) -> bool:
+        return transaction.get_txid() in self.transactions
+
+    def get(self, txid: TxID) -> Optional[Transaction]:
+        """Returns the transaction with the given txid, or None if it is not in the mempool."""
+        return self.transactions.get(txid)
+
+    def get_spender(self, spent_txid: TxID) -> Optional[Transaction]:
+        """Returns the transaction that spends the given coin, or None if no transaction in the mempool does."""
+        txid = self.spenders.get(spent_txid)
+        return self.transactions[txid] if txid is not None else None
+
+    def get_transactions(self, limit: Optional[int] = None) -> List[Transaction]:
+        """Returns the transactions in arrival order (only the first limit ones, if given)."""
+        if limit is None:
+            return list(self.transactions.values())
+        result: List[Transaction] = []
+        for tx in self.transactions.values():
+            if len(result) >= limit:
+                break
+            result.append(tx)
+        return result
+
+    def add(self, transaction: Transaction) -> bool:
+        """
+        Adds a transaction, evicting the oldest transactions if the mempool goes over its memory cap.
+        Returns False (and adds nothing) if another transaction in the mempool spends the same coin,
+        or if the transaction alone doesn't fit.
+        """
+        txid = transaction.get_txid()
+        if txid in self.transactions:
+            return True
+        if transaction.input is not None and transaction.input in self.spenders:
+            return False
+        entry_size = get_entry_size(transaction)
+        if entry_size > self.max_bytes:
+            return False
+        while self.size_bytes + entry_size > self.max_bytes:
+            self.remove(next(iter(self.transactions)))
+            self.evictions += 1
+
+        self.transactions[txid] = transaction
+        if transaction.input is not None:
+            self.spenders[transaction.input] = txid
+        self.size_bytes += entry_size
+        if self.on_change is not None:
+            self.on_change(transaction, True)
+        return True
+
+    def remove(self, txid: TxID) -> Optional[Transaction]:
+        """Removes the transaction with the given txid and returns it (or None if it wasn't there)."""
+        transaction = self.transactions.pop(txid, None)
+        if transaction is not None:
+            if transaction.input is not None:
+                del self.spenders[transaction.input]
+            self.size_bytes -= get_entry_size(transaction)
+            if self.on_change is not None:
+                self.on_change(transaction, False)
+        return transaction
+
+    def remove_for_block(self, block: Block) -> None:
+        """Removes the transactions of a newly connected block, and the transactions that spend the same coins."""
+        for tx in block.get_transactions():
+            self.remove(tx.get_txid())
+            if tx.input is not None:
+                conflict = self.spenders.get(tx.input)
+                if conflict is not None:
+                    self.remove(conflict)
+
+    def clear(self) -> None:
+        if self.on_change is not None:
+            for transaction in self.transactions.values():
+                self.on_change(transaction, False)
+        self.transactions = {}
+        self.spenders = {}
+        self.size_bytes = 0
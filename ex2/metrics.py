@@ -0,0 +1,242 @@
+"""
+Metrics: counters, gauges and histograms kept in a MetricsRegistry, rendered in the Prometheus text format and
+optionally served over HTTP (MetricsServer). NodeMetrics defines the metrics of a node; a node only collects them
+after Node.enable_metrics(), so a node without metrics pays for nothing but a few `is None` checks.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from .node import Node
+
+# Upper bounds (in seconds) of the histogram buckets of the timing metrics.
+DEFAULT_TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                        2.5, 5.0, 10.0)
+# Upper bounds of the histogram buckets of the reorg depth (in blocks).
+REORG_DEPTH_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 1000)
+# The content type of the Prometheus text format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A value that only goes up. If a function is given, the value is read from it instead."""
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, description: str, function: Optional[Callable[[], float]] = None) -> None:
+        self.name = name
+        self.description = description
+        self.function = function
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        if amount < 0:
+            raise ValueError("A counter can't decrease")
+        self.value += amount
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.get())}"]
+
+
+class Gauge(Counter):
+    """A value that goes up and down. If a function is given, the value is read from it instead."""
+
+    TYPE = "gauge"
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    """Counts observed values in cumulative buckets (by upper bound), and keeps their count and sum."""
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_TIME_BUCKETS) -> None:
+        if list(buckets) != sorted(buckets) or not buckets:
+            raise ValueError("Histogram buckets must be given in increasing order")
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # the number of observations in each bucket alone (made cumulative when rendering)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum: float = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def render(self) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+Metric = Any  # Counter, Gauge or Histogram
+
+
+class MetricsRegistry:
+    """The metrics of a process (or of one node), by name."""
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Any:
+        if metric.name in self.metrics:
+            raise ValueError(f"A metric named {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, function: Optional[Callable[[], float]] = None) -> Counter:
+        return self._register(Counter(name, description, function))
+
+    def gauge(self, name: str, description: str, function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, description, function))
+
+    def histogram(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_TIME_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, buckets))
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+class NodeMetrics:
+    """
+    The metrics of a node (see Node.enable_metrics). The time spent in notify_of_block (and notify_of_compact_block,
+    which receives most blocks), validate_block and update_mempool_and_utxo is measured by wrapping these methods
+    of the node, so subclasses that override them are measured too. Peers called directly (without a scheduler) run
+    inside the notify_of_block of the node that announced to them, so its time includes theirs.
+    """
+
+    def __init__(self, node: 'Node', registry: MetricsRegistry) -> None:
+        self.registry = registry
+        self.blocks_received = registry.counter("ex2_blocks_received_total", "Blocks downloaded from peers")
+        self.blocks_validated = registry.counter("ex2_blocks_validated_total", "Blocks that passed validation")
+        self.blocks_rejected = registry.counter("ex2_blocks_rejected_total", "Blocks that failed validation")
+        registry.counter("ex2_signatures_verified_total", "Transaction signatures verified in blocks",
+                         lambda: node.validation_stats["signatures_verified"])
+        self.reorgs = registry.counter("ex2_reorgs_total", "Chain switches that disconnected blocks")
+        self.reorg_depth = registry.histogram("ex2_reorg_depth_blocks", "Blocks disconnected by a chain switch",
+                                              REORG_DEPTH_BUCKETS)
+        registry.gauge("ex2_chain_height", "Blocks on the current chain", lambda: len(node.blockchain))
+        registry.gauge("ex2_mempool_transactions", "Transactions in the mempool", lambda: len(node.mem_pool))
+        registry.gauge("ex2_utxo_count", "Coins in the UTXO set", lambda: len(node.utxos))
+        self.notify_of_block_seconds = registry.histogram("ex2_notify_of_block_seconds",
+                                                          "Time spent in notify_of_block or notify_of_compact_block")
+        self.validate_block_seconds = registry.histogram("ex2_validate_block_seconds", "Time spent in validate_block")
+        self.update_mempool_and_utxo_seconds = registry.histogram("ex2_update_mempool_and_utxo_seconds",
+                                                                  "Time spent in update_mempool_and_utxo")
+        self._receiving_block = False
+        self._wrap_block_receipt(node, "notify_of_block")
+        self._wrap_block_receipt(node, "notify_of_compact_block")
+        self._wrap(node, "update_mempool_and_utxo", self.update_mempool_and_utxo_seconds)
+        validate_block = node.validate_block
+
+        def measured_validate_block(block: Any) -> bool:
+            began = time.perf_counter()
+            try:
+                valid = validate_block(block)
+            finally:
+                self.validate_block_seconds.observe(time.perf_counter() - began)
+            (self.blocks_validated if valid else self.blocks_rejected).inc()
+            return valid
+        node.validate_block = measured_validate_block  # type: ignore
+
+    @staticmethod
+    def _wrap(node: 'Node', method_name: str, histogram: Histogram) -> None:
+        method = getattr(node, method_name)
+
+        def measured(*args: Any) -> Any:
+            began = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                histogram.observe(time.perf_counter() - began)
+        setattr(node, method_name, measured)
+
+    def _wrap_block_receipt(self, node: 'Node', method_name: str) -> None:
+        """
+        Measures a method that receives a block announcement in notify_of_block_seconds. A compact block that can't be
+        rebuilt is passed on to notify_of_block, so only the outermost of such nested calls is measured.
+        """
+        method = getattr(node, method_name)
+
+        def measured(*args: Any) -> Any:
+            if self._receiving_block:
+                return method(*args)
+            self._receiving_block = True
+            began = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                self._receiving_block = False
+                self.notify_of_block_seconds.observe(time.perf_counter() - began)
+        setattr(node, method_name, measured)
+
+    def record_reorg(self, depth: int) -> None:
+        self.reorgs.inc()
+        self.reorg_depth.observe(depth)
+
+
+class MetricsServer:
+    """Serves a registry in the Prometheus text format at /metrics, from a background thread."""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> int:
+        """Starts serving, and returns the port."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.server.server_address[1]
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,83 @@
+"""
+Defences against peers that serve invalid blocks: a cache of the hashes of blocks known to be invalid (and of their
+descendants, which are invalid as well), so they are rejected without being downloaded or validated again, and
+a misbehaviour score per peer, past which the node disconnects the peer and ignores it.
+"""
+from typing import Any, Dict, Iterable
+
+from .utils import BlockHash
+
+# The default number of invalid block hashes remembered before the oldest are forgotten.
+DEFAULT_MAX_INVALID_BLOCKS = 10000
+# The misbehaviour score at which a peer is disconnected.
+MISBEHAVIOUR_THRESHOLD = 100
+# Serving a block that fails validation (or that descends from one).
+INVALID_BLOCK_PENALTY = 50
+# Serving a block that doesn't match the hash it was requested by.
+WRONG_BLOCK_PENALTY = 20
+# Announcing a block that is already known to be invalid.
+KNOWN_INVALID_PENALTY = 10
+
+
+class InvalidBlockCache:
+    """
+    The hashes of blocks known to be invalid. A block is invalid for good once it fails validation on top of
+    its parent, and so is every block that builds on it. The cache is bounded: when it is full, the hash that
+    was added first is forgotten (and that block would be validated again if it is announced again).
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_INVALID_BLOCKS) -> None:
+        self.max_size = max_size
+        # insertion ordered, so the first key is the oldest hash
+        self.hashes: Dict[BlockHash, None] = {}
+        self.stats: Dict[str, int] = {"added": 0, "rejected": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def __contains__(self, block_hash: object) -> bool:
+        return block_hash in self.hashes
+
+    def add(self, block_hashes: Iterable[BlockHash]) -> None:
+        """Remembers that the blocks with the given hashes are invalid."""
+        for block_hash in block_hashes:
+            if block_hash in self.hashes or self.max_size <= 0:
+                continue
+            while len(self.hashes) >= self.max_size:
+                del self.hashes[next(iter(self.hashes))]
+                self.stats["evicted"] += 1
+            self.hashes[block_hash] = None
+            self.stats["added"] += 1
+
+    def check(self, block_hash: BlockHash) -> bool:
+        """Returns whether the block is known to be invalid, counting the rejection if it is."""
+        if block_hash in self.hashes:
+            self.stats["rejected"] += 1
+            return True
+        return False
+
+
+class PeerScores:
+    """
+    The misbehaviour score of every peer that misbehaved. A peer whose score reaches the threshold is banned:
+    the node disconnects from it and ignores whatever it sends. Scores never decay.
+    """
+
+    def __init__(self, threshold: int = MISBEHAVIOUR_THRESHOLD) -> None:
+        self.threshold = threshold
+        self.scores: Dict[Any, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def get(self, peer: Any) -> int:
+        return self.scores.get(peer, 0)
+
+    def add(self, peer: Any, penalty: int) -> bool:
+        """Adds to the peer's score, and returns whether this made the peer cross the threshold."""
+        score = self.scores.get(peer, 0)
+        self.scores[peer] = score + penalty
+        return score < self.threshold <= score + penalty
+
+    def is_banned(self, peer: Any) -> bool:
+        return self.scores.get(peer, 0) >= self.threshold
@@ -1,23 +1,471 @@
 import hashlib
 import os
-import secrets
+import sys
+import threading
+from contextlib import nullcontext
 from .utils import *
-from .block import Block
+from .block import Block, BlockHeader, SealedBlock
+from .orphans import OrphanPool
+from .scheduler import Message, Scheduler
+from .inventory import KnownInventory
+from .compact import CompactBlock
+from .mempool import Mempool
+from .storage import Storage, StoredChain
+from .prune import PrunedChain
+from .wallet import OwnedCoins
+from .metrics import MetricsRegistry, NodeMetrics
+from .tracing import NO_SPAN, Tracer
+from .filters import MAX_FILTERS_PER_REQUEST, FilterIndex
+from .txindex import AddressIndex, TxIndex
+from .forks import SideChains
+from .relay import DEFAULT_MAX_BATCH, DEFAULT_MAX_DELAY, TransactionBatcher
+from .snapshot import CHECK_STEP_DELAY, SnapshotCheck, UtxoSnapshot
+from .misbehaviour import (INVALID_BLOCK_PENALTY, KNOWN_INVALID_PENALTY, WRONG_BLOCK_PENALTY, InvalidBlockCache,
+                           PeerScores)
+from .pow import NONCE_LIMIT, ProofOfWorkMiner, check_proof_of_work, search_nonce
 from .transaction import Transaction
-from typing import Set, Optional, List
+from typing import Any, Callable, ContextManager, Dict, Set, Optional, List, Tuple, Union
+
+# The maximal number of headers a node returns from a single get_headers() call.
+MAX_HEADERS_PER_REQUEST = 2000
+# The maximal number of get_headers() calls while learning a peer's chain, which bounds the headers a peer that keeps
+# sending full batches can make us keep (MAX_HEADER_ROUNDS * MAX_HEADERS_PER_REQUEST).
+MAX_HEADER_ROUNDS = 1000
+# The number of block bodies requested in a single get_blocks() call while syncing.
+BLOCK_DOWNLOAD_BATCH = 500
+# The number of most recent blocks listed one by one in a block locator, before the steps start doubling.
+LOCATOR_DENSE_BLOCKS = 10
+
+# The blocks of a node's chain: a list, or a chain that keeps some of the bodies elsewhere (see prune.py, storage.py).
+Chain = Union[List[Block], PrunedChain, StoredChain]
 
 
 class Node:
+    # Peers with this flag serve get_headers() / get_blocks() and are synced headers-first.
+    # Other peers (e.g. test doubles that only implement get_block) are walked back one block at a time.
+    SUPPORTS_HEADERS_FIRST = True
+    # Peers with this flag accept notify_of_compact_block() and serve get_compact_block() / get_block_transactions().
+    SUPPORTS_COMPACT_BLOCKS = True
+    # Peers with this flag implement get_filters() (which fails unless they enabled block filters).
+    SUPPORTS_BLOCK_FILTERS = True
+    # Peers with this flag accept notify_of_transactions(), so batched relay sends them a batch in a single call.
+    SUPPORTS_TRANSACTION_BATCHES = True
+
     def __init__(self) -> None:
         """Creates a new node with an empty mempool and no connections to others.
         Blocks mined by this node will reward the miner with a single new coin,
         created out of thin air and associated with the mining reward address"""
-        self.mem_pool: List[Transaction] = []
+        self.mem_pool = Mempool()
         self.private_key, self.public_key = gen_keys()
         self.connections : Set['Node'] = set() 
-        self.blockchain: List[Block] = []
-        self.utxos: List[Transaction] = []
+        self.chain_index: Dict[BlockHash, int] = {}
+        self._blockchain: Chain = []
+        self.utxos: Dict[TxID, Transaction] = {}
+        # our coins in the UTXO set, and which of them the mempool already spends (for the wallet methods)
+        self.owned_coins = OwnedCoins()
+        self.mem_pool.on_change = self._on_mempool_change
         self.latest_block_hash: BlockHash = BlockHash(b"Genesis")
+        self.orphans = OrphanPool()
+        # blocks of competing branches (including the ones a reorg disconnected), in case their branch overtakes ours
+        self.side_chains = SideChains()
+        # blocks known to be invalid (and their descendants), rejected without being downloaded again, and the
+        # misbehaviour score of the peers that served them (see misbehaviour.py)
+        self.invalid_blocks = InvalidBlockCache()
+        self.peer_scores = PeerScores()
+        # when set, announcements to neighbors are sent as messages through the scheduler instead of direct calls
+        self.scheduler: Optional[Scheduler] = None
+        # the blocks and transactions each neighbor is known to have, so they are not announced to it again
+        self.track_peer_inventory = True
+        # the transactions waiting to be relayed to each neighbor, once enable_transaction_batching() is called
+        self.relay_batcher: Optional[TransactionBatcher] = None
+        # proof of work: when a target is set, blocks are only valid if their hash is below it (see pow.py).
+        # Mining searches for a nonce in this process, or across the processes of the miner if one is set.
+        self.pow_target: Optional[int] = None
+        self.miner: Optional[ProofOfWorkMiner] = None
+        self.mining_cancelled = threading.Event()
+        # entered around the nonce search, if set: a NodeServer uses it to release the node while the search runs, so
+        # that a competing block can arrive (on another thread) and cancel it (see transport.py)
+        self.mining_unlocked: Optional[Callable[[], ContextManager[Any]]] = None
+        # keep the blocks of our chain as SealedBlocks, whose hash is computed once (see block.py)
+        self.seal_blocks = False
+        # announce new blocks to neighbors that support it as compact blocks, rebuilt from their mempool
+        self.compact_block_relay = True
+        # the coins spent by each block of our chain, so a reorg can disconnect blocks instead of replaying the chain
+        self.block_undo: Dict[BlockHash, List[Transaction]] = {}
+        # where the chain, the UTXO set and the undo data are persisted, if anywhere (see attach_storage)
+        self.storage: Optional[Storage] = None
+        self.peer_inventory: Dict['Node', KnownInventory] = {}
+        self.relay_stats: Dict[str, int] = {"announcements_sent": 0, "announcements_skipped": 0,
+                                            "duplicates_received": 0, "compact_blocks_reconstructed": 0,
+                                            "compact_block_transactions_requested": 0, "peers_banned": 0,
+                                            "transaction_batches_sent": 0}
+        # assume-valid: blocks connected together with this block, up to and including it, are trusted to have
+        # valid signatures (their structure and the coins they spend are still checked)
+        self.assume_valid: Optional[BlockHash] = None
+        self._skip_signature_checks = False
+        # the blocks connected without verifying their signatures (as ancestors of the assume-valid block): the
+        # transactions of these blocks are verified before they go back to the mempool after a reorg
+        self._unverified_blocks: Set[BlockHash] = set()
+        # assume-UTXO: the (block hash, content hash) of the UTXO snapshot this node trusts, and the check of the
+        # history below the snapshot once one is loaded (see load_utxo_snapshot)
+        self.assume_utxo: Optional[Tuple[BlockHash, bytes]] = None
+        self.snapshot_check: Optional[SnapshotCheck] = None
+        self.validation_stats: Dict[str, int] = {"signatures_verified": 0, "signatures_skipped": 0}
+        # counters, gauges and timings of this node, once enable_metrics() is called
+        self.metrics: Optional[NodeMetrics] = None
+        # records the phases of block processing and mining as spans, if set (see tracing.py)
+        self.tracer: Optional[Tracer] = None
+        # the compact filters of the blocks of our chain, served to light wallets (see enable_block_filters)
+        self.filter_index: Optional[FilterIndex] = None
+        # where each transaction of our chain is, and the transactions of every address (see txindex.py)
+        self.tx_index: Optional[TxIndex] = None
+        self.address_index: Optional[AddressIndex] = None
+
+    @property
+    def blockchain(self) -> Chain:
+        """The blocks of the current chain, from the first block after genesis up to the tip (a list, unless the node
+        keeps only some of the bodies in memory)."""
+        return self._blockchain
+
+    @blockchain.setter
+    def blockchain(self, chain: List[Block]) -> None:
+        """Replaces the chain of a node that keeps its chain in a list (a pruned or stored chain can't be replaced,
+        since the new one would be neither pruned nor stored)."""
+        if not isinstance(self._blockchain, list):
+            raise ValueError("The chain of a node with pruning or storage can't be replaced")
+        self._blockchain = chain
+        self.chain_index = {block.get_block_hash(): height for height, block in enumerate(chain)}
+        # the undo data no longer matches the chain, so the next reorg replays it from genesis
+        self.block_undo = {}
+
+    def _append_block(self, block: Block) -> BlockHash:
+        """Appends a block to the current chain and records its height in the chain index. Returns its hash."""
+        block_hash = block.get_block_hash()
+        self.chain_index[block_hash] = len(self._blockchain)
+        if isinstance(self._blockchain, PrunedChain):
+            pruned_hash = self._blockchain.append(block)
+            if pruned_hash is not None:
+                # a pruned block can't be disconnected anymore, so its undo data is not needed either
+                self.block_undo.pop(pruned_hash, None)
+        else:
+            self._blockchain.append(block)
+        if self.filter_index is not None:
+            self.filter_index.add(block)
+        self.orphans.remove(block_hash)
+        return block_hash
+
+    def _seal(self, block: Block) -> Block:
+        """Returns the block sealed (so its hash is computed only once) if this node seals blocks."""
+        return SealedBlock.seal(block) if self.seal_blocks else block
+
+    def _truncate_chain(self, fork_point: int) -> None:
+        """Drops every block above the given height from the current chain (-1 drops the whole chain)."""
+        for height in range(fork_point + 1, len(self._blockchain)):
+            block_hash = self._get_hash_at(height)
+            self.chain_index.pop(block_hash, None)
+            if self.filter_index is not None:
+                self.filter_index.remove(block_hash)
+        del self._blockchain[fork_point + 1:]
+
+    def _get_hash_at(self, height: int) -> BlockHash:
+        """Returns the hash of the block at the given height of the current chain (without reading a stored body)."""
+        if isinstance(self._blockchain, list):
+            return self._blockchain[height].get_block_hash()
+        return self._blockchain.get_hash(height)
+
+    def _get_header_at(self, height: int) -> BlockHeader:
+        """Returns the header of the block at the given height of the current chain (even if its body was pruned)."""
+        if isinstance(self._blockchain, list):
+            return self._blockchain[height].get_header()
+        return self._blockchain.get_header(height)
+
+    def _get_height(self, block_hash: BlockHash) -> Optional[int]:
+        """Returns the position of the given block in the current chain, -1 for the genesis marker,
+        or None if the block is not on the current chain."""
+        if block_hash == GENESIS_BLOCK_PREV:
+            return -1
+        return self.chain_index.get(block_hash)
+
+    def attach_storage(self, storage: Storage) -> None:
+        """
+        Persists this node's chain in the given storage from now on. If the storage already holds a chain, the node
+        continues from it: the block index and the UTXO set are loaded, and block bodies are read when needed.
+        Otherwise the node's current chain and UTXO set are written to it.
+        """
+        stored_hashes = storage.get_chain()
+        if stored_hashes:
+            self._blockchain = StoredChain(storage, stored_hashes)
+            self.chain_index = {block_hash: height for height, block_hash in enumerate(stored_hashes)}
+            self._reset_utxos(storage.get_utxos())
+            self.latest_block_hash = stored_hashes[-1]
+            self.block_undo = {}
+            self._rebuild_tx_indexes()
+        else:
+            chain = StoredChain(storage, [])
+            for block in self._blockchain:
+                chain.append(block)
+            for block_hash, spent in self.block_undo.items():
+                storage.put_undo(block_hash, spent)
+            storage.update_utxos([], list(self.utxos.values()))
+            storage.commit()
+            self._blockchain = chain
+            self.block_undo = {}
+        self.storage = storage
+
+    def enable_pruning(self, keep_blocks: int) -> None:
+        """
+        Keeps the bodies of only the last keep_blocks blocks of the chain from now on (the headers of all blocks
+        are kept). get_block raises PrunedBlockError (a ValueError) for older blocks, and reorgs that would
+        disconnect a pruned block are ignored. Not supported for nodes with storage.
+        """
+        if self.storage is not None:
+            raise ValueError("Pruning is not supported for nodes with storage")
+        chain = PrunedChain([], keep_blocks)
+        for block in self._blockchain:
+            pruned_hash = chain.append(block)
+            if pruned_hash is not None:
+                self.block_undo.pop(pruned_hash, None)
+        self._blockchain = chain
+
+    def create_utxo_snapshot(self) -> UtxoSnapshot:
+        """Returns a snapshot of our UTXO set at the tip (see snapshot.py). Its serialize() is what other nodes load."""
+        if not self.blockchain:
+            raise ValueError("There is no chain to snapshot")
+        return UtxoSnapshot(self.latest_block_hash, len(self.blockchain) - 1, list(self.utxos.values()))
+
+    def load_utxo_snapshot(self, data: bytes, peer: 'Node') -> SnapshotCheck:
+        """
+        Starts this fresh node from a serialized UTXO snapshot instead of the whole history. The snapshot must match
+        the trusted assume_utxo pair, and the headers up to its block are downloaded from the peer (a headers-first
+        peer). Blocks after the snapshot are then validated as usual, while the bodies of the blocks below it are
+        missing, as on a pruned node: get_block raises PrunedBlockError for them, and reorgs below the snapshot
+        are ignored.
+        Returns the check of the history below the snapshot (see snapshot.py), which syncs it from the same peer.
+        With a scheduler, it runs in the background: a step every CHECK_STEP_DELAY seconds on the scheduler's clock,
+        between the node's messages. Without one there is no clock, so call its step() between other calls into the
+        node, or run() to finish it at once, on the thread that runs the node (e.g. with NodeServer.run_in_node).
+        If the check fails, the node drops the chain and UTXO set built on the snapshot, and syncs the whole history
+        from genesis with the next block it is announced.
+        Raises ValueError if the snapshot can't be loaded.
+        """
+        if self.blockchain or self.storage is not None:
+            raise ValueError("A UTXO snapshot can only be loaded by a fresh node without storage")
+        if self.assume_utxo is None:
+            raise ValueError("No UTXO snapshot is trusted (see assume_utxo)")
+        snapshot = UtxoSnapshot.deserialize(data)
+        if (snapshot.block_hash, snapshot.content_hash) != self.assume_utxo:
+            raise ValueError("The UTXO snapshot is not the trusted one")
+        if getattr(peer, "SUPPORTS_HEADERS_FIRST", False) is not True:
+            raise ValueError("The headers of the snapshot block can only be downloaded from a headers-first peer")
+        # The headers are linked by their hashes up to the trusted block, so they need no other check
+        downloaded = self._download_headers(snapshot.block_hash, peer)
+        if downloaded is None or len(downloaded[1]) != snapshot.height + 1:
+            raise ValueError("The peer did not serve the headers of the snapshot block at its height")
+        headers = downloaded[1]
+
+        # A node that enabled pruning keeps pruning the blocks after the snapshot, any other node keeps them all
+        keep = self._blockchain.keep if isinstance(self._blockchain, PrunedChain) else sys.maxsize
+        self._blockchain = PrunedChain.from_headers(headers, keep)
+        self.chain_index = {header.get_block_hash(): height for height, header in enumerate(headers)}
+        self.block_undo = {}
+        self._reset_utxos({coin.get_txid(): coin for coin in snapshot.utxos})
+        self.latest_block_hash = snapshot.block_hash
+
+        shadow = type(self)()
+        shadow.pow_target = self.pow_target
+        shadow.seal_blocks = self.seal_blocks
+        self.snapshot_check = SnapshotCheck(snapshot, [header.get_block_hash() for header in headers], shadow, peer,
+                                            self._drop_snapshot_chainstate)
+        if self.scheduler is not None:
+            self.scheduler.call_later(CHECK_STEP_DELAY, self._continue_snapshot_check)
+        return self.snapshot_check
+
+    def _continue_snapshot_check(self) -> None:
+        """Runs a step of the snapshot check, and schedules the next one until the check is over."""
+        if self.snapshot_check is not None and not self.snapshot_check.step() and self.scheduler is not None:
+            self.scheduler.call_later(CHECK_STEP_DELAY, self._continue_snapshot_check)
+
+    def _drop_snapshot_chainstate(self) -> None:
+        """
+        Called when the history below the loaded snapshot doesn't lead to it: the chain, the UTXO set and the mempool
+        built on the snapshot can't be trusted, so the node (which no longer trusts the snapshot) starts over from
+        an empty chain, and syncs the whole history with the next block it is announced.
+        """
+        self.assume_utxo = None
+        keep = self._blockchain.keep if isinstance(self._blockchain, PrunedChain) else sys.maxsize
+        self._blockchain = PrunedChain([], keep) if keep != sys.maxsize else []
+        self.chain_index = {}
+        self.block_undo = {}
+        self.mem_pool.clear()
+        self._reset_utxos({})
+        self.latest_block_hash = GENESIS_BLOCK_PREV
+        self.side_chains = SideChains(self.side_chains.max_depth)
+        self._unverified_blocks = set()
+        if self.filter_index is not None:
+            self.filter_index = FilterIndex()
+        self._rebuild_tx_indexes()
+        self._cancel_mining()
+
+    def enable_metrics(self, registry: Optional[MetricsRegistry] = None) -> NodeMetrics:
+        """
+        Starts collecting the metrics of this node (see metrics.py) in the given registry, or in a new one.
+        Serve registry.render() (e.g. with a MetricsServer) to expose them.
+        """
+        if self.metrics is not None:
+            raise ValueError("Metrics are already enabled")
+        self.metrics = NodeMetrics(self, registry if registry is not None else MetricsRegistry())
+        return self.metrics
+
+    def enable_block_filters(self) -> FilterIndex:
+        """
+        Builds the compact filters of the blocks of our chain (see filters.py), and from now on of every block
+        that joins it, so they can be served with get_filters. The bodies of the whole chain are needed (on a
+        pruned node, filters must be enabled before pruning).
+        """
+        if self.filter_index is None:
+            self.filter_index = FilterIndex()
+            for block in self.blockchain:
+                self.filter_index.add(block)
+        return self.filter_index
+
+    def enable_tx_index(self) -> TxIndex:
+        """
+        Indexes the transactions of our chain by txid (see get_transaction_location), from now on including every
+        block that joins or leaves the chain. Builds the index from the bodies of the whole chain.
+        """
+        if self.tx_index is None:
+            self.tx_index = TxIndex()
+            self._replay_chain_into([self.tx_index])
+        return self.tx_index
+
+    def enable_address_index(self) -> AddressIndex:
+        """
+        Indexes the transactions of our chain by the addresses they pay and spend from (see get_address_history),
+        from now on including every block that joins or leaves the chain. Builds the index from the bodies of the
+        whole chain.
+        """
+        if self.address_index is None:
+            self.address_index = AddressIndex()
+            self._replay_chain_into([self.address_index])
+        return self.address_index
+
+    def enable_transaction_batching(self, max_batch: int = DEFAULT_MAX_BATCH,
+                                    max_delay: float = DEFAULT_MAX_DELAY) -> TransactionBatcher:
+        """
+        Relays transactions to each neighbor in batches: a batch is sent when it holds max_batch transactions, or
+        max_delay seconds after its first transaction on the scheduler's clock. Without a scheduler there is no
+        clock, and the batches are sent when the call that filled them returns.
+        """
+        if self.relay_batcher is not None:
+            raise ValueError("Transaction batching is already enabled")
+        self.relay_batcher = TransactionBatcher(max_batch, max_delay)
+        return self.relay_batcher
+
+    def _get_tx_indexes(self) -> List[Union[TxIndex, AddressIndex]]:
+        return [index for index in (self.tx_index, self.address_index) if index is not None]
+
+    def _rebuild_tx_indexes(self) -> None:
+        """Rebuilds the enabled transaction indexes from the current chain."""
+        if self.tx_index is not None:
+            self.tx_index = TxIndex()
+        if self.address_index is not None:
+            self.address_index = AddressIndex()
+        self._replay_chain_into(self._get_tx_indexes())
+
+    def _replay_chain_into(self, indexes: List[Union[TxIndex, AddressIndex]]) -> None:
+        """Connects the blocks of the chain to the indexes, tracking the coins they spend along the way."""
+        if not indexes:
+            return
+        coins: Dict[TxID, Transaction] = {}
+        for block in self.blockchain:
+            spent = [coins.pop(tx.input) for tx in block.get_transactions()
+                     if tx.input is not None and tx.input in coins]
+            for tx in block.get_transactions():
+                coins[tx.get_txid()] = tx
+            for index in indexes:
+                index.connect_block(block, spent)
+
+    def _span(self, name: str, **args: Any) -> ContextManager[Any]:
+        """A span of the node's tracer, or a span that records nothing if the node has no tracer."""
+        if self.tracer is None:
+            return NO_SPAN
+        return self.tracer.span(name, node=self.get_address().hex()[-8:], **args)
+
+    def _can_disconnect_to(self, fork_point: int) -> bool:
+        """Checks whether the bodies of all blocks above the fork point are available to disconnect them."""
+        return not (isinstance(self._blockchain, PrunedChain) and fork_point + 1 < len(self._blockchain) and
+                    self._blockchain.is_pruned(fork_point + 1))
+
+    def _commit_storage(self) -> None:
+        """Makes the changes to the chain since the last commit durable, if this node has storage."""
+        if self.storage is not None:
+            self.storage.commit()
+
+    def _get_undo(self, block_hash: BlockHash) -> Optional[List[Transaction]]:
+        """Returns the coins spent by the given block of our chain, or None if they are unknown."""
+        if self.storage is not None:
+            return self.storage.get_undo(block_hash)
+        return self.block_undo.get(block_hash)
+
+    def _rewind_utxos(self, fork_point: int) -> List[Block]:
+        """
+        Brings the UTXO set back to the state after the block at the fork point, by disconnecting the blocks above it
+        (removing the coins they created and restoring the coins they spent). If the spent coins of one of these
+        blocks are unknown, the UTXO set is rebuilt from genesis instead. Returns the disconnected blocks.
+        """
+        disconnected = self.blockchain[fork_point + 1:]
+        undo = [self._get_undo(block.get_block_hash()) for block in disconnected]
+        if any(spent is None for spent in undo):
+            self._reset_utxos({})
+            if self.storage is not None:
+                self.storage.clear_utxos()
+            # the indexes are rebuilt as the blocks are connected again
+            if self.tx_index is not None:
+                self.tx_index = TxIndex()
+            if self.address_index is not None:
+                self.address_index = AddressIndex()
+            for block in self.blockchain[:fork_point + 1]:
+                self.update_mempool_and_utxo(block)
+            return disconnected
+
+        for block, spent in zip(reversed(disconnected), reversed(undo)):
+            created = [tx.get_txid() for tx in block.get_transactions()]
+            for txid in created:
+                self._remove_utxo(txid)
+            for coin in spent:  # type: ignore
+                self._add_utxo(coin)
+            for index in self._get_tx_indexes():
+                index.disconnect_block(block, spent)  # type: ignore
+            self.block_undo.pop(block.get_block_hash(), None)
+            if self.storage is not None:
+                self.storage.update_utxos(created, spent)  # type: ignore
+        return disconnected
+
+    def _add_utxo(self, coin: Transaction) -> None:
+        """Adds a coin to the UTXO set (and to our coins, if it is ours)."""
+        txid = coin.get_txid()
+        self.utxos[txid] = coin
+        if coin.output == self.public_key:
+            self.owned_coins.add(coin, self.mem_pool.get_spender(txid) is not None)
+
+    def _remove_utxo(self, txid: TxID) -> Optional[Transaction]:
+        """Removes a coin from the UTXO set (and from our coins). Returns it, or None if it was not there."""
+        coin = self.utxos.pop(txid, None)
+        if coin is not None and coin.output == self.public_key:
+            self.owned_coins.remove(txid)
+        return coin
+
+    def _reset_utxos(self, utxos: Dict[TxID, Transaction]) -> None:
+        """Replaces the UTXO set, and rebuilds the index of our coins from it."""
+        self.utxos = {}
+        self.owned_coins = OwnedCoins()
+        for coin in utxos.values():
+            self._add_utxo(coin)
+
+    def _on_mempool_change(self, transaction: Transaction, added: bool) -> None:
+        """Keeps track of which of our coins the mempool spends."""
+        if transaction.input is not None:
+            self.owned_coins.set_pending(transaction.input, added)
 
     def connect(self, other: 'Node') -> None:
         """connects this node to another node for block and transaction updates.
@@ -38,17 +486,126 @@ class Node:
             # Notify of latest blocks - let the node with more blocks notify first
             if len(self.blockchain) >= len(other.blockchain):
                 if self.latest_block_hash != GENESIS_BLOCK_PREV:
-                    other.notify_of_block(self.latest_block_hash, self)
+                    self._announce_block(self.latest_block_hash, other)
             else:
                 if other.latest_block_hash != GENESIS_BLOCK_PREV:
-                    self.notify_of_block(other.latest_block_hash, other)
+                    other._announce_block(other.latest_block_hash, self)
 
     def disconnect_from(self, other: 'Node') -> None:
         """Disconnects this node from the other node. If the two were not connected, then nothing happens"""
         if other in self.connections:
             self.connections.discard(other)
+            self.peer_inventory.pop(other, None)
             if self in other.connections:
                 other.connections.discard(self)
+                other.peer_inventory.pop(self, None)
+
+    def _mark_known_by(self, peer: 'Node', item: bytes) -> None:
+        """Remembers that the peer has the block or transaction with the given hash."""
+        if self.track_peer_inventory and peer in self.connections:
+            inventory = self.peer_inventory.get(peer)
+            if inventory is None:
+                inventory = self.peer_inventory[peer] = KnownInventory()
+            inventory.add(item)
+
+    def _should_announce(self, peer: 'Node', item: bytes) -> bool:
+        """Checks whether the peer may not have the item yet, and if so remembers that it is being told about it."""
+        inventory = self.peer_inventory.get(peer)
+        if inventory is not None and item in inventory:
+            self.relay_stats["announcements_skipped"] += 1
+            return False
+        self._mark_known_by(peer, item)
+        self.relay_stats["announcements_sent"] += 1
+        return True
+
+    def _announce_block(self, block_hash: BlockHash, peer: 'Node') -> None:
+        """Tells a neighbor about a block: directly, or as a message if this node runs on a scheduler.
+        Nothing is sent if the neighbor is known to have the block."""
+        if not self._should_announce(peer, block_hash):
+            return
+        compact_block = None
+        if (self.compact_block_relay and block_hash == self.latest_block_hash and
+                getattr(peer, "SUPPORTS_COMPACT_BLOCKS", False) is True):
+            compact_block = self.get_compact_block(block_hash)
+            if compact_block.get_header().get_block_hash() != block_hash:
+                # never announce a different block than the one we mean to
+                compact_block = None
+        if compact_block is not None:
+            if self.scheduler is None:
+                peer.notify_of_compact_block(compact_block, self)
+            else:
+                self.scheduler.send(Message(Message.COMPACT_BLOCK, compact_block, self, peer))
+        elif self.scheduler is None:
+            peer.notify_of_block(block_hash, self)
+        else:
+            self.scheduler.send(Message(Message.BLOCK, block_hash, self, peer))
+
+    def _announce_transaction(self, transaction: Transaction, peer: 'Node') -> None:
+        """Sends a transaction to a neighbor: directly, or as a message if this node runs on a scheduler.
+        With batched relay, it is added to the neighbor's batch instead.
+        Nothing is sent if the neighbor is known to have the transaction."""
+        if not self._should_announce(peer, transaction.get_txid()):
+            return
+        if self.relay_batcher is not None:
+            batch_size = self.relay_batcher.add(peer, transaction)
+            if batch_size >= self.relay_batcher.max_batch:
+                self._send_batch(peer)
+            elif batch_size == 1 and self.scheduler is not None:
+                batch_id = self.relay_batcher.get_batch_id(peer)
+                self.scheduler.call_later(self.relay_batcher.max_delay, lambda: self._send_batch(peer, batch_id))
+            return
+        if self.scheduler is None:
+            peer.notify_of_transaction(transaction, self)
+        else:
+            self.scheduler.send(Message(Message.TRANSACTION, transaction, self, peer))
+
+    def _send_batch(self, peer: 'Node', batch_id: Optional[int] = None) -> None:
+        """
+        Sends the transactions waiting for a neighbor: in one call or message if it accepts batches.
+        If batch_id is given (by the timer of a batch), nothing is sent unless that batch is still waiting.
+        """
+        assert self.relay_batcher is not None
+        if batch_id is not None and not self.relay_batcher.is_pending(peer, batch_id):
+            return
+        transactions = self.relay_batcher.take(peer)
+        if not transactions or peer not in self.connections:
+            return
+        if getattr(peer, "SUPPORTS_TRANSACTION_BATCHES", False) is not True:
+            for transaction in transactions:
+                if self.scheduler is None:
+                    peer.notify_of_transaction(transaction, self)
+                else:
+                    self.scheduler.send(Message(Message.TRANSACTION, transaction, self, peer))
+            return
+        self.relay_stats["transaction_batches_sent"] += 1
+        if self.scheduler is None:
+            peer.notify_of_transactions(transactions, self)
+        else:
+            self.scheduler.send(Message(Message.TRANSACTIONS, transactions, self, peer))
+
+    def flush_transaction_batches(self) -> None:
+        """Sends every batch of transactions that is waiting, without waiting for it to fill up."""
+        if self.relay_batcher is not None:
+            for peer in self.relay_batcher.get_peers():
+                self._send_batch(peer)
+
+    def notify_of_transaction(self, transaction: Transaction, sender: 'Node') -> bool:
+        """
+        This method is used by a node's connection to send it a transaction. It remembers that the sender has
+        the transaction (so it is not sent back) and adds it to the mempool, see add_transaction_to_mempool.
+        """
+        if self.peer_scores.is_banned(sender):
+            return False
+        self._mark_known_by(sender, transaction.get_txid())
+        return self.add_transaction_to_mempool(transaction)
+
+    def notify_of_transactions(self, transactions: List[Transaction], sender: 'Node') -> List[bool]:
+        """Same as notify_of_transaction, for a batch of transactions. Returns the result for each of them."""
+        if self.peer_scores.is_banned(sender):
+            return [False] * len(transactions)
+        for transaction in transactions:
+            self._mark_known_by(sender, transaction.get_txid())
+        return self.add_transactions_to_mempool(transactions)
 
     def get_connections(self) -> Set['Node']:
         """Returns a set containing the connections of this node."""
@@ -65,20 +622,44 @@ class Node:
 
         If the transaction is added successfully, then it is also sent to neighboring nodes.
         """
-        # Skip if transaction is already in mempool
-        if transaction in self.mem_pool:
-            return True
+        return self.add_transactions_to_mempool([transaction])[0]
+
+    def add_transactions_to_mempool(self, transactions: List[Transaction]) -> List[bool]:
+        """
+        Same as add_transaction_to_mempool, for many transactions at once (in order, so of two transactions that
+        spend the same coin the first one is added). Returns the result for each of them.
+        The added transactions are sent to the neighboring nodes after all of them were checked.
+        """
+        results: List[bool] = []
+        added: List[Transaction] = []
+        for transaction in transactions:
+            # Skip if transaction is already in mempool
+            if transaction in self.mem_pool:
+                self.relay_stats["duplicates_received"] += 1
+                results.append(True)
+                continue
+            accepted = self._accept_transaction(transaction)
+            results.append(accepted)
+            if accepted:
+                added.append(transaction)
+
+        # Send the transactions to neighboring nodes (unless they are known to have them)
+        for node in self.connections:
+            for transaction in added:
+                self._announce_transaction(transaction, node)
+        if self.scheduler is None:
+            self.flush_transaction_batches()
 
+        return results
+
+    def _accept_transaction(self, transaction: Transaction) -> bool:
+        """Checks a transaction that is not in the mempool, and adds it to the mempool if it is valid."""
         # Reject coinbase transactions - they can only be created through mining
         if transaction.input is None:
             return False
 
         # Find the UTXO being spent
-        utxo = None
-        for u in self.utxos:
-            if u.get_txid() == transaction.input:
-                utxo = u
-                break
+        utxo = self.utxos.get(transaction.input)
 
         # Check if the source has the coin
         if utxo is None:
@@ -90,19 +671,11 @@ class Node:
             return False
 
         # Check for contradicting transactions in the mempool
-        for tx in self.mem_pool:
-            if tx.input == transaction.input:
-                return False
-
-        # Add the transaction to the mempool
-        self.mem_pool.append(transaction)
-
-        # Send the transaction to neighboring nodes
-        for node in self.connections:
-            if transaction not in node.get_mempool():  # Only forward if node doesn't have it
-                node.add_transaction_to_mempool(transaction)
+        if self.mem_pool.get_spender(transaction.input) is not None:
+            return False
 
-        return True
+        # Add the transaction to the mempool (this may evict the oldest transactions if the mempool is full)
+        return self.mem_pool.add(transaction)
 
     def notify_of_block(self, block_hash: BlockHash, sender: 'Node') -> None:
         """
@@ -118,72 +691,428 @@ class Node:
         a notification of this block is sent to the neighboring nodes of this node.
         (no need to notify of previous blocks -- the nodes will fetch them if needed)
         """
+        if self.peer_scores.is_banned(sender):
+            return
+        self._mark_known_by(sender, block_hash)
+
         # If we already have this block, nothing to do
-        if block_hash in [block.get_block_hash() for block in self.blockchain]:
+        if self._get_height(block_hash) is not None:
+            self.relay_stats["duplicates_received"] += 1
+            return
+        if self.invalid_blocks.check(block_hash):
+            self._penalise(sender, KNOWN_INVALID_PENALTY)
+            return
+        # A block of a branch we kept needs no download, but its branch may have become longer than our chain
+        # (e.g. after a reorg to a longer chain stopped at an invalid block)
+        if block_hash in self.side_chains:
+            branch = self._get_side_branch(block_hash)
+            if branch is not None:
+                if branch[0] + 1 + len(branch[1]) <= len(self.blockchain):
+                    self.relay_stats["duplicates_received"] += 1
+                    return
+                with self._span("notify_of_block", block=block_hash.hex()[:16]):
+                    self._connect_new_chain(*branch, sender)
+                return
+
+        with self._span("notify_of_block", block=block_hash.hex()[:16]):
+            # Learn the unknown part of the chain that ends with this block, down to a block we know
+            with self._span("chain_walk"):
+                if getattr(sender, "SUPPORTS_HEADERS_FIRST", False) is True:
+                    new_chain = self._download_chain_headers_first(block_hash, sender)
+                else:
+                    new_chain = self._download_chain_block_by_block(block_hash, sender)
+            if new_chain is None:
+                return
+            self._connect_new_chain(*new_chain, sender)
+
+    def notify_of_compact_block(self, compact_block: CompactBlock, sender: 'Node') -> None:
+        """
+        Same as notify_of_block, for a new block announced in compact form.
+        If the block extends our chain, it is rebuilt from the mempool and only the missing transactions are
+        requested from the sender. Otherwise (or if the block can't be rebuilt) it is synced like notify_of_block.
+        """
+        if self.peer_scores.is_banned(sender):
+            return
+        header = compact_block.get_header()
+        block_hash = header.get_block_hash()
+        self._mark_known_by(sender, block_hash)
+        if self._get_height(block_hash) is not None:
+            self.relay_stats["duplicates_received"] += 1
+            return
+        if self.invalid_blocks.check(block_hash):
+            self._penalise(sender, KNOWN_INVALID_PENALTY)
             return
 
-        # First verify that this chain leads to Genesis
+        block = None
+        if header.get_prev_block_hash() == self.latest_block_hash and block_hash not in self.side_chains:
+            block = self._reconstruct_block(compact_block, sender)
+        if block is None:
+            self.notify_of_block(block_hash, sender)
+            return
+        self.relay_stats["compact_blocks_reconstructed"] += 1
+        if self.metrics is not None:
+            self.metrics.blocks_received.inc()
+        with self._span("notify_of_compact_block", block=block_hash.hex()[:16]):
+            self._connect_new_chain(len(self.blockchain) - 1, [block], sender)
+
+    def _reconstruct_block(self, compact_block: CompactBlock, sender: 'Node') -> Optional[Block]:
+        """Rebuilds the block from the mempool and the sender. Returns None if it can't be rebuilt."""
+        block_hash = compact_block.get_header().get_block_hash()
+        try:
+            transactions, missing = compact_block.reconstruct(self.mem_pool)
+            if missing:
+                self.relay_stats["compact_block_transactions_requested"] += len(missing)
+                fetched = sender.get_block_transactions(block_hash, missing)
+                if len(fetched) != len(missing):
+                    return None
+                for index, tx in zip(missing, fetched):
+                    transactions[index] = tx
+        except ValueError:
+            return None
+
+        header = compact_block.get_header()
+        block = Block(header.get_prev_block_hash(), transactions, header.get_nonce())  # type: ignore
+        # A short id collision (or a lying sender) gives a different block
+        if block.get_block_hash() != block_hash:
+            return None
+        return block
+
+    def _connect_new_chain(self, fork_point: int, blocks_to_add: List[Block], sender: 'Node') -> None:
+        """Switches to the given blocks above the fork point if that makes our chain longer,
+        then connects any orphans that were waiting for the new tip."""
+        # Only switch if new chain is longer (and we still have the blocks we would disconnect)
+        if fork_point + 1 + len(blocks_to_add) > len(self.blockchain) and self._can_disconnect_to(fork_point):
+            self._switch_to_chain(fork_point, blocks_to_add, sender)
+        elif blocks_to_add:
+            # Keep the other branch, so its blocks are not downloaded again if it overtakes ours
+            for offset, block in enumerate(blocks_to_add):
+                source = self._served_by(block.get_block_hash(), sender)
+                self.side_chains.add(block, fork_point + 2 + offset, validated=False, source=source)
+            self.side_chains.trim(len(self.blockchain))
+
+        # Blocks that were waiting for the new tip can now be connected as well (they stay in the orphan pool
+        # until they are, so that an invalid one is blamed on the peer that served it, not on the sender)
+        waiting_blocks = self.orphans.get_longest_branch(self.latest_block_hash)
+        if waiting_blocks:
+            self._switch_to_chain(len(self.blockchain) - 1, waiting_blocks, sender)
+
+    def _download_chain_block_by_block(self, block_hash: BlockHash,
+                                       sender: 'Node') -> Optional[Tuple[int, List[Block]]]:
+        """
+        Walks back from the given block through the sender, one get_block call per block, until reaching
+        a block on our chain (or genesis). Blocks already waiting in the orphan pool are not fetched again.
+        Returns the height of that block and the downloaded blocks in chain order, or None if the chain
+        doesn't lead to genesis or the sender serves a wrong block. In that case the blocks downloaded
+        so far are kept in the orphan pool, waiting for their missing ancestor.
+        If the chain reaches a block known to be invalid, the downloaded blocks are invalid as well, and None
+        is returned.
+        """
         current_hash = block_hash
-        blocks_to_add = []
+        blocks: List[Block] = []
+        height = self._get_height(current_hash)
         try:
-            while current_hash != GENESIS_BLOCK_PREV and current_hash not in [block.get_block_hash() for block in self.blockchain]:
-                current_block = sender.get_block(current_hash)
-                # Verify that the block matches the hash we requested
-                if current_block.get_block_hash() != current_hash:
-                    return
-                blocks_to_add.insert(0, current_block)  # Add to front to maintain order
+            while height is None:
+                if self.invalid_blocks.check(current_hash):
+                    self._reject_invalid([block.get_block_hash() for block in blocks], sender)
+                    return None
+                current_block = self._find_stored_block(current_hash)
+                if current_block is None:
+                    current_block = self._seal(sender.get_block(current_hash))
+                    if self.metrics is not None:
+                        self.metrics.blocks_received.inc()
+                    # Verify that the block matches the hash we requested
+                    if current_block.get_block_hash() != current_hash:
+                        self._penalise(sender, WRONG_BLOCK_PENALTY)
+                        self._keep_as_orphans(blocks, sender)
+                        return None
+                blocks.append(current_block)
                 current_hash = current_block.get_prev_block_hash()
+                height = self._get_height(current_hash)
         except ValueError:
             # Chain doesn't lead to Genesis or a known block
-            return
-
-        # Find where the chains diverge
-        fork_point = -1
-        if current_hash != GENESIS_BLOCK_PREV:
-            fork_point = next((i for i, block in enumerate(self.blockchain) 
-                             if block.get_block_hash() == current_hash), -1)
-
-        # Compare chain lengths from fork point
-        current_chain_length = len(self.blockchain) - (fork_point + 1)
-        new_chain_length = len(blocks_to_add)
+            self._keep_as_orphans(blocks, sender)
+            return None
 
-        # Only switch if new chain is longer
-        if new_chain_length > current_chain_length:
-            # Save current mempool
-            old_mempool = self.mem_pool.copy()
+        blocks.reverse()
+        return height, blocks
 
-            # Reset state to fork point
-            self.blockchain = self.blockchain[:fork_point + 1] if fork_point >= 0 else []
-            self.utxos = []
-            self.mem_pool = []
+    def _download_chain_headers_first(self, block_hash: BlockHash,
+                                      sender: 'Node') -> Optional[Tuple[int, List[Block]]]:
+        """
+        Same as _download_chain_block_by_block, but learns the header chain from the sender first
+        (using a block locator) and then downloads the block bodies in batches.
+        Bodies are only downloaded if the new chain is longer than ours, not counting the blocks from the first
+        one known to be invalid on.
+        """
+        with self._span("fork_search"):
+            headers = self._download_headers(block_hash, sender)
+        if headers is None:
+            return None
+        fork_point, new_headers = headers
+        for position, header in enumerate(new_headers):
+            if self.invalid_blocks.check(header.get_block_hash()):
+                self._reject_invalid([header.get_block_hash() for header in new_headers[position + 1:]], sender)
+                new_headers = new_headers[:position]
+                break
+        if fork_point + 1 + len(new_headers) <= len(self.blockchain):
+            return fork_point, []
+
+        blocks: List[Block] = []
+        for start in range(0, len(new_headers), BLOCK_DOWNLOAD_BATCH):
+            batch = new_headers[start:start + BLOCK_DOWNLOAD_BATCH]
+            # Bodies waiting in the orphan pool or kept on a side chain don't need to be fetched again
+            bodies: List[Optional[Block]] = [self._find_stored_block(header.get_block_hash()) for header in batch]
+            missing = [header.get_block_hash() for header, body in zip(batch, bodies) if body is None]
+            if missing:
+                try:
+                    downloaded = sender.get_blocks(missing)
+                    if self.metrics is not None:
+                        self.metrics.blocks_received.inc(len(downloaded))
+                    fetched = iter([self._seal(block) for block in downloaded])
+                    bodies = [body if body is not None else next(fetched) for body in bodies]
+                except (ValueError, StopIteration):
+                    self._keep_as_orphans(blocks, sender)
+                    return None
+            # Verify that every body matches the header we were promised
+            for header, block in zip(batch, bodies):
+                if (block is None or block.get_block_hash() != header.get_block_hash() or
+                        block.get_prev_block_hash() != header.get_prev_block_hash()):
+                    self._penalise(sender, WRONG_BLOCK_PENALTY)
+                    self._keep_as_orphans(blocks, sender)
+                    return None
+                blocks.append(block)
+        return fork_point, blocks
+
+    def _find_stored_block(self, block_hash: BlockHash) -> Optional[Block]:
+        """Returns a block we already downloaded that is not on our chain (an orphan or a side-chain block)."""
+        block = self.orphans.lookup(block_hash)
+        return block if block is not None else self.side_chains.get(block_hash)
+
+    def _get_side_branch(self, block_hash: BlockHash) -> Optional[Tuple[int, List[Block]]]:
+        """
+        Returns the height of the block on our chain that the kept side-chain blocks ending with the given block
+        build on, and these blocks in chain order, or None if some of them are no longer kept.
+        """
+        blocks: List[Block] = []
+        current_hash = block_hash
+        fork_point = self._get_height(current_hash)
+        while fork_point is None:
+            block = self.side_chains.get(current_hash)
+            if block is None:
+                return None
+            blocks.append(block)
+            current_hash = block.get_prev_block_hash()
+            fork_point = self._get_height(current_hash)
+        blocks.reverse()
+        return fork_point, blocks
+
+    def _find_longer_side_branch(self) -> Optional[Tuple[int, List[Block]]]:
+        """Returns the longest kept branch (see _get_side_branch) that is longer than our chain, if there is one."""
+        for tip, length in sorted(self.side_chains.get_tips().items(), key=lambda item: -item[1]):
+            if length <= len(self.blockchain):
+                break
+            branch = self._get_side_branch(tip)
+            if branch is not None and self._can_disconnect_to(branch[0]):
+                return branch
+        return None
 
-            # Rebuild UTXOs from fork point
-            for block in self.blockchain:
-                self.update_mempool_and_utxo(block)
+    def _reject_invalid(self, block_hashes: List[BlockHash], peer: Optional['Node']) -> None:
+        """Remembers that the given blocks are invalid, and penalises the peer that served them (if known)."""
+        self.invalid_blocks.add(block_hashes)
+        if peer is not None:
+            self._penalise(peer, INVALID_BLOCK_PENALTY)
 
-            # Add new blocks one by one, stopping at first invalid block
-            for block in blocks_to_add:
-                if not self.validate_block(block):
-                    # Stop processing blocks but keep what we've validated so far
-                    break
-                self.blockchain.append(block)
-                self.update_mempool_and_utxo(block)
-                self.latest_block_hash = block.get_block_hash()
+    def _penalise(self, peer: 'Node', penalty: int) -> None:
+        """Adds to the peer's misbehaviour score, and disconnects from the peer once it crosses the threshold."""
+        if self.peer_scores.add(peer, penalty):
+            self.relay_stats["peers_banned"] += 1
+            self.disconnect_from(peer)
 
-                # Notify neighbors of the valid block
-                for node in self.connections:
-                    if node != sender:  # Don't notify the sender
-                        node.notify_of_block(block.get_block_hash(), self)
+    def _keep_as_orphans(self, blocks: List[Block], sender: 'Node') -> None:
+        """Keeps blocks whose hashes were verified but which could not be connected yet in the orphan pool."""
+        for block in blocks:
+            self.orphans.add(block, self._served_by(block.get_block_hash(), sender))
 
-            # If we didn't process any blocks, restore genesis state
-            if not self.blockchain:
-                self.latest_block_hash = GENESIS_BLOCK_PREV
+    def _served_by(self, block_hash: BlockHash, sender: 'Node') -> Optional['Node']:
+        """
+        Returns the peer that served a block we are processing for the sender: the peer recorded with it if we kept
+        it as an orphan or on a side chain (None if unknown), or else the sender, which served it just now.
+        """
+        if block_hash in self.orphans:
+            return self.orphans.get_source(block_hash)
+        if block_hash in self.side_chains:
+            return self.side_chains.get_source(block_hash)
+        return sender
+
+    def _download_headers(self, block_hash: BlockHash,
+                          sender: 'Node') -> Optional[Tuple[int, List[BlockHeader]]]:
+        """
+        Requests headers from the sender until reaching the given block.
+        Returns the height of the last block on our chain that the headers build on, and the headers after it.
+        Returns None if the headers don't link to each other or to our chain, or don't reach the block within
+        MAX_HEADER_ROUNDS requests.
+        """
+        headers: List[BlockHeader] = []
+        fork_point = -1
+        locator = self._get_block_locator()
+        for _ in range(MAX_HEADER_ROUNDS):
+            batch = sender.get_headers(locator, block_hash)
+            for header in batch:
+                if headers:
+                    if header.get_prev_block_hash() != headers[-1].get_block_hash():
+                        return None
+                else:
+                    known_height = self._get_height(header.get_block_hash())
+                    if known_height is not None:
+                        # The sender's chain still matches ours here (the locator skips blocks)
+                        fork_point = known_height
+                        continue
+                    parent_height = self._get_height(header.get_prev_block_hash())
+                    if parent_height is None:
+                        return None
+                    fork_point = parent_height
+                headers.append(header)
+                if header.get_block_hash() == block_hash:
+                    return fork_point, headers
+
+            if len(batch) < MAX_HEADERS_PER_REQUEST:
+                # The sender has no more headers, and the block was not among them
+                return None
+            locator = [batch[-1].get_block_hash()]
+        return None
 
-            # Restore mempool transactions that weren't included in the new chain
-            all_txids = {tx.get_txid() for block in self.blockchain[fork_point + 1:] for tx in block.get_transactions()}
-            for tx in old_mempool:
-                if tx.get_txid() not in all_txids and self.validate_transaction(tx):
-                    self.mem_pool.append(tx)
+    def _get_block_locator(self) -> List[BlockHash]:
+        """
+        Returns hashes of blocks on our chain, from the tip backwards: the most recent blocks one by one,
+        then with exponentially growing steps, and finally the genesis marker.
+        A peer finds the first of these on its own chain to know where our chains diverge.
+        """
+        locator: List[BlockHash] = []
+        step = 1
+        height = len(self.blockchain) - 1
+        while height >= 0:
+            locator.append(self._get_hash_at(height))
+            if len(locator) >= LOCATOR_DENSE_BLOCKS:
+                step *= 2
+            height -= step
+        locator.append(GENESIS_BLOCK_PREV)
+        return locator
+
+    def _switch_to_chain(self, fork_point: int, blocks_to_add: List[Block], sender: 'Node') -> None:
+        """
+        Replaces our chain above the fork point with the given blocks, stopping at the first invalid block.
+        The UTXO set and mempool are updated accordingly, and neighbors are notified of the new tip.
+        """
+        old_tip = self.latest_block_hash
+        old_length = len(self.blockchain)
+
+        # Reset state to fork point
+        with self._span("state_rewind", depth=len(self.blockchain) - fork_point - 1):
+            disconnected = self._rewind_utxos(fork_point)
+            self._truncate_chain(fork_point)
+        # The disconnected blocks were validated, in case their branch overtakes again
+        for offset, block in enumerate(disconnected):
+            self.side_chains.add(block, fork_point + 2 + offset, validated=True)
+        if disconnected and self.metrics is not None:
+            self.metrics.record_reorg(len(disconnected))
+
+        # Add new blocks one by one, stopping at first invalid block
+        # (connecting a block removes its transactions, and the ones that conflict with them, from the mempool)
+        assumed_valid = self._count_assumed_valid(blocks_to_add)
+        stopped_at_invalid = False
+        for position, block in enumerate(blocks_to_add):
+            block = self._seal(block)
+            block_hash = block.get_block_hash()
+            # The signatures of a side-chain block that was on our chain before were verified back then (or trusted,
+            # and then the block is still in _unverified_blocks)
+            validated = self.side_chains.is_validated(block_hash)
+            self._skip_signature_checks = position < assumed_valid or validated
+            try:
+                with self._span("validate_block", height=fork_point + 1 + position):
+                    valid = self.validate_block(block)
+            finally:
+                self._skip_signature_checks = False
+            if not valid:
+                # Stop processing blocks but keep what we've validated so far. The block and the ones built on it
+                # are invalid for good, so they are rejected as soon as they are announced again. The penalty goes
+                # to the peer that served the block, which is not the sender if we had kept it.
+                culprit = self._served_by(block_hash, sender)
+                rejected = [block_hash] + [later.get_block_hash() for later in blocks_to_add[position + 1:]]
+                for rejected_hash in rejected:
+                    self.side_chains.remove(rejected_hash)
+                    self.orphans.remove(rejected_hash)
+                self._reject_invalid(rejected, culprit)
+                stopped_at_invalid = True
+                break
+            self.side_chains.take(block_hash)
+            if position < assumed_valid and not validated:
+                self._unverified_blocks.add(block_hash)
+            with self._span("connect_block", height=fork_point + 1 + position):
+                self.latest_block_hash = self._append_block(block)
+                self.update_mempool_and_utxo(block)
+            # The sender served this block, so there is no need to announce it back
+            self._mark_known_by(sender, self.latest_block_hash)
+
+        # Stopping at an invalid block may leave us on a shorter chain than before: switch back to the longest
+        # kept branch then (which may be the chain we left, whose blocks were kept on a side chain)
+        if stopped_at_invalid and len(self.blockchain) < old_length:
+            branch = self._find_longer_side_branch()
+            if branch is not None:
+                self._switch_to_chain(*branch, sender)
+
+        # If we didn't process any blocks, restore genesis state
+        if not self.blockchain:
+            self.latest_block_hash = GENESIS_BLOCK_PREV
+        elif self.latest_block_hash != old_tip:
+            # A block we may be mining now would not extend the new tip
+            self._cancel_mining()
+            # Notify neighbors of the new tip (they fetch the blocks before it if they need them)
+            for node in self.connections:
+                self._announce_block(self.latest_block_hash, node)
+
+        self.side_chains.trim(len(self.blockchain))
+
+        # The whole switch is stored at once, so the storage never holds a half-done reorg
+        self._commit_storage()
+
+        # (blocks that were connected again after switching back are not disconnected anymore)
+        disconnected = [block for block in disconnected if self._get_height(block.get_block_hash()) is None]
+        if disconnected:
+            with self._span("mempool_restore", blocks=len(disconnected)):
+                self._restore_disconnected_transactions(disconnected)
+
+    def _restore_disconnected_transactions(self, disconnected: List[Block]) -> None:
+        """
+        Updates the mempool after a reorg disconnected the given blocks: mempool transactions that spend coins
+        created by these blocks (and not by the new chain) are dropped, and the transactions of these blocks that
+        are not on the new chain go back to the mempool if the coins they spend still exist.
+        Signatures are only verified again for the blocks whose signatures were not verified when they were
+        connected (see assume_valid).
+        """
+        for block in disconnected:
+            for tx in block.get_transactions():
+                txid = tx.get_txid()
+                if txid not in self.utxos:
+                    spender = self.mem_pool.get_spender(txid)
+                    if spender is not None:
+                        self.mem_pool.remove(spender.get_txid())
+
+        for block in disconnected:
+            verified = block.get_block_hash() not in self._unverified_blocks
+            for tx in block.get_transactions():
+                if (tx.input is not None and tx.input in self.utxos and tx.get_txid() not in self.utxos and
+                        (verified or self.validate_transaction(tx))):
+                    self.mem_pool.add(tx)
+
+    def _count_assumed_valid(self, blocks: List[Block]) -> int:
+        """Returns how many of the given blocks (in chain order) are the assume-valid block or its ancestors."""
+        if self.assume_valid is None or self.assume_valid in self.chain_index:
+            # once the assume-valid block is on our chain, every new block is its descendant (or on another branch)
+            return 0
+        for position in range(len(blocks) - 1, -1, -1):
+            if blocks[position].get_block_hash() == self.assume_valid:
+                return position + 1
+        return 0
 
     def validate_block(self, block: Block) -> bool:
         """
@@ -194,6 +1123,10 @@ class Node:
         if len(block.get_transactions()) > BLOCK_SIZE:
             return False
 
+        # Check the proof of work
+        if self.pow_target is not None and not check_proof_of_work(block.get_block_hash(), self.pow_target):
+            return False
+
         # Only one coinbase transaction allowed per block
         coinbase_count = sum(1 for tx in block.get_transactions() if tx.input is None)
         if coinbase_count > 1:
@@ -220,22 +1153,19 @@ class Node:
                 return False
             spent_txids.add(tx.input)
 
-            # For regular transactions, find the UTXO being spent
-            utxo = None
-            for prev_block in self.blockchain:
-                for prev_tx in prev_block.get_transactions():
-                    if prev_tx.get_txid() == tx.input:
-                        utxo = prev_tx
-                        break
-                if utxo:
-                    break
+            # For regular transactions, find the UTXO being spent (the UTXO set is at the block's parent)
+            utxo = self.utxos.get(tx.input)
 
             # Check if we found the UTXO
             if utxo is None:
                 return False
 
-            # Verify the signature
+            # Verify the signature, unless the block is an ancestor of the assume-valid block
+            if self._skip_signature_checks:
+                self.validation_stats["signatures_skipped"] += 1
+                continue
             message = tx.input + tx.output
+            self.validation_stats["signatures_verified"] += 1
             if not verify(message, tx.signature, utxo.output):
                 return False
 
@@ -251,11 +1181,7 @@ class Node:
             return True
 
         # Find the UTXO being spent
-        utxo = None
-        for tx in self.utxos:
-            if tx.get_txid() == transaction.input:
-                utxo = tx
-                break
+        utxo = self.utxos.get(transaction.input)
 
         # Check if UTXO exists and verify signature
         if utxo is None:
@@ -269,17 +1195,30 @@ class Node:
         Updates the mempool and UTXO set based on the transactions in the given block.
         """
         # Remove spent transactions from UTXOs and add new ones
+        spent: List[Transaction] = []
         for tx in block.get_transactions():
             # Remove spent UTXO
             if tx.input is not None:  # Skip coinbase transactions
-                self.utxos = [utxo for utxo in self.utxos if utxo.get_txid() != tx.input]
+                coin = self._remove_utxo(tx.input)
+                if coin is not None:
+                    spent.append(coin)
 
             # Add new UTXO
-            self.utxos.append(tx)
+            self._add_utxo(tx)
+
+        # Remember the spent coins, to disconnect the block in a reorg (one storage batch per block)
+        block_hash = block.get_block_hash()
+        if self.storage is not None:
+            self.storage.update_utxos([coin.get_txid() for coin in spent], block.get_transactions())
+            self.storage.put_undo(block_hash, spent)
+        else:
+            self.block_undo[block_hash] = spent
 
-        # Remove transactions from mempool that are now in the block
-        block_txids = {tx.get_txid() for tx in block.get_transactions()}
-        self.mem_pool = [tx for tx in self.mem_pool if tx.get_txid() not in block_txids]
+        for index in self._get_tx_indexes():
+            index.connect_block(block, spent)
+
+        # Remove transactions from mempool that are now in the block (or that spend the same coins)
+        self.mem_pool.remove_for_block(block)
 
     def mine_block(self) -> Optional[BlockHash]:
         """
@@ -290,36 +1229,177 @@ class Node:
         Money creation transactions have None as their input, and instead of a signature, contain 48 random bytes.
         If a new block is created, all connections of this node are notified by calling their notify_of_block() method.
         The method returns the new block hash (or None if there was no block)
+        If the node has a proof-of-work target, the block is only created once a nonce that meets it is found.
+        A competing block arriving meanwhile (from another thread, see mining_unlocked) cancels the search, and no
+        block is created.
         """
-        # Create coinbase transaction
-        coinbase_tx = Transaction(self.public_key, None, Signature(secrets.token_bytes(64)))
-
-        # Get transactions from mempool (up to BLOCK_SIZE-1)
-        block_txs = [coinbase_tx]
-        if len(self.mem_pool) > 0:
-            block_txs.extend(self.mem_pool[:BLOCK_SIZE - 1])
-
-        # Create and add the block
-        block = Block(self.latest_block_hash, block_txs)
-        self.blockchain.append(block)
-        self.update_mempool_and_utxo(block)
-        self.latest_block_hash = block.get_block_hash()
-
-        # Notify neighbors
-        for node in self.connections:
-            node.notify_of_block(block.get_block_hash(), self)
-
-        return block.get_block_hash()
+        with self._span("mine_block"):
+            # Create coinbase transaction
+            coinbase_tx = Transaction(self.public_key, None, Signature(random_bytes(64)))
+
+            # Get transactions from mempool (up to BLOCK_SIZE-1)
+            block_txs = [coinbase_tx]
+            if len(self.mem_pool) > 0:
+                block_txs.extend(self.mem_pool.get_transactions(BLOCK_SIZE - 1))
+
+            # Create the block, and find its proof of work if needed
+            prev_block_hash = self.latest_block_hash
+            block = Block(prev_block_hash, block_txs)
+            if self.pow_target is not None:
+                self.mining_cancelled.clear()
+                with self.mining_unlocked() if self.mining_unlocked is not None else nullcontext():
+                    nonce = self._find_nonce(block)
+                if nonce is None or self.latest_block_hash != prev_block_hash:
+                    # Mining was cancelled, or the tip changed while the node was unlocked: a competing block arrived
+                    return None
+                block.nonce = nonce
+            block = self._seal(block)
+
+            # Add the block
+            block_hash = self._append_block(block)
+            self.update_mempool_and_utxo(block)
+            self.latest_block_hash = block_hash
+            self._commit_storage()
+
+            # Notify neighbors
+            for node in self.connections:
+                self._announce_block(block_hash, node)
+
+            return block_hash
+
+    def _find_nonce(self, block: Block) -> Optional[int]:
+        """Searches for a nonce that gives the block a hash below the target. Returns None if cancelled."""
+        assert self.pow_target is not None
+        if self.miner is not None:
+            return self.miner.find_nonce(block.get_hash_prefix(), self.pow_target)
+        return search_nonce(block.get_hash_prefix(), self.pow_target, 0, NONCE_LIMIT, self.mining_cancelled)[0]
+
+    def _cancel_mining(self) -> None:
+        """Stops a nonce search running in mine_block (on another thread), if there is one."""
+        self.mining_cancelled.set()
+        if self.miner is not None:
+            self.miner.cancel()
 
     def get_block(self, block_hash: BlockHash) -> Block:
         """
         This function returns a block object given its hash.
-        If the block doesn't exist, a ValueError is raised.
+        If the block doesn't exist, a ValueError is raised (a PrunedBlockError if this node pruned its body).
         """
+        height = self.chain_index.get(block_hash)
+        if not isinstance(self._blockchain, list):
+            # Stored and pruned chains are only changed through the index, so there is nothing else to look at
+            if height is None:
+                raise ValueError(f"Block with hash {block_hash!r} not found")
+            return self._blockchain[height]
+        if height is not None and height < len(self.blockchain):
+            block = self.blockchain[height]
+            if block.get_block_hash() == block_hash:
+                return block
+        # The index is stale if blocks were modified in place, so fall back to scanning the chain
         for block in self.blockchain:
             if block.get_block_hash() == block_hash:
                 return block
-        raise ValueError(f"Block with hash {block_hash} not found")
+        raise ValueError(f"Block with hash {block_hash!r} not found")
+
+    def get_blocks(self, block_hashes: List[BlockHash]) -> List[Block]:
+        """
+        This function returns the blocks with the given hashes, in the same order.
+        If any of the blocks doesn't exist, a ValueError is raised.
+        """
+        with self._span("get_blocks", count=len(block_hashes)):
+            return [self.get_block(block_hash) for block_hash in block_hashes]
+
+    def get_compact_block(self, block_hash: BlockHash) -> CompactBlock:
+        """
+        This function returns the compact form of the block with the given hash (see notify_of_compact_block).
+        If the block doesn't exist, a ValueError is raised.
+        """
+        return CompactBlock.from_block(self.get_block(block_hash))
+
+    def get_block_transactions(self, block_hash: BlockHash, indexes: List[int]) -> List[Transaction]:
+        """
+        This function returns the transactions at the given positions of the block with the given hash.
+        If the block doesn't exist or an index is out of range, a ValueError is raised.
+        """
+        transactions = self.get_block(block_hash).get_transactions()
+        if any(not 0 <= index < len(transactions) for index in indexes):
+            raise ValueError("Transaction index out of range")
+        return [transactions[index] for index in indexes]
+
+    def get_headers(self, locator: List[BlockHash], stop: Optional[BlockHash] = None) -> List[BlockHeader]:
+        """
+        This function returns the headers of the blocks on this node's chain that follow the first hash
+        in the locator that is on this chain (or that follow genesis if none of them is).
+        At most MAX_HEADERS_PER_REQUEST headers are returned, and the list ends early at the block whose hash is stop.
+        """
+        with self._span("get_headers"):
+            start = 0
+            for block_hash in locator:
+                height = self._get_height(block_hash)
+                if height is not None:
+                    start = height + 1
+                    break
+
+            headers: List[BlockHeader] = []
+            for height in range(start, min(start + MAX_HEADERS_PER_REQUEST, len(self.blockchain))):
+                header = self._get_header_at(height)
+                headers.append(header)
+                if header.get_block_hash() == stop:
+                    break
+            return headers
+
+    def get_filters(self, start: int, stop: BlockHash) -> List[bytes]:
+        """
+        This function returns the compact filters of the blocks on this node's chain from the given height up to
+        and including the block whose hash is stop (at most MAX_FILTERS_PER_REQUEST filters).
+        A ValueError is raised if stop is not on the chain, the range is invalid or too long,
+        or the node has no block filters.
+        """
+        if self.filter_index is None:
+            raise ValueError("Block filters are not enabled")
+        stop_height = self._get_height(stop)
+        if stop_height is None or not 0 <= start <= stop_height:
+            raise ValueError("Invalid filter range")
+        if stop_height - start + 1 > MAX_FILTERS_PER_REQUEST:
+            raise ValueError(f"At most {MAX_FILTERS_PER_REQUEST} filters can be requested at once")
+        filters = []
+        for height in range(start, stop_height + 1):
+            block_hash = self._get_hash_at(height)
+            if block_hash not in self.filter_index:
+                # the chain was replaced without connecting its blocks (e.g. loaded from storage)
+                self.filter_index.add(self._blockchain[height])
+            filters.append(self.filter_index.get(block_hash))
+        return filters
+
+    def get_transaction_location(self, txid: TxID) -> Optional[Tuple[BlockHash, int]]:
+        """
+        This function returns the hash of the block of our chain that holds the transaction with the given txid,
+        and its position in the block, or None if it is not on our chain.
+        A ValueError is raised if the node has no tx index (see enable_tx_index).
+        """
+        if self.tx_index is None:
+            raise ValueError("The tx index is not enabled")
+        return self.tx_index.get(txid)
+
+    def get_address_history(self, address: PublicKey) -> List[TxID]:
+        """
+        This function returns the txids of the transactions on our chain that paid the given address or spent one
+        of its coins, in chain order.
+        A ValueError is raised if the node has no address index (see enable_address_index).
+        """
+        if self.address_index is None:
+            raise ValueError("The address index is not enabled")
+        return self.address_index.get(address)
+
+    def get_chain_tips(self) -> Dict[BlockHash, int]:
+        """
+        This function returns the tip of this node's chain and the tips of the side chains it keeps,
+        with the length of the chain each of them ends.
+        """
+        tips = self.side_chains.get_tips()
+        if self.blockchain:
+            tips[self.latest_block_hash] = len(self.blockchain)
+        return tips
 
     def get_latest_hash(self) -> BlockHash:
         """
@@ -331,13 +1411,13 @@ class Node:
         """
         This function returns the list of transactions that didn't enter any block yet.
         """
-        return self.mem_pool
+        return self.mem_pool.get_transactions()
 
     def get_utxo(self) -> List[Transaction]:
         """
         This function returns the list of unspent transactions.
         """
-        return self.utxos
+        return list(self.utxos.values())
 
     # ------------ Formerly wallet methods: -----------------------
 
@@ -354,29 +1434,23 @@ class Node:
         if target is None:
             return None
 
-        # Find an unspent transaction that we own and haven't tried to spend yet
-        for utxo in self.utxos:
-            # Skip if we've already tried to spend this UTXO
-            if any(tx.input == utxo.get_txid() for tx in self.mem_pool):
-                continue
-
-            # Check if we own this UTXO
-            if utxo.output == self.public_key:
-                # Create and sign the transaction
-                txid = utxo.get_txid()
-                message = txid + target
-                signature = sign(message, self.private_key)
-                new_tx = Transaction(target, txid, signature)
-                if self.add_transaction_to_mempool(new_tx):
-                    return new_tx
-
+        # Try the coins that we own and haven't tried to spend yet, oldest first. A rejected transaction leaves the
+        # index unchanged, and we return as soon as one is accepted, so iterating over the index is safe.
+        for coin in self.owned_coins.spendable.values():
+            # Create and sign the transaction (entering the mempool marks the coin as pending)
+            txid = coin.get_txid()
+            message = txid + target
+            signature = sign(message, self.private_key)
+            new_tx = Transaction(target, txid, signature)
+            if self.add_transaction_to_mempool(new_tx):
+                return new_tx
         return None
 
     def clear_mempool(self) -> None:
         """
         Clears the mempool of this node. All transactions waiting to be entered into the next block are gone.
         """
-        self.mem_pool = []
+        self.mem_pool.clear()
 
     def get_balance(self) -> int:
         """
@@ -384,11 +1458,7 @@ class Node:
         Coins that the node owned and sent away will still be considered as part of the balance until the spending
         transaction is in the blockchain.
         """
-        balance = 0
-        for utxo in self.utxos:
-            if utxo.output == self.public_key:
-                balance += 1
-        return balance
+        return self.owned_coins.get_balance()
 
     def get_address(self) -> PublicKey:
         """
@@ -0,0 +1,115 @@
+from .utils import BlockHash
+from .block import Block
+from typing import Any, Dict, List, Optional
+
+# The default number of blocks an orphan pool holds before it starts evicting the oldest ones.
+DEFAULT_MAX_ORPHANS = 1000
+
+
+class OrphanPool:
+    """
+    Holds downloaded blocks that could not be connected yet, because their parent is unknown
+    (or because the rest of their chain failed to download). The blocks are keyed by the hash of their
+    parent, so that once the parent connects, its waiting descendants can be connected without refetching them.
+    The pool is bounded: when it is full, the block that was added first is evicted.
+    The peer that served each block is kept with it, so that it is the one penalised if the block turns out invalid.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_ORPHANS) -> None:
+        self.max_size = max_size
+        # insertion ordered, so the first key is the oldest orphan
+        self.blocks: Dict[BlockHash, Block] = {}
+        self.children: Dict[BlockHash, List[BlockHash]] = {}
+        self.sources: Dict[BlockHash, Any] = {}
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __contains__(self, block_hash: BlockHash) -> bool:
+        return block_hash in self.blocks
+
+    def add(self, block: Block, source: Any = None) -> None:
+        """Adds a block served by the given peer (None if unknown), evicting the oldest block if the pool is full."""
+        block_hash = block.get_block_hash()
+        if block_hash in self.blocks or self.max_size <= 0:
+            return
+        while len(self.blocks) >= self.max_size:
+            self.remove(next(iter(self.blocks)))
+            self.evictions += 1
+        self.blocks[block_hash] = block
+        self.sources[block_hash] = source
+        self.children.setdefault(block.get_prev_block_hash(), []).append(block_hash)
+
+    def remove(self, block_hash: BlockHash) -> Optional[Block]:
+        """Removes a block from the pool and returns it (or None if it wasn't there)."""
+        block = self.blocks.pop(block_hash, None)
+        if block is not None:
+            del self.sources[block_hash]
+            siblings = self.children[block.get_prev_block_hash()]
+            siblings.remove(block_hash)
+            if not siblings:
+                del self.children[block.get_prev_block_hash()]
+        return block
+
+    def lookup(self, block_hash: BlockHash) -> Optional[Block]:
+        """Returns the block with the given hash if it is in the pool. Counts towards the hit rate."""
+        self.lookups += 1
+        block = self.blocks.get(block_hash)
+        if block is not None:
+            self.hits += 1
+        return block
+
+    def get_source(self, block_hash: BlockHash) -> Any:
+        """Returns the peer that served the block (None if unknown or if the block is not in the pool)."""
+        return self.sources.get(block_hash)
+
+    def take_longest_branch(self, parent_hash: BlockHash) -> List[Block]:
+        """
+        Removes and returns the longest chain of orphans that builds on the given block, in chain order.
+        Orphans on shorter branches from the same parent stay in the pool.
+        """
+        branch_blocks = self.get_longest_branch(parent_hash)
+        for block in branch_blocks:
+            self.remove(block.get_block_hash())
+        return branch_blocks
+
+    def get_longest_branch(self, parent_hash: BlockHash) -> List[Block]:
+        """
+        Same as take_longest_branch, but leaves the blocks in the pool (with their sources), e.g. until they
+        are connected.
+        """
+        # breadth first search from the parent, remembering how each orphan was reached
+        reached_from: Dict[BlockHash, BlockHash] = {}
+        deepest = parent_hash
+        frontier = [parent_hash]
+        while frontier:
+            deepest = frontier[0]
+            next_frontier = []
+            for block_hash in frontier:
+                for child in self.children.get(block_hash, []):
+                    reached_from[child] = block_hash
+                    next_frontier.append(child)
+            frontier = next_frontier
+
+        best: List[BlockHash] = []
+        while deepest != parent_hash:
+            best.append(deepest)
+            deepest = reached_from[deepest]
+        best.reverse()
+
+        branch_blocks = [self.blocks[block_hash] for block_hash in best]
+        self.hits += len(branch_blocks)
+        self.lookups += len(branch_blocks)
+        return branch_blocks
+
+    def get_hit_rate(self) -> float:
+        """The fraction of lookups that found the block in the pool (so it did not have to be fetched)."""
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def get_stats(self) -> Dict[str, float]:
+        """Returns the current size of the pool and its hit statistics."""
+        return {"size": len(self.blocks), "max_size": self.max_size, "lookups": self.lookups,
+                "hits": self.hits, "hit_rate": self.get_hit_rate(), "evictions": self.evictions}
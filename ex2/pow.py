@@ -0,0 +1,134 @@
+"""
+Optional proof of work. A node with a difficulty target only accepts blocks whose hash, read as a big endian
+number, is below the target, and mines by searching for a nonce that gives such a hash.
+The search runs in the calling process, or across a pool of processes with ProofOfWorkMiner.
+Either search stops early when it is cancelled (e.g. because a competing block arrived).
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Optional, Set, Tuple
+
+from .block import NONCE_SIZE
+from .utils import BlockHash
+
+# The largest possible nonce (+1).
+NONCE_LIMIT = 2 ** (8 * NONCE_SIZE)
+# How many nonces a search tries between checks of its cancellation flag.
+CANCEL_CHECK_INTERVAL = 1024
+# How many nonces a worker process tries per task.
+DEFAULT_CHUNK_SIZE = 200000
+
+
+def target_from_bits(difficulty_bits: int) -> int:
+    """Returns the target that requires the given number of leading zero bits in a block hash."""
+    return 2 ** (256 - difficulty_bits)
+
+
+def check_proof_of_work(block_hash: BlockHash, target: int) -> bool:
+    """Checks whether the block hash is below the target."""
+    return int.from_bytes(block_hash, "big") < target
+
+
+def search_nonce(prefix: bytes, target: int, start: int, stop: int,
+                 cancel: Optional[Any] = None) -> Tuple[Optional[int], int]:
+    """
+    Tries the nonces in range(start, stop) after the given prefix (see Block.get_hash_prefix).
+    Returns the first nonce giving a hash below the target (or None), and the number of hashes computed.
+    cancel is a threading or multiprocessing Event; the search returns None soon after it is set.
+    """
+    base = hashlib.sha256(prefix)
+    for nonce in range(start, min(stop, NONCE_LIMIT)):
+        if cancel is not None and (nonce - start) % CANCEL_CHECK_INTERVAL == 0 and cancel.is_set():
+            return None, nonce - start
+        hasher = base.copy()
+        hasher.update(nonce.to_bytes(NONCE_SIZE, "big"))
+        if int.from_bytes(hasher.digest(), "big") < target:
+            return nonce, nonce - start + 1
+    return None, max(0, min(stop, NONCE_LIMIT) - start)
+
+
+# the cancellation flag of a worker process, set by the pool initializer
+_worker_cancel: Optional[Any] = None
+
+
+def _init_worker(cancel: Any) -> None:
+    global _worker_cancel
+    _worker_cancel = cancel
+
+
+def _search_chunk(prefix: bytes, target: int, start: int, stop: int) -> Tuple[Optional[int], int]:
+    return search_nonce(prefix, target, start, stop, _worker_cancel)
+
+
+class ProofOfWorkMiner:
+    """
+    Searches the nonce space across a pool of worker processes. Each worker gets ranges of chunk_size nonces
+    until one of them finds a nonce, the search is cancelled, or the nonces run out.
+    The hash counters accumulate over all searches, for measuring hashes per second.
+    """
+
+    def __init__(self, processes: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.cancel_event = multiprocessing.Event()
+        # whether cancel() was called during the current search (the event is also set when a search ends)
+        self.cancelled = False
+        self.executor = ProcessPoolExecutor(self.processes, initializer=_init_worker,
+                                            initargs=(self.cancel_event,))
+        self.lock = threading.Lock()
+        self.hashes = 0
+        self.seconds = 0.0
+
+    def find_nonce(self, prefix: bytes, target: int, start: int = 0,
+                   stop: int = NONCE_LIMIT) -> Optional[int]:
+        """Returns a nonce in range(start, stop) that gives a hash below the target,
+        or None if there is none or the search was cancelled."""
+        with self.lock:
+            self.cancelled = False
+            self.cancel_event.clear()
+            began = time.perf_counter()
+            running: Set[Future] = set()
+            next_start = start
+            found: Optional[int] = None
+            try:
+                while found is None and not self.cancel_event.is_set():
+                    while len(running) < self.processes and next_start < stop:
+                        chunk_stop = min(next_start + self.chunk_size, stop)
+                        running.add(self.executor.submit(_search_chunk, prefix, target, next_start, chunk_stop))
+                        next_start = chunk_stop
+                    if not running:
+                        break
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        nonce, hashes = future.result()
+                        self.hashes += hashes
+                        if nonce is not None and (found is None or nonce < found):
+                            found = nonce
+            finally:
+                # stop the other workers and wait for them, so the next search starts clean
+                self.cancel_event.set()
+                for future in running:
+                    nonce, hashes = future.result()
+                    self.hashes += hashes
+                    if nonce is not None and (found is None or nonce < found):
+                        found = nonce
+                self.seconds += time.perf_counter() - began
+            # a nonce found by a worker that had not seen the cancellation yet is stale as well
+            return None if self.cancelled else found
+
+    def cancel(self) -> None:
+        """Stops the current search (if any). find_nonce then returns None."""
+        self.cancelled = True
+        self.cancel_event.set()
+
+    def get_hash_rate(self) -> float:
+        """The average number of hashes per second over all searches so far."""
+        return self.hashes / self.seconds if self.seconds else 0.0
+
+    def close(self) -> None:
+        self.cancel()
+        self.executor.shutdown()
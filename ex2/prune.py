@@ -0,0 +1,109 @@
+"""
+Block-body pruning: validation only needs the UTXO set, and reorgs only need the bodies of the blocks they
+disconnect, so a pruned node keeps the headers of its whole chain but the bodies of only its most recent blocks.
+See Node.enable_pruning.
+"""
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Union, overload
+
+from .block import Block, BlockHeader
+from .utils import BlockHash
+
+# The smallest number of recent block bodies a pruned node keeps. It bounds the depth of the reorgs it can follow.
+MIN_KEPT_BLOCKS = 10
+
+
+class PrunedBlockError(ValueError):
+    """Raised when the body of a block was pruned. A ValueError, like any other request for a block we can't serve."""
+
+
+class PrunedChain:
+    """
+    The blocks of a node's current chain with only the last keep bodies in memory, and the headers of all blocks.
+    Behaves like the list of blocks it replaces (len, indexing, slicing, iteration, concatenation with a list, append
+    and deleting a tail); accessing a pruned body raises PrunedBlockError.
+    """
+
+    def __init__(self, blocks: List[Block], keep: int) -> None:
+        if keep < MIN_KEPT_BLOCKS:
+            raise ValueError(f"A pruned node keeps at least {MIN_KEPT_BLOCKS} blocks")
+        self.keep = keep
+        self.headers: List[BlockHeader] = []
+        self.bodies: Deque[Block] = deque()
+        # the height of the oldest block whose body is kept
+        self.first_body_height = 0
+        for block in blocks:
+            self.append(block)
+
+    @staticmethod
+    def from_headers(headers: List[BlockHeader], keep: int) -> 'PrunedChain':
+        """A chain of the given headers whose bodies are all missing (e.g. below a UTXO snapshot, see snapshot.py)."""
+        chain = PrunedChain([], keep)
+        chain.headers = list(headers)
+        chain.first_body_height = len(headers)
+        return chain
+
+    def get_hash(self, height: int) -> BlockHash:
+        """Returns the hash of the block at the given height, whether or not its body was pruned."""
+        return self.headers[height].get_block_hash()
+
+    def get_header(self, height: int) -> BlockHeader:
+        """Returns the header of the block at the given height, whether or not its body was pruned."""
+        return self.headers[height]
+
+    def is_pruned(self, height: int) -> bool:
+        """Checks whether the body of the block at the given (non negative) height was pruned."""
+        return height < self.first_body_height
+
+    def _get_body(self, height: int) -> Block:
+        if height < 0:
+            height += len(self.headers)
+        if not 0 <= height < len(self.headers):
+            raise IndexError("chain index out of range")
+        if self.is_pruned(height):
+            raise PrunedBlockError(f"The body of block {self.get_hash(height)!r} was pruned")
+        return self.bodies[height - self.first_body_height]
+
+    def __len__(self) -> int:
+        return len(self.headers)
+
+    @overload
+    def __getitem__(self, index: int) -> Block: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Block]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Block, List[Block]]:
+        if isinstance(index, slice):
+            return [self._get_body(height) for height in range(*index.indices(len(self.headers)))]
+        return self._get_body(index)
+
+    def __iter__(self) -> Iterator[Block]:
+        return iter(self[:])
+
+    def __bool__(self) -> bool:
+        return bool(self.headers)
+
+    def __add__(self, other: List[Block]) -> List[Block]:
+        return self[:] + other
+
+    def append(self, block: Block) -> Optional[BlockHash]:
+        """Adds the block at the tip. Returns the hash of the block whose body was pruned to make room, if any."""
+        block_hash = block.get_block_hash()
+        self.headers.append(BlockHeader(block_hash, block.get_prev_block_hash(), block.get_nonce()))
+        self.bodies.append(block)
+        if len(self.bodies) > self.keep:
+            self.bodies.popleft()
+            self.first_body_height += 1
+            return self.get_hash(self.first_body_height - 1)
+        return None
+
+    def __delitem__(self, index: slice) -> None:
+        if (not isinstance(index, slice) or index.stop is not None or index.step is not None or
+                (index.start or 0) < 0):
+            raise ValueError("Only the tail of the chain can be removed")
+        start = index.start or 0
+        del self.headers[start:]
+        while len(self.bodies) > 0 and self.first_body_height + len(self.bodies) > start:
+            self.bodies.pop()
+        self.first_body_height = min(self.first_body_height, start)
@@ -0,0 +1,57 @@
+"""
+Batched transaction relay: instead of sending every transaction to a neighbor as soon as it enters the mempool,
+a node collects the transactions for each neighbor and sends them together in one notify_of_transactions call
+(or message), when the batch is full or when the oldest transaction in it has waited long enough.
+"""
+import itertools
+from typing import Any, Dict, List
+
+from .transaction import Transaction
+
+# The default number of transactions in a batch, at which it is sent right away.
+DEFAULT_MAX_BATCH = 50
+# The default number of seconds (on the scheduler's clock) a batch waits for more transactions before it is sent.
+DEFAULT_MAX_DELAY = 0.1
+
+
+class TransactionBatcher:
+    """The transactions waiting to be relayed, per neighbor, in the order they entered the mempool."""
+
+    def __init__(self, max_batch: int = DEFAULT_MAX_BATCH, max_delay: float = DEFAULT_MAX_DELAY) -> None:
+        if max_batch < 1 or max_delay < 0:
+            raise ValueError("A batch holds at least one transaction and can't wait a negative time")
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending: Dict[Any, List[Transaction]] = {}
+        # the id of each waiting batch, so that the timer of a batch that was sent already doesn't send the next one
+        self.batch_ids: Dict[Any, int] = {}
+        self._next_id = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(len(batch) for batch in self.pending.values())
+
+    def add(self, peer: Any, transaction: Transaction) -> int:
+        """Adds a transaction to the peer's batch, and returns the size of the batch."""
+        batch = self.pending.get(peer)
+        if batch is None:
+            batch = self.pending[peer] = []
+            self.batch_ids[peer] = next(self._next_id)
+        batch.append(transaction)
+        return len(batch)
+
+    def take(self, peer: Any) -> List[Transaction]:
+        """Removes the peer's batch and returns it (empty if nothing is waiting for the peer)."""
+        self.batch_ids.pop(peer, None)
+        return self.pending.pop(peer, [])
+
+    def get_batch_id(self, peer: Any) -> int:
+        """The id of the batch waiting for the peer (a batch started after it was sent gets another id)."""
+        return self.batch_ids[peer]
+
+    def is_pending(self, peer: Any, batch_id: int) -> bool:
+        """Checks whether the batch with the given id is still waiting for the peer."""
+        return self.batch_ids.get(peer) == batch_id
+
+    def get_peers(self) -> List[Any]:
+        """The peers that have transactions waiting."""
+        return list(self.pending)
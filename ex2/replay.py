@@ -0,0 +1,220 @@
+"""
+Recording and replay of the events of a network of nodes on a scheduler, to profile and compare changes to Node on
+exactly the same inputs.
+
+A Recorder logs every message the scheduler delivers, and every block mined and transaction created by a node,
+in order, to a gzip compressed file of compact binary records. A Replayer rebuilds the network from the same
+deterministic seed (see utils.deterministic_randomness), so the nodes get the same keys, and feeds them the same
+events in the same order: messages are handed to their receivers directly, and what the nodes send in response is
+dropped, since the messages that were delivered are in the recording. Requests (get_blocks, get_headers, ...)
+are answered by the replayed peers, whose state at that point is the same as in the recorded run.
+Only runs that start from fresh nodes, created right after setting the seed, can be replayed.
+"""
+import gzip
+import json
+import random
+import struct
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .compact import CompactBlock
+from .node import Node
+from .scheduler import Message, Scheduler
+from .storage import deserialize_transaction, serialize_transaction
+from .transaction import Transaction
+from .transport import decode_header, encode_header, pack_list, unpack_list
+from .utils import BlockHash, PublicKey, deterministic_randomness
+
+# The gzip level of recordings (fast, since recording runs alongside the simulation).
+RECORDING_COMPRESSION = 1
+# The first bytes of a recording, followed by the length of its JSON header.
+MAGIC = b"EX2REC1\n"
+
+# Event kinds
+BLOCK = 1  # a block announcement (notify_of_block)
+COMPACT_BLOCK = 2  # a compact block announcement (notify_of_compact_block)
+TRANSACTION = 3  # a transaction (notify_of_transaction)
+TRANSACTIONS = 4  # a batch of transactions (notify_of_transactions)
+MINE = 5  # the node mined a block
+PAY = 6  # the node created a transaction to the address in the payload
+TIP = 7  # the tip of the node when the recording was closed
+
+_MESSAGE_KINDS = {Message.BLOCK: BLOCK, Message.COMPACT_BLOCK: COMPACT_BLOCK, Message.TRANSACTION: TRANSACTION,
+                  Message.TRANSACTIONS: TRANSACTIONS}
+# kind, time, sender (or the node, for local events), receiver, payload length
+_RECORD = struct.Struct(">BdHHI")
+_LENGTH = struct.Struct(">I")
+_INDEX = struct.Struct(">H")
+
+# kind, time, sender, receiver, payload
+Event = Tuple[int, float, int, int, bytes]
+
+
+def encode_compact_block(compact_block: CompactBlock) -> bytes:
+    prefilled = [_INDEX.pack(index) + serialize_transaction(tx) for index, tx in compact_block.prefilled]
+    return pack_list([encode_header(compact_block.get_header()), pack_list(prefilled),
+                      pack_list(compact_block.short_ids)])
+
+
+def decode_compact_block(data: bytes) -> CompactBlock:
+    header, prefilled, short_ids = unpack_list(data)
+    return CompactBlock(decode_header(header),
+                        [(_INDEX.unpack_from(item)[0], deserialize_transaction(item[_INDEX.size:]))
+                         for item in unpack_list(prefilled)],
+                        unpack_list(short_ids))
+
+
+class Recorder:
+    """
+    Records the events of the given nodes, which must be fresh nodes created from a generator seeded with seed,
+    attached to the scheduler and connected along the given links (pairs of node indexes), and nothing else.
+    Call close() at the end of the run, which also records the tip of every node.
+    """
+
+    def __init__(self, path: str, nodes: List[Node], links: List[Tuple[int, int]], scheduler: Scheduler,
+                 seed: int) -> None:
+        if any(node.blockchain or len(node.mem_pool) for node in nodes):
+            raise ValueError("Only runs that start from fresh nodes can be recorded")
+        self.nodes = nodes
+        self.scheduler = scheduler
+        self.index = {node: i for i, node in enumerate(nodes)}
+        self.events = 0
+        self.file = gzip.open(path, "wb", compresslevel=RECORDING_COMPRESSION)
+        header = json.dumps({"seed": seed, "nodes": len(nodes), "links": [list(link) for link in links]}).encode()
+        self.file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        scheduler.listeners.append(self._record_message)
+        for node in nodes:
+            self._wrap(node)
+
+    def _write(self, kind: int, sender: int, receiver: int, payload: bytes) -> None:
+        now = getattr(self.scheduler, "now", 0.0)
+        self.file.write(_RECORD.pack(kind, now, sender, receiver, len(payload)) + payload)
+        self.events += 1
+
+    def _record_message(self, message: Message, now: float) -> None:
+        if message.kind == Message.COMPACT_BLOCK:
+            payload = encode_compact_block(message.payload)
+        elif message.kind == Message.TRANSACTION:
+            payload = serialize_transaction(message.payload)
+        elif message.kind == Message.TRANSACTIONS:
+            payload = pack_list([serialize_transaction(tx) for tx in message.payload])
+        else:
+            payload = message.payload
+        self._write(_MESSAGE_KINDS[message.kind], self.index[message.sender], self.index[message.receiver], payload)
+
+    def _wrap(self, node: Node) -> None:
+        """Records the blocks the node mines and the transactions it creates, before they happen."""
+        mine_block = node.mine_block
+        create_transaction = node.create_transaction
+        index = self.index[node]
+
+        def recorded_mine_block() -> Optional[BlockHash]:
+            self._write(MINE, index, index, b"")
+            return mine_block()
+
+        def recorded_create_transaction(target: PublicKey) -> Optional[Transaction]:
+            self._write(PAY, index, index, target)
+            return create_transaction(target)
+        node.mine_block = recorded_mine_block  # type: ignore
+        node.create_transaction = recorded_create_transaction  # type: ignore
+
+    def close(self) -> None:
+        self.scheduler.listeners.remove(self._record_message)
+        for node in self.nodes:
+            del node.mine_block  # type: ignore
+            del node.create_transaction  # type: ignore
+            self._write(TIP, self.index[node], self.index[node], node.get_latest_hash())
+        self.file.close()
+
+
+class ReplayScheduler(Scheduler):
+    """Attached to replayed nodes: counts the messages they send, and drops them."""
+
+    def send(self, message: Message) -> None:
+        self._count_sent(message)
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        pass
+
+
+class Replayer:
+    """Reads a recording, and replays it against new nodes (see run)."""
+
+    def __init__(self, path: str) -> None:
+        with gzip.open(path, "rb") as file:
+            data = file.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a recording")
+        offset = len(MAGIC)
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        header = json.loads(data[offset:offset + length])
+        offset += length
+        self.seed: int = header["seed"]
+        self.node_count: int = header["nodes"]
+        self.links: List[Tuple[int, int]] = [(a, b) for a, b in header["links"]]
+        self.events: List[Event] = []
+        self.tips: Dict[int, BlockHash] = {}
+        while offset < len(data):
+            kind, now, sender, receiver, size = _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+            payload = data[offset:offset + size]
+            offset += size
+            if kind == TIP:
+                self.tips[sender] = BlockHash(payload)
+            else:
+                self.events.append((kind, now, sender, receiver, payload))
+        self.stats: Dict[str, Any] = {}
+
+    def _decode(self, kind: int, payload: bytes) -> Any:
+        """The argument of the call that replays an event of the given kind (MINE events have none)."""
+        if kind == MINE:
+            return b""
+        if kind == COMPACT_BLOCK:
+            return decode_compact_block(payload)
+        if kind == TRANSACTION:
+            return deserialize_transaction(payload)
+        if kind == TRANSACTIONS:
+            return [deserialize_transaction(item) for item in unpack_list(payload)]
+        if kind == BLOCK:
+            return BlockHash(payload)
+        if kind == PAY:
+            return PublicKey(payload)
+        raise ValueError(f"Unknown event kind {kind}")
+
+    def run(self, node_factory: Callable[[], Node] = Node) -> List[Node]:
+        """
+        Creates the nodes with node_factory (after setting the recorded seed), replays the events and returns the
+        nodes. The time spent replaying (not counting decoding the recording) is in stats["seconds"].
+        """
+        decoded = [(kind, sender, receiver, self._decode(kind, payload))
+                   for kind, _, sender, receiver, payload in self.events]
+        with deterministic_randomness(random.Random(self.seed)):
+            nodes = [node_factory() for _ in range(self.node_count)]
+            scheduler = ReplayScheduler()
+            scheduler.attach(nodes)
+            for a, b in self.links:
+                nodes[a].connect(nodes[b])
+
+            began = time.perf_counter()
+            for kind, sender, receiver, payload in decoded:
+                node = nodes[receiver]
+                if kind == BLOCK:
+                    node.notify_of_block(payload, nodes[sender])
+                elif kind == COMPACT_BLOCK:
+                    node.notify_of_compact_block(payload, nodes[sender])
+                elif kind == TRANSACTION:
+                    node.notify_of_transaction(payload, nodes[sender])
+                elif kind == TRANSACTIONS:
+                    node.notify_of_transactions(payload, nodes[sender])
+                elif kind == MINE:
+                    node.mine_block()
+                else:
+                    node.create_transaction(payload)
+            self.stats = {"events": len(decoded), "seconds": time.perf_counter() - began,
+                          "messages_sent": scheduler.get_message_count()}
+        return nodes
+
+    def get_mismatched_tips(self, nodes: List[Node]) -> List[int]:
+        """The indexes of the nodes whose tip differs from the one they had at the end of the recorded run."""
+        return [i for i, node in enumerate(nodes) if node.get_latest_hash() != self.tips.get(i)]
@@ -0,0 +1,214 @@
+"""
+Message passing runtime for networks of nodes.
+Without a scheduler, a node announces blocks and transactions by calling its neighbors directly, so one mined
+block recursively runs the whole network inside a single call. A node attached to a scheduler instead sends
+each announcement as a message to the receiver's inbox, and the scheduler delivers the messages one at a time.
+Requests for data (get_block, get_headers, ...) are still answered directly.
+"""
+import asyncio
+import heapq
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# Either a fixed latency (in seconds) for every link, or a function of the sender and receiver.
+Latency = Union[float, Callable[[Any, Any], float]]
+
+
+class Message:
+    """An announcement sent from one node to another."""
+    BLOCK = "block"
+    COMPACT_BLOCK = "compact_block"
+    TRANSACTION = "tx"
+    # a batch of transactions, from a node with batched relay (see relay.py)
+    TRANSACTIONS = "txs"
+
+    def __init__(self, kind: str, payload: Any, sender: Any, receiver: Any) -> None:
+        self.kind = kind
+        self.payload = payload
+        self.sender = sender
+        self.receiver = receiver
+
+    def deliver(self) -> None:
+        """Hands the message to the receiver, by calling the method the sender would have called directly."""
+        if self.kind == Message.BLOCK:
+            self.receiver.notify_of_block(self.payload, self.sender)
+        elif self.kind == Message.COMPACT_BLOCK:
+            self.receiver.notify_of_compact_block(self.payload, self.sender)
+        elif self.kind == Message.TRANSACTION:
+            self.receiver.notify_of_transaction(self.payload, self.sender)
+        elif self.kind == Message.TRANSACTIONS:
+            self.receiver.notify_of_transactions(self.payload, self.sender)
+        else:
+            raise ValueError(f"Unknown message kind {self.kind}")
+
+
+class Scheduler:
+    """Base class of the schedulers: attaches nodes, computes link latencies and counts messages."""
+
+    def __init__(self, latency: Latency = 0.0) -> None:
+        self.latency = latency
+        self.messages_sent: Dict[str, int] = {}
+        self.messages_delivered: Dict[str, int] = {}
+        # called with every message right after it is delivered, and the time of delivery
+        self.listeners: List[Callable[[Message, float], None]] = []
+
+    def attach(self, nodes: Iterable[Any]) -> None:
+        """Makes the given nodes send their announcements through this scheduler."""
+        for node in nodes:
+            node.scheduler = self
+
+    def get_latency(self, message: Message) -> float:
+        if callable(self.latency):
+            return self.latency(message.sender, message.receiver)
+        return self.latency
+
+    def send(self, message: Message) -> None:
+        """Puts a message in the receiver's inbox, to be delivered after the link latency."""
+        raise NotImplementedError
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        """Calls the callback after the given delay (on the scheduler's clock)."""
+        raise NotImplementedError
+
+    def get_message_count(self) -> int:
+        return sum(self.messages_sent.values())
+
+    def _count_sent(self, message: Message) -> None:
+        self.messages_sent[message.kind] = self.messages_sent.get(message.kind, 0) + 1
+
+    def _deliver(self, message: Message, now: float) -> None:
+        message.deliver()
+        self.messages_delivered[message.kind] = self.messages_delivered.get(message.kind, 0) + 1
+        for listener in self.listeners:
+            listener(message, now)
+
+
+class DeterministicScheduler(Scheduler):
+    """
+    Single threaded scheduler with a simulated clock. Messages are delivered in order of arrival time
+    (send time plus link latency), and messages arriving at the same time in the order they were sent,
+    so the same sequence of sends always produces the same sequence of deliveries.
+    Other events (e.g. a simulated workload) can be scheduled on the same clock with call_later.
+    """
+
+    def __init__(self, latency: Latency = 0.0) -> None:
+        super().__init__(latency)
+        self.now = 0.0
+        self.sequence = 0
+        self.queue: List[Tuple[float, int, Union[Message, Callable[[], None]]]] = []
+
+    def send(self, message: Message) -> None:
+        self._count_sent(message)
+        heapq.heappush(self.queue, (self.now + self.get_latency(message), self.sequence, message))
+        self.sequence += 1
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        """Calls the callback when the clock reaches now + delay (in order with the messages due then)."""
+        heapq.heappush(self.queue, (self.now + delay, self.sequence, callback))
+        self.sequence += 1
+
+    def get_inbox_size(self, node: Any) -> int:
+        """The number of messages sent to the given node that were not delivered yet."""
+        return sum(1 for _, _, message in self.queue if isinstance(message, Message) and message.receiver is node)
+
+    def run(self, until: Optional[float] = None, max_messages: Optional[int] = None) -> int:
+        """
+        Delivers messages (and runs scheduled callbacks) until nothing is left, or until the clock would pass
+        the given time, or the given number of messages was delivered. Returns the number of delivered messages.
+        """
+        delivered = 0
+        while self.queue and (max_messages is None or delivered < max_messages):
+            if until is not None and self.queue[0][0] > until:
+                self.now = until
+                break
+            self.now, _, event = heapq.heappop(self.queue)
+            if isinstance(event, Message):
+                self._deliver(event, self.now)
+                delivered += 1
+            else:
+                event()
+        return delivered
+
+
+class AsyncioScheduler(Scheduler):
+    """
+    Scheduler running on an asyncio event loop. Every node gets an asyncio.Queue inbox served by its own task,
+    and messages are put in the inbox after the link latency (in real seconds).
+    Messages must be sent while the event loop is running.
+    """
+
+    def __init__(self, latency: Latency = 0.0) -> None:
+        super().__init__(latency)
+        self.inboxes: Dict[Any, asyncio.Queue] = {}
+        self.workers: List[asyncio.Task] = []
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.start_time: Optional[float] = None
+        self.errors: List[BaseException] = []
+
+    def send(self, message: Message) -> None:
+        loop = asyncio.get_running_loop()
+        if self.start_time is None:
+            self.start_time = loop.time()
+        self._count_sent(message)
+        self.in_flight += 1
+        self.idle.clear()
+        inbox = self._get_inbox(message.receiver)
+        latency = self.get_latency(message)
+        if latency > 0:
+            loop.call_later(latency, inbox.put_nowait, message)
+        else:
+            inbox.put_nowait(message)
+
+    def _get_inbox(self, node: Any) -> asyncio.Queue:
+        inbox = self.inboxes.get(node)
+        if inbox is None:
+            inbox = self.inboxes[node] = asyncio.Queue()
+            self.workers.append(asyncio.get_running_loop().create_task(self._serve(inbox)))
+        return inbox
+
+    async def _serve(self, inbox: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await inbox.get()
+            try:
+                self._deliver(message, loop.time() - (self.start_time or 0.0))
+            except Exception as error:
+                # keep serving the inbox, the error is raised from run_until_idle()
+                self.errors.append(error)
+            finally:
+                self.in_flight -= 1
+                if self.in_flight == 0:
+                    self.idle.set()
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        """Calls the callback after the given number of real seconds. Pending callbacks keep the scheduler busy."""
+        self.in_flight += 1
+        self.idle.clear()
+        asyncio.get_running_loop().call_later(delay, self._run_callback, callback)
+
+    def _run_callback(self, callback: Callable[[], None]) -> None:
+        try:
+            callback()
+        except Exception as error:
+            self.errors.append(error)
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.idle.set()
+
+    async def run_until_idle(self) -> None:
+        """Waits until every message sent so far (and every message they caused) was delivered.
+        Raises the first error a delivery raised, if any."""
+        await self.idle.wait()
+        if self.errors:
+            error, self.errors = self.errors[0], []
+            raise error
+
+    async def close(self) -> None:
+        """Stops the inbox tasks."""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.inboxes = {}
@@ -0,0 +1,245 @@
+"""
+Network simulator: builds a topology of nodes on a DeterministicScheduler, drives it with a random mining and
+transaction workload on the simulated clock, and reports block propagation latency, the stale block rate,
+the CPU time spent validating blocks and the number of messages exchanged.
+Topology, link latencies and workload are drawn from a seeded random generator, so runs with the same
+seed and parameters have the same shape.
+"""
+import contextlib
+import random
+import statistics
+import time
+from typing import Any, ContextManager, Dict, List, Optional, Set, Tuple
+
+from .node import Node
+from .replay import Recorder
+from .scheduler import DeterministicScheduler
+from .tracing import Tracer
+from .utils import BlockHash, GENESIS_BLOCK_PREV, deterministic_randomness
+
+TOPOLOGIES = ("ring", "random", "scale_free")
+
+
+def make_topology(kind: str, count: int, degree: int, rng: random.Random) -> List[Tuple[int, int]]:
+    """
+    Returns the links of a topology of count nodes as pairs of node indexes:
+    ring - every node is linked to the next one.
+    random - a ring, plus random links until every node has about degree links.
+    scale_free - preferential attachment (Barabasi-Albert): every new node links to degree // 2 existing nodes,
+                 chosen with probability proportional to the number of links they already have.
+    """
+    links: Set[Tuple[int, int]] = set()
+
+    def link(a: int, b: int) -> None:
+        if a != b:
+            links.add((min(a, b), max(a, b)))
+
+    if kind == "ring" or kind == "random":
+        for i in range(count):
+            link(i, (i + 1) % count)
+        if kind == "random":
+            neighbors: Dict[int, Set[int]] = {i: set() for i in range(count)}
+            for a, b in links:
+                neighbors[a].add(b)
+                neighbors[b].add(a)
+            for i in range(count):
+                while len(neighbors[i]) < min(degree, count - 1):
+                    other = rng.randrange(count)
+                    if other != i:
+                        link(i, other)
+                        neighbors[i].add(other)
+                        neighbors[other].add(i)
+    elif kind == "scale_free":
+        attach = max(1, degree // 2)
+        # every node appears here once per link it has, so choosing from it prefers well linked nodes
+        endpoints: List[int] = []
+        for i in range(1, min(attach + 1, count)):
+            link(0, i)
+            endpoints += [0, i]
+        for i in range(attach + 1, count):
+            targets: Set[int] = set()
+            while len(targets) < attach:
+                targets.add(rng.choice(endpoints))
+            for target in targets:
+                link(i, target)
+                endpoints += [i, target]
+    else:
+        raise ValueError(f"Unknown topology {kind}, expected one of {TOPOLOGIES}")
+    return sorted(links)
+
+
+def build_network(count: int, links: List[Tuple[int, int]]) -> List[Node]:
+    """Creates count nodes and connects them along the given links."""
+    nodes = [Node() for _ in range(count)]
+    for a, b in links:
+        nodes[a].connect(nodes[b])
+    return nodes
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """The value below which the given fraction of the (non empty) values lie."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Simulation:
+    """
+    A seeded simulation of a network of nodes. Blocks are mined by random nodes at exponentially distributed
+    intervals (mean block_interval), and transactions are created by random nodes that have coins
+    (mean rate tx_rate per second), until the simulated clock reaches duration. Every link gets a latency
+    drawn uniformly from the latency range. After the workload stops, the remaining messages are delivered.
+    A deterministic simulation also draws the keys of the nodes and the coinbases they mine from a generator seeded
+    with the seed (see utils.deterministic_randomness), which is only used while it creates its nodes and while it
+    runs, so that it can be recorded and replayed.
+    """
+
+    def __init__(self, nodes: int = 100, topology: str = "random", degree: int = 8,
+                 latency: Tuple[float, float] = (0.05, 0.2), block_interval: float = 10.0,
+                 tx_rate: float = 1.0, duration: float = 300.0, seed: int = 0, deterministic: bool = False) -> None:
+        self.config: Dict[str, Any] = {"nodes": nodes, "topology": topology, "degree": degree,
+                                       "latency": list(latency), "block_interval": block_interval,
+                                       "tx_rate": tx_rate, "duration": duration, "seed": seed,
+                                       "deterministic": deterministic}
+        self.rng = random.Random(seed)
+        self.links = make_topology(topology, nodes, degree, self.rng)
+        # keys and coinbases continue the same stream from creating the nodes to the end of the run
+        self.key_rng: Optional[random.Random] = random.Random(seed) if deterministic else None
+        with self._randomness():
+            self.nodes = build_network(nodes, self.links)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.link_latency: Dict[Tuple[int, int], float] = {link: self.rng.uniform(*latency) for link in self.links}
+        self.scheduler = DeterministicScheduler(self._get_latency)
+        self.scheduler.attach(self.nodes)
+        self.scheduler.listeners.append(lambda message, now: self._record_tip(message.receiver))
+
+        # mined block hash -> (time mined, index of the miner)
+        self.mined: Dict[BlockHash, Tuple[float, int]] = {}
+        # mined block hash -> times at which nodes first had it on their chain
+        self.arrivals: Dict[BlockHash, List[float]] = {}
+        self.seen: List[Set[BlockHash]] = [set() for _ in self.nodes]
+        self.transactions_created = 0
+        self.validation_seconds = 0.0
+        self.validations = 0
+        for node in self.nodes:
+            self._time_validation(node)
+        self.recorder: Optional[Recorder] = None
+
+    def enable_tracing(self, tracer: Tracer) -> None:
+        """Records the spans of all nodes in the tracer (see tracing.py)."""
+        for node in self.nodes:
+            node.tracer = tracer
+
+    def record(self, path: str) -> Recorder:
+        """Records the run to the given file (see replay.py). The simulation must be deterministic."""
+        if not self.config["deterministic"]:
+            raise ValueError("Only deterministic simulations can be recorded")
+        self.recorder = Recorder(path, self.nodes, self.links, self.scheduler, self.config["seed"])
+        return self.recorder
+
+    def _randomness(self) -> ContextManager[None]:
+        """Draws keys and coinbases from the simulation's generator, if it is deterministic."""
+        if self.key_rng is None:
+            return contextlib.nullcontext()
+        return deterministic_randomness(self.key_rng)
+
+    def _get_latency(self, sender: Node, receiver: Node) -> float:
+        a, b = self.index[sender], self.index[receiver]
+        return self.link_latency[(min(a, b), max(a, b))]
+
+    def _time_validation(self, node: Node) -> None:
+        validate_block = node.validate_block
+
+        def timed_validate_block(block: Any) -> bool:
+            began = time.process_time()
+            try:
+                return validate_block(block)
+            finally:
+                self.validation_seconds += time.process_time() - began
+                self.validations += 1
+        node.validate_block = timed_validate_block  # type: ignore
+
+    def _record_tip(self, node: Node) -> None:
+        """Records the arrival time of every mined block that joined the node's chain since the last call."""
+        seen = self.seen[self.index[node]]
+        block_hash = node.get_latest_hash()
+        while block_hash != GENESIS_BLOCK_PREV and block_hash not in seen:
+            seen.add(block_hash)
+            if block_hash in self.mined:
+                self.arrivals[block_hash].append(self.scheduler.now)
+            block_hash = node.get_block(block_hash).get_prev_block_hash()
+
+    def _mine(self) -> None:
+        miner = self.rng.randrange(len(self.nodes))
+        block_hash = self.nodes[miner].mine_block()
+        if block_hash is not None:
+            self.mined[block_hash] = (self.scheduler.now, miner)
+            self.arrivals[block_hash] = []
+            self._record_tip(self.nodes[miner])
+        self._schedule(self._mine, self.config["block_interval"])
+
+    def _send_transaction(self) -> None:
+        sender = self.nodes[self.rng.randrange(len(self.nodes))]
+        if sender.get_balance() > 0:
+            target = self.nodes[self.rng.randrange(len(self.nodes))]
+            if sender.create_transaction(target.get_address()) is not None:
+                self.transactions_created += 1
+        if self.config["tx_rate"] > 0:
+            self._schedule(self._send_transaction, 1 / self.config["tx_rate"])
+
+    def _schedule(self, event: Any, mean_interval: float) -> None:
+        delay = self.rng.expovariate(1 / mean_interval)
+        if self.scheduler.now + delay < self.config["duration"]:
+            self.scheduler.call_later(delay, event)
+
+    def run(self) -> Dict[str, Any]:
+        """Runs the workload and returns the report (see get_report)."""
+        began = time.perf_counter()
+        self._schedule(self._mine, self.config["block_interval"])
+        if self.config["tx_rate"] > 0:
+            self._schedule(self._send_transaction, 1 / self.config["tx_rate"])
+        with self._randomness():
+            self.scheduler.run()
+        if self.recorder is not None:
+            self.recorder.close()
+        return self.get_report(time.perf_counter() - began)
+
+    def get_report(self, wall_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Returns a JSON serializable report of the run:
+        blocks - mined, stale (mined but not on the final chain of the first node) and the stale rate.
+        propagation - for blocks on the final chain, seconds from mining until 50%, 90% and 100% of the nodes
+                      had the block (mean and 90th percentile over blocks).
+        validation - number of validate_block calls and their CPU time.
+        messages - announcements sent, by kind, in total and per mined block.
+        """
+        final_chain = {block.get_block_hash() for block in self.nodes[0].blockchain}
+        stale = [block_hash for block_hash in self.mined if block_hash not in final_chain]
+        confirmed = sum(1 for block in self.nodes[0].blockchain for tx in block.get_transactions()
+                        if tx.input is not None)
+
+        propagation: Dict[str, Dict[str, float]] = {}
+        for label, fraction in (("p50_nodes", 0.5), ("p90_nodes", 0.9), ("all_nodes", 1.0)):
+            needed = max(1, int(fraction * len(self.nodes)))
+            delays = [sorted(self.arrivals[block_hash])[needed - 1] - self.mined[block_hash][0]
+                      for block_hash in self.mined
+                      if block_hash in final_chain and len(self.arrivals[block_hash]) >= needed]
+            if delays:
+                propagation[label] = {"mean": statistics.mean(delays), "p90": percentile(delays, 0.9)}
+
+        messages = dict(self.scheduler.messages_sent)
+        total_messages = sum(messages.values())
+        return {
+            "config": self.config,
+            "links": len(self.links),
+            "blocks": {"mined": len(self.mined), "stale": len(stale),
+                       "stale_rate": len(stale) / len(self.mined) if self.mined else 0.0,
+                       "final_height": len(self.nodes[0].blockchain)},
+            "consistent": len({node.get_latest_hash() for node in self.nodes}) == 1,
+            "propagation_seconds": propagation,
+            "validation": {"calls": self.validations, "cpu_seconds": self.validation_seconds},
+            "messages": {"by_kind": messages, "total": total_messages,
+                         "per_block": total_messages / len(self.mined) if self.mined else 0.0},
+            "transactions": {"created": self.transactions_created, "confirmed": confirmed},
+            "simulated_seconds": self.scheduler.now,
+            "wall_seconds": wall_seconds,
+        }
@@ -0,0 +1,132 @@
+"""
+UTXO snapshots (assume-UTXO): the UTXO set of a chain at some block, serialized together with the hash of that block
+and a hash of the set's content. A new node configured to trust a (block hash, content hash) pair loads a matching
+snapshot and the headers up to its block, and validates new blocks from there on right away, instead of downloading
+and validating the whole history first. The history below the snapshot is checked afterwards by a SnapshotCheck:
+a separate node syncs the chain up to the snapshot block from genesis, and its UTXO set must hash to the content
+hash, or the node drops the snapshot chainstate and syncs the whole history instead. See Node.load_utxo_snapshot.
+"""
+import hashlib
+import struct
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .storage import deserialize_transaction, serialize_transaction
+from .transaction import Transaction
+from .transport import pack_list, unpack_list
+from .utils import BlockHash
+
+# The first bytes of a serialized snapshot.
+MAGIC = b"EX2UTXO1"
+# The number of blocks of the history that a step of a SnapshotCheck validates.
+CHECK_STEP_BLOCKS = 100
+# The delay between two steps of a SnapshotCheck on the scheduler's clock, which lets the node handle other events.
+CHECK_STEP_DELAY = 0.01
+
+# SnapshotCheck statuses
+PENDING = "pending"  # not started yet
+RUNNING = "running"  # some steps ran
+VALID = "valid"  # the history leads to the snapshot block and to the same UTXO set
+INVALID = "invalid"  # it doesn't (or it couldn't be synced from the peer)
+
+_HEIGHT = struct.Struct(">I")
+
+
+def compute_utxo_hash(utxos: Iterable[Transaction]) -> bytes:
+    """The content hash of a UTXO set: the hash of its coins serialized in txid order (independent of their order)."""
+    hasher = hashlib.sha256()
+    for coin in sorted(utxos, key=lambda coin: coin.get_txid()):
+        hasher.update(serialize_transaction(coin))
+    return hasher.digest()
+
+
+class UtxoSnapshot:
+    """The UTXO set of the chain ending with the given block, at the given height (0 for the first block)."""
+
+    def __init__(self, block_hash: BlockHash, height: int, utxos: List[Transaction]) -> None:
+        self.block_hash = block_hash
+        self.height = height
+        self.utxos = utxos
+        self.content_hash = compute_utxo_hash(utxos)
+
+    def serialize(self) -> bytes:
+        return MAGIC + pack_list([self.block_hash, _HEIGHT.pack(self.height), self.content_hash,
+                                  pack_list([serialize_transaction(coin) for coin in self.utxos])])
+
+    @staticmethod
+    def deserialize(data: bytes) -> 'UtxoSnapshot':
+        """Reads a serialized snapshot. Raises ValueError if it is malformed or its coins don't match its hash."""
+        if not data.startswith(MAGIC):
+            raise ValueError("Not a UTXO snapshot")
+        try:
+            block_hash, height, content_hash, coins = unpack_list(data[len(MAGIC):])
+            snapshot = UtxoSnapshot(BlockHash(block_hash), _HEIGHT.unpack(height)[0],
+                                    [deserialize_transaction(coin) for coin in unpack_list(coins)])
+        except (IndexError, struct.error) as error:
+            raise ValueError(f"Malformed UTXO snapshot: {error}") from error
+        if snapshot.content_hash != content_hash:
+            raise ValueError("The coins of the UTXO snapshot don't match its content hash")
+        return snapshot
+
+
+class SnapshotCheck:
+    """
+    Validates the history below a snapshot: the shadow node (a fresh node of the same kind as the one that loaded
+    the snapshot) syncs the chain up to the snapshot block from the peer, validating every block from genesis, and
+    must end up with the snapshot's UTXO set. The check runs in steps of a few blocks (see step), on the thread of
+    the node that loaded the snapshot, between the other events of that node, so the peer is never read while it
+    changes. The outcome is in status (and the reason of a failure in error); on_invalid is called if it fails.
+    """
+
+    def __init__(self, snapshot: UtxoSnapshot, hashes: List[BlockHash], shadow: Any, peer: Any,
+                 on_invalid: Callable[[], None]) -> None:
+        self.block_hash = snapshot.block_hash
+        self.content_hash = snapshot.content_hash
+        # the hashes of the chain up to the snapshot block, from its (already downloaded) headers
+        self.hashes = hashes
+        self.shadow = shadow
+        self.peer = peer
+        self.on_invalid = on_invalid
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.stats: Dict[str, Any] = {"blocks": 0, "steps": 0}
+
+    def is_done(self) -> bool:
+        return self.status in (VALID, INVALID)
+
+    def step(self, max_blocks: int = CHECK_STEP_BLOCKS) -> bool:
+        """Syncs and validates the next max_blocks blocks of the history. Returns whether the check is over."""
+        if self.is_done():
+            return True
+        self.status = RUNNING
+        self.stats["steps"] += 1
+        target = min(self.stats["blocks"] + max_blocks, len(self.hashes)) - 1
+        try:
+            self.shadow.notify_of_block(self.hashes[target], self.peer)
+        except Exception as error:
+            self._finish(INVALID, f"Checking the snapshot failed: {error!r}")
+            return True
+        if self.shadow.get_latest_hash() != self.hashes[target]:
+            self._finish(INVALID, "The history of the snapshot block could not be synced and validated")
+        elif target == len(self.hashes) - 1:
+            if compute_utxo_hash(self.shadow.utxos.values()) != self.content_hash:
+                self._finish(INVALID, "The history of the snapshot block leads to a different UTXO set")
+            else:
+                self._finish(VALID, None)
+        else:
+            self.stats["blocks"] = target + 1
+        return self.is_done()
+
+    def run(self) -> str:
+        """Runs the remaining steps at once. Returns the status."""
+        while not self.step():
+            pass
+        return self.status
+
+    def _finish(self, status: str, error: Optional[str]) -> None:
+        self.stats["blocks"] = len(self.shadow.blockchain)
+        # the shadow node holds the whole history, which is not needed anymore
+        self.shadow = None
+        self.error = error
+        self.status = status
+        if status == INVALID:
+            self.on_invalid()
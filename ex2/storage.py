@@ -0,0 +1,303 @@
+"""
+Persistent storage for a node's chain: block bodies by hash, the block index (the hashes of the current chain by
+height), the UTXO set and the undo data of every block (the coins it spent, needed to disconnect it in a reorg).
+A node with storage attached (Node.attach_storage) writes the changes of every connected block in one batch,
+and commits once per mined block or chain switch, so a reorg is stored atomically: a crash in the middle of it
+leaves the storage at the chain from before the reorg.
+Bodies are only read when needed, through StoredChain, which replaces the in-memory list of blocks.
+"""
+import sqlite3
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple, Union, overload
+
+from .block import Block, BlockHeader
+from .transaction import Transaction
+from .utils import BlockHash, PublicKey, Signature, TxID
+
+# The number of block bodies StoredChain keeps in memory after reading them.
+DEFAULT_BLOCK_CACHE_SIZE = 1000
+
+_LENGTH = struct.Struct(">H")
+_NONCE = struct.Struct(">Q")
+
+
+def _write_field(parts: List[bytes], field: bytes) -> None:
+    parts.append(_LENGTH.pack(len(field)))
+    parts.append(field)
+
+
+def _read_field(data: bytes, offset: int) -> Tuple[bytes, int]:
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    return data[offset:offset + length], offset + length
+
+
+def serialize_transaction(tx: Transaction) -> bytes:
+    """Encodes a transaction as length-prefixed output, input (empty for a coinbase, flagged) and signature."""
+    parts: List[bytes] = [b"\x00" if tx.input is None else b"\x01"]
+    _write_field(parts, tx.output)
+    _write_field(parts, tx.input or b"")
+    _write_field(parts, tx.signature)
+    return b"".join(parts)
+
+
+def _read_transaction(data: bytes, offset: int) -> Tuple[Transaction, int]:
+    has_input = data[offset] == 1
+    output, offset = _read_field(data, offset + 1)
+    tx_input, offset = _read_field(data, offset)
+    signature, offset = _read_field(data, offset)
+    return Transaction(PublicKey(output), TxID(tx_input) if has_input else None, Signature(signature)), offset
+
+
+def deserialize_transaction(data: bytes) -> Transaction:
+    """Decodes a transaction written by serialize_transaction."""
+    return _read_transaction(data, 0)[0]
+
+
+def serialize_block(block: Block) -> bytes:
+    """Encodes a block as its previous hash, its nonce (if it has one) and its transactions."""
+    nonce = block.get_nonce()
+    parts: List[bytes] = []
+    _write_field(parts, block.get_prev_block_hash())
+    parts.append(b"\x00" if nonce is None else b"\x01" + _NONCE.pack(nonce))
+    parts.append(_LENGTH.pack(len(block.get_transactions())))
+    for tx in block.get_transactions():
+        parts.append(serialize_transaction(tx))
+    return b"".join(parts)
+
+
+def deserialize_block(data: bytes) -> Block:
+    """Decodes a block written by serialize_block."""
+    prev_block_hash, offset = _read_field(data, 0)
+    nonce = None
+    if data[offset] == 1:
+        (nonce,) = _NONCE.unpack_from(data, offset + 1)
+        offset += _NONCE.size
+    offset += 1
+    (count,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    transactions = []
+    for _ in range(count):
+        tx, offset = _read_transaction(data, offset)
+        transactions.append(tx)
+    return Block(BlockHash(prev_block_hash), transactions, nonce)
+
+
+class Storage:
+    """
+    The interface of a storage backend. Writes are part of a pending batch that becomes durable (all of it,
+    or none of it) on commit(). Reads see the pending writes.
+    """
+
+    def put_block(self, block: Block) -> None:
+        """Stores the body of the block, keyed by its hash."""
+        raise NotImplementedError
+
+    def get_block(self, block_hash: BlockHash) -> Optional[Block]:
+        """Returns the stored block with the given hash, or None."""
+        raise NotImplementedError
+
+    def get_chain(self) -> List[BlockHash]:
+        """Returns the hashes of the stored chain, by height."""
+        raise NotImplementedError
+
+    def set_chain_hash(self, height: int, block_hash: BlockHash) -> None:
+        """Records the block at the given height of the chain."""
+        raise NotImplementedError
+
+    def truncate_chain(self, height: int) -> None:
+        """Removes the blocks above the given height from the chain (their bodies are kept)."""
+        raise NotImplementedError
+
+    def get_utxos(self) -> Dict[TxID, Transaction]:
+        """Returns the stored UTXO set."""
+        raise NotImplementedError
+
+    def update_utxos(self, spent: List[TxID], created: List[Transaction]) -> None:
+        """Removes the spent coins from the UTXO set and adds the created ones."""
+        raise NotImplementedError
+
+    def clear_utxos(self) -> None:
+        """Empties the UTXO set."""
+        raise NotImplementedError
+
+    def put_undo(self, block_hash: BlockHash, spent: List[Transaction]) -> None:
+        """Stores the coins the block spent."""
+        raise NotImplementedError
+
+    def get_undo(self, block_hash: BlockHash) -> Optional[List[Transaction]]:
+        """Returns the coins the block spent, or None if they were not stored."""
+        raise NotImplementedError
+
+    def commit(self) -> None:
+        """Makes the pending writes durable."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Closes the storage. Writes that were not committed are discarded."""
+        raise NotImplementedError
+
+
+class SqliteStorage(Storage):
+    """Storage in a single sqlite database file (or in memory, for ":memory:")."""
+
+    def __init__(self, path: str) -> None:
+        # sqlite connections can't be shared between threads, so every thread that uses the storage (e.g. the thread
+        # that answers the requests of peers, see transport.py) opens its own connection to the same database
+        self.uri = path == ":memory:"
+        self.path = f"file:ex2-storage-{id(self)}?mode=memory&cache=shared" if self.uri else path
+        self.threads = threading.local()
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS blocks (hash BLOB PRIMARY KEY, body BLOB NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS chain (height INTEGER PRIMARY KEY, hash BLOB NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS utxos (txid BLOB PRIMARY KEY, tx BLOB NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS undo (hash BLOB PRIMARY KEY, spent BLOB NOT NULL)")
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The connection of the calling thread, opened on first use."""
+        connection = getattr(self.threads, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, uri=self.uri)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.threads.connection = connection
+        return connection
+
+    def put_block(self, block: Block) -> None:
+        self.connection.execute("INSERT OR IGNORE INTO blocks VALUES (?, ?)",
+                                (block.get_block_hash(), serialize_block(block)))
+
+    def get_block(self, block_hash: BlockHash) -> Optional[Block]:
+        row = self.connection.execute("SELECT body FROM blocks WHERE hash = ?", (block_hash,)).fetchone()
+        return deserialize_block(row[0]) if row is not None else None
+
+    def get_chain(self) -> List[BlockHash]:
+        return [BlockHash(row[0]) for row in self.connection.execute("SELECT hash FROM chain ORDER BY height")]
+
+    def set_chain_hash(self, height: int, block_hash: BlockHash) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO chain VALUES (?, ?)", (height, block_hash))
+
+    def truncate_chain(self, height: int) -> None:
+        self.connection.execute("DELETE FROM chain WHERE height > ?", (height,))
+
+    def get_utxos(self) -> Dict[TxID, Transaction]:
+        return {TxID(txid): deserialize_transaction(tx)
+                for txid, tx in self.connection.execute("SELECT txid, tx FROM utxos")}
+
+    def update_utxos(self, spent: List[TxID], created: List[Transaction]) -> None:
+        self.connection.executemany("DELETE FROM utxos WHERE txid = ?", [(txid,) for txid in spent])
+        self.connection.executemany("INSERT OR REPLACE INTO utxos VALUES (?, ?)",
+                                    [(tx.get_txid(), serialize_transaction(tx)) for tx in created])
+
+    def clear_utxos(self) -> None:
+        self.connection.execute("DELETE FROM utxos")
+
+    def put_undo(self, block_hash: BlockHash, spent: List[Transaction]) -> None:
+        parts: List[bytes] = []
+        for tx in spent:
+            _write_field(parts, serialize_transaction(tx))
+        self.connection.execute("INSERT OR REPLACE INTO undo VALUES (?, ?)", (block_hash, b"".join(parts)))
+
+    def get_undo(self, block_hash: BlockHash) -> Optional[List[Transaction]]:
+        row = self.connection.execute("SELECT spent FROM undo WHERE hash = ?", (block_hash,)).fetchone()
+        if row is None:
+            return None
+        spent, offset = [], 0
+        while offset < len(row[0]):
+            data, offset = _read_field(row[0], offset)
+            spent.append(deserialize_transaction(data))
+        return spent
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def close(self) -> None:
+        """Closes the connection of the calling thread (the connections of other threads close when they end)."""
+        connection = getattr(self.threads, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.threads.connection = None
+
+
+class StoredChain:
+    """
+    The blocks of a node's current chain, read from storage when accessed. Behaves like the list of blocks
+    it replaces (len, indexing, slicing, iteration, concatenation with a list, append and deleting a tail), and
+    keeps only the hashes and the most recently used bodies in memory.
+    """
+
+    def __init__(self, storage: Storage, hashes: List[BlockHash],
+                 cache_size: int = DEFAULT_BLOCK_CACHE_SIZE) -> None:
+        self.storage = storage
+        self.hashes = hashes
+        self.cache_size = cache_size
+        self.cache: 'OrderedDict[BlockHash, Block]' = OrderedDict()
+        self.reads = 0
+
+    def get_hash(self, height: int) -> BlockHash:
+        """Returns the hash of the block at the given height, without reading the block."""
+        return self.hashes[height]
+
+    def get_header(self, height: int) -> BlockHeader:
+        """Returns the header of the block at the given height."""
+        return self[height].get_header()
+
+    def _load(self, block_hash: BlockHash) -> Block:
+        block = self.cache.get(block_hash)
+        if block is not None:
+            self.cache.move_to_end(block_hash)
+            return block
+        block = self.storage.get_block(block_hash)
+        if block is None:
+            raise ValueError(f"Block with hash {block_hash!r} is missing from storage")
+        self.reads += 1
+        self._remember(block_hash, block)
+        return block
+
+    def _remember(self, block_hash: BlockHash, block: Block) -> None:
+        self.cache[block_hash] = block
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @overload
+    def __getitem__(self, index: int) -> Block: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Block]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Block, List[Block]]:
+        if isinstance(index, slice):
+            return [self._load(block_hash) for block_hash in self.hashes[index]]
+        return self._load(self.hashes[index])
+
+    def __iter__(self) -> Iterator[Block]:
+        for block_hash in list(self.hashes):
+            yield self._load(block_hash)
+
+    def __bool__(self) -> bool:
+        return bool(self.hashes)
+
+    def __add__(self, other: List[Block]) -> List[Block]:
+        return self[:] + other
+
+    def append(self, block: Block) -> None:
+        """Adds the block at the tip, storing its body and its place in the block index."""
+        block_hash = block.get_block_hash()
+        self.storage.put_block(block)
+        self.storage.set_chain_hash(len(self.hashes), block_hash)
+        self.hashes.append(block_hash)
+        self._remember(block_hash, block)
+
+    def __delitem__(self, index: slice) -> None:
+        if (not isinstance(index, slice) or index.stop is not None or index.step is not None or
+                (index.start or 0) < 0):
+            raise ValueError("Only the tail of the chain can be removed")
+        start = index.start or 0
+        del self.hashes[start:]
+        self.storage.truncate_chain(start - 1)
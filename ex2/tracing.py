@@ -0,0 +1,153 @@
+"""
+Tracing: a Tracer records spans (named, timed sections of code, nested within each other) and exports them as a
+Chrome trace (the JSON format read by chrome://tracing and Perfetto). A node with a tracer (Node.tracer) records
+the phases of notify_of_block (chain walk, fork search, state rewind, validation and connection of every block,
+mempool restore), mine_block, and the requests it serves to peers. Nodes that share a tracer nest their spans:
+a peer serving get_headers appears inside the fork search of the node that asked.
+A tracer can also run a SamplingProfiler, whose stack samples are exported with the spans.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional, Tuple
+
+# Seconds between stack samples of the sampling profiler.
+DEFAULT_SAMPLE_INTERVAL = 0.001
+# The deepest stack a profiler sample keeps (the innermost frames).
+MAX_SAMPLE_DEPTH = 64
+
+# What Node._span returns when the node has no tracer: entering and leaving it does nothing.
+NO_SPAN = nullcontext()
+
+
+class Span:
+    """A timed section of code. Use as a context manager (see Tracer.span)."""
+
+    def __init__(self, tracer: 'Tracer', name: str, args: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.parent: Optional[Span] = None
+        self.thread = 0
+        self.start = 0.0
+        self.end = 0.0
+
+    def __enter__(self) -> 'Span':
+        stack = self.tracer._get_stack()
+        self.parent = stack[-1] if stack else None
+        self.thread = threading.get_ident()
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.end = time.perf_counter()
+        self.tracer._get_stack().pop()
+        self.tracer.spans.append(self)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class SamplingProfiler:
+    """Samples the stack of a thread every interval seconds, from a background thread, until stopped."""
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, thread: Optional[int] = None) -> None:
+        self.interval = interval
+        self.target = thread if thread is not None else threading.get_ident()
+        # (time, stack from the outermost frame, as "function (file:line)")
+        self.samples: List[Tuple[float, Tuple[str, ...]]] = []
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None and len(stack) < MAX_SAMPLE_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+
+class Tracer:
+    """Records the spans of any number of nodes and threads, and exports them as a Chrome trace."""
+
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self.origin = time.perf_counter()
+        self.profiler: Optional[SamplingProfiler] = None
+        self._local = threading.local()
+
+    def _get_stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name: str, **args: Any) -> Span:
+        """Returns a span to enter with `with`. It is nested in the span the current thread is in, if any."""
+        return Span(self, name, args)
+
+    def start_profiler(self, interval: float = DEFAULT_SAMPLE_INTERVAL, thread: Optional[int] = None) -> None:
+        """Starts sampling the stack of the given thread (by default, the current one)."""
+        if self.profiler is not None:
+            raise ValueError("The profiler was already started")
+        self.profiler = SamplingProfiler(interval, thread)
+        self.profiler.start()
+
+    def stop_profiler(self) -> None:
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def _microseconds(self, at: float) -> float:
+        return round((at - self.origin) * 1e6, 3)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Returns the spans (and profiler samples) as a Chrome trace, with times in microseconds."""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {"name": span.name, "cat": "ex2", "ph": "X", "pid": pid, "tid": span.thread,
+             "ts": self._microseconds(span.start), "dur": round(span.duration * 1e6, 3),
+             "args": {key: value if isinstance(value, (int, float, bool)) else str(value)
+                      for key, value in span.args.items()}}
+            for span in sorted(self.spans, key=lambda span: span.start)]
+        trace: Dict[str, Any] = {"traceEvents": events, "displayTimeUnit": "ms"}
+        if self.profiler is not None:
+            # every distinct stack prefix is a frame, whose parent is the prefix one frame shorter
+            frames: Dict[Tuple[str, ...], str] = {}
+            stack_frames: Dict[str, Dict[str, str]] = {}
+            for at, stack in self.profiler.samples:
+                for depth in range(1, len(stack) + 1):
+                    prefix = stack[:depth]
+                    if prefix not in frames:
+                        frames[prefix] = str(len(frames))
+                        stack_frames[frames[prefix]] = {"name": prefix[-1], "category": "python"}
+                        if depth > 1:
+                            stack_frames[frames[prefix]]["parent"] = frames[prefix[:-1]]
+                if stack:
+                    events.append({"name": "sample", "cat": "profiler", "ph": "P", "pid": pid,
+                                   "tid": self.profiler.target, "ts": self._microseconds(at), "sf": frames[stack]})
+            trace["stackFrames"] = stack_frames
+        return trace
+
+    def write_chrome_trace(self, path: str) -> None:
+        """Writes the trace to a JSON file, for chrome://tracing or https://ui.perfetto.dev."""
+        with open(path, "w") as trace_file:
+            json.dump(self.to_chrome_trace(), trace_file)
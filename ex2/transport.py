@@ -0,0 +1,424 @@
+"""
+TCP transport, so that nodes in different processes can be connected to each other.
+A NodeServer runs a node in this process: it accepts connections (and opens them, see connect_to) and represents
+every connected node by a RemotePeer, a proxy with the methods a node calls on its neighbors (notify_of_block,
+get_headers, ...). The node itself only ever sees peers, so it syncs with a remote node exactly as with a local one.
+
+The node runs on its own thread, since it calls its peers synchronously: a call like peer.get_headers() sends a
+request and waits for the response, which the asyncio event loop (on the thread that started the server) receives.
+Announcements from peers are handed to the node thread one at a time. Requests from peers (get_block, get_headers)
+are answered on a separate request thread, under the node lock that the node thread holds while it runs, except while
+it waits for the response of a peer: so the node is never read while it changes, and two nodes syncing from each
+other at the same time don't wait for one another. Mining (see NodeServer.mine) runs on a miner thread of its own,
+which releases the node lock during the nonce search, so that a competing block is handled meanwhile and cancels it.
+
+Wire format: every frame is a header (payload length, message type, request id) followed by the payload.
+Requests carry a fresh request id, and their response (or an ERROR frame) carries the same id; other frames use 0.
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import itertools
+import struct
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .block import Block, BlockHeader
+from .storage import deserialize_block, deserialize_transaction, serialize_block, serialize_transaction
+from .transaction import Transaction
+from .utils import BlockHash
+
+# Seconds to wait for the response to a request before giving up on it.
+DEFAULT_REQUEST_TIMEOUT = 30.0
+# The largest frame accepted from a peer (in bytes). A peer sending a larger one is disconnected.
+MAX_FRAME_SIZE = 32 * 1024 * 1024
+
+# Message types
+HELLO = 1  # our tip and chain length, sent once by both sides when connecting
+ANNOUNCE = 2  # a block hash (notify_of_block)
+TRANSACTION = 3  # a transaction (notify_of_transaction)
+GET_BLOCKS = 4  # block hashes, answered with BLOCKS
+BLOCKS = 5
+GET_HEADERS = 6  # a stop hash (empty for none) and a block locator, answered with HEADERS
+HEADERS = 7
+ERROR = 8  # the response to a request that failed, with the reason
+
+_FRAME_HEADER = struct.Struct(">IBI")
+_COUNT = struct.Struct(">I")
+_NONCE = struct.Struct(">Q")
+
+
+def pack_list(items: List[bytes]) -> bytes:
+    """Encodes a list of byte strings, each prefixed with its length."""
+    parts = [_COUNT.pack(len(items))]
+    for item in items:
+        parts.append(_COUNT.pack(len(item)))
+        parts.append(item)
+    return b"".join(parts)
+
+
+def unpack_list(data: bytes) -> List[bytes]:
+    """Decodes a list written by pack_list. Raises ValueError if the data is malformed."""
+    try:
+        (count,) = _COUNT.unpack_from(data, 0)
+        offset = _COUNT.size
+        items = []
+        for _ in range(count):
+            (length,) = _COUNT.unpack_from(data, offset)
+            offset += _COUNT.size
+            if offset + length > len(data):
+                raise ValueError("Truncated list item")
+            items.append(data[offset:offset + length])
+            offset += length
+        return items
+    except struct.error as error:
+        raise ValueError(f"Malformed list: {error}")
+
+
+def encode_header(header: BlockHeader) -> bytes:
+    nonce = header.get_nonce()
+    return pack_list([header.get_block_hash(), header.get_prev_block_hash(),
+                      _NONCE.pack(nonce) if nonce is not None else b""])
+
+
+def decode_header(data: bytes) -> BlockHeader:
+    block_hash, prev_block_hash, nonce = unpack_list(data)
+    return BlockHeader(BlockHash(block_hash), BlockHash(prev_block_hash), _NONCE.unpack(nonce)[0] if nonce else None)
+
+
+class RemotePeer:
+    """
+    A node in another process, as seen by the local node: it has the methods that a node calls on its neighbors.
+    Announcements are sent without waiting, and get_block / get_blocks / get_headers wait for the response
+    (they must be called from the node thread, not from the event loop). Failed or timed out requests raise
+    ValueError, like a local node asked for a block it doesn't have.
+    """
+    SUPPORTS_HEADERS_FIRST = True
+    SUPPORTS_COMPACT_BLOCKS = False
+
+    def __init__(self, server: 'NodeServer', reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 latest_block_hash: BlockHash, chain_length: int) -> None:
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        # what the peer last told us about its chain (used by Node.connect to decide who announces first)
+        self.latest_block_hash = latest_block_hash
+        self.chain_length = chain_length
+        # the parts of a node's state that Node.connect() and Node.disconnect_from() update on the other side
+        self.connections: Set[Any] = set()
+        self.peer_inventory: Dict[Any, Any] = {}
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.request_ids = itertools.count(1)
+        self.closed = False
+
+    @property
+    def blockchain(self) -> range:
+        """Stands in for the peer's chain, of which only the length is known."""
+        return range(self.chain_length)
+
+    def __repr__(self) -> str:
+        return f"RemotePeer({self.address})"
+
+    # ------------ Called by the local node (on the node thread): -----------------------
+
+    def notify_of_block(self, block_hash: BlockHash, sender: Any) -> None:
+        self._send_threadsafe(ANNOUNCE, block_hash)
+
+    def notify_of_transaction(self, transaction: Transaction, sender: Any) -> bool:
+        self._send_threadsafe(TRANSACTION, serialize_transaction(transaction))
+        return True
+
+    def _announce_block(self, block_hash: BlockHash, peer: Any) -> None:
+        """Called by Node.connect when the peer's chain is longer: acts as if the peer announced its tip."""
+        peer.notify_of_block(block_hash, self)
+
+    def get_block(self, block_hash: BlockHash) -> Block:
+        return self.get_blocks([block_hash])[0]
+
+    def get_blocks(self, block_hashes: List[BlockHash]) -> List[Block]:
+        response = self._request_threadsafe(GET_BLOCKS, pack_list(list(block_hashes)))
+        try:
+            blocks = [deserialize_block(data) for data in unpack_list(response)]
+        except (struct.error, IndexError) as error:
+            raise ValueError(f"Malformed block from {self}: {error}")
+        if len(blocks) != len(block_hashes):
+            raise ValueError("The peer sent a wrong number of blocks")
+        return blocks
+
+    def get_headers(self, locator: List[BlockHash], stop: Optional[BlockHash] = None) -> List[BlockHeader]:
+        response = self._request_threadsafe(GET_HEADERS, pack_list([stop or b""] + list(locator)))
+        try:
+            return [decode_header(data) for data in unpack_list(response)]
+        except struct.error as error:
+            raise ValueError(f"Malformed header from {self}: {error}")
+
+    def _send_threadsafe(self, kind: int, payload: bytes) -> None:
+        if not self.closed:
+            self.server.loop.call_soon_threadsafe(self._send, kind, 0, payload)
+
+    def _request_threadsafe(self, kind: int, payload: bytes) -> bytes:
+        if threading.current_thread() is self.server.loop_thread:
+            raise RuntimeError("Requests to peers can't wait on the event loop thread")
+        future = asyncio.run_coroutine_threadsafe(self.request(kind, payload), self.server.loop)
+        # The requests of peers are answered while we wait (the peer may be waiting for one of them to answer us)
+        with self.server.unlocked():
+            try:
+                return future.result()
+            except (asyncio.TimeoutError, concurrent.futures.TimeoutError, ConnectionError) as error:
+                raise ValueError(f"Request to {self} failed: {error!r}")
+
+    # ------------ On the event loop: -----------------------
+
+    def _send(self, kind: int, request_id: int, payload: bytes) -> None:
+        if self.closed:
+            return
+        self.server.frames_sent[kind] = self.server.frames_sent.get(kind, 0) + 1
+        self.writer.write(_FRAME_HEADER.pack(len(payload), kind, request_id) + payload)
+
+    async def request(self, kind: int, payload: bytes) -> bytes:
+        """Sends a request and returns the payload of its response. Raises ValueError for an ERROR response."""
+        if self.closed:
+            raise ConnectionError("The connection is closed")
+        request_id = next(self.request_ids)
+        response = self.server.loop.create_future()
+        self.pending[request_id] = response
+        self._send(kind, request_id, payload)
+        try:
+            response_kind, data = await asyncio.wait_for(response, self.server.request_timeout)
+        finally:
+            self.pending.pop(request_id, None)
+        if response_kind == ERROR:
+            raise ValueError(data.decode(errors="replace"))
+        return data
+
+    async def serve(self) -> None:
+        """Handles the frames the peer sends, until the connection closes."""
+        try:
+            while True:
+                kind, request_id, payload = await read_frame(self.reader)
+                self.server.frames_received[kind] = self.server.frames_received.get(kind, 0) + 1
+                if request_id in self.pending and kind in (BLOCKS, HEADERS, ERROR):
+                    if not self.pending[request_id].done():
+                        self.pending[request_id].set_result((kind, payload))
+                elif kind in (GET_BLOCKS, GET_HEADERS):
+                    self.server.loop.run_in_executor(self.server.request_executor, self._answer, kind, request_id,
+                                                     payload)
+                elif kind == ANNOUNCE:
+                    self.latest_block_hash = BlockHash(payload)
+                    self.server.run_in_node(self.server.node.notify_of_block, BlockHash(payload), self)
+                elif kind == TRANSACTION:
+                    self.server.run_in_node(self.server.node.notify_of_transaction,
+                                            deserialize_transaction(payload), self)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.close()
+
+    def _answer(self, kind: int, request_id: int, payload: bytes) -> None:
+        """Answers a request of the peer (on the request thread, under the node lock)."""
+        node = self.server.node
+        try:
+            with self.server.node_lock:
+                if kind == GET_BLOCKS:
+                    blocks = node.get_blocks([BlockHash(block_hash) for block_hash in unpack_list(payload)])
+                    response_kind, response = BLOCKS, pack_list([serialize_block(block) for block in blocks])
+                else:
+                    stop, *locator = unpack_list(payload)
+                    headers = node.get_headers([BlockHash(block_hash) for block_hash in locator],
+                                               BlockHash(stop) if stop else None)
+                    response_kind, response = HEADERS, pack_list([encode_header(header) for header in headers])
+        except Exception as error:
+            # the request fails, not the connection
+            response_kind, response = ERROR, str(error).encode()
+        self.server.loop.call_soon_threadsafe(self._send, response_kind, request_id, response)
+
+    def close(self) -> None:
+        """Closes the connection, fails the requests waiting for a response and disconnects the node from the peer."""
+        if self.closed:
+            return
+        self.closed = True
+        for response in self.pending.values():
+            if not response.done():
+                response.set_exception(ConnectionError("The connection was closed"))
+        self.writer.close()
+        if self in self.server.peers:
+            self.server.peers.remove(self)
+            self.server.run_in_node(self.server.node.disconnect_from, self)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    """Reads one frame and returns its message type, request id and payload."""
+    length, kind, request_id = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes is too large")
+    return kind, request_id, await reader.readexactly(length)
+
+
+class NodeServer:
+    """
+    Runs a node in this process and connects it to nodes in other processes. Must be started (and used) from
+    a running asyncio event loop:
+
+        server = NodeServer(Node())
+        port = await server.start()
+        await server.connect_to("127.0.0.1", other_port)
+        await server.mine()
+    """
+
+    def __init__(self, node: Any, host: str = "127.0.0.1", port: int = 0,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT) -> None:
+        self.node = node
+        self.host = host
+        self.port = port
+        self.request_timeout = request_timeout
+        self.peers: List[RemotePeer] = []
+        # all calls into the node run on this single thread, one at a time, holding the node lock
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="node")
+        self.node_lock = threading.Lock()
+        # the thread that runs the node (holding the node lock, unless it waits)
+        self.node_thread: Optional[threading.Thread] = None
+        # the calls into the node that wait for a peer in the middle of a change, and a condition notified when one
+        # of them continues (the miner only connects its block while none of them waits)
+        self.calls_waiting = 0
+        self.call_continued = threading.Condition(self.node_lock)
+        # mine() runs on this thread, so that the node thread handles the messages of peers during the nonce search
+        self.miner_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="node-miner")
+        node.mining_unlocked = self._search_unlocked
+        # the tip the listeners were last told of
+        self.reported_tip: Optional[BlockHash] = None
+        # the requests of peers are answered on this thread, so the event loop never waits for the node lock
+        self.request_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                      thread_name_prefix="node-requests")
+        # called on the node thread with the new tip, whenever a call into the node changed it
+        self.listeners: List[Callable[[BlockHash], None]] = []
+        self.errors: List[BaseException] = []
+        self.frames_sent: Dict[int, int] = {}
+        self.frames_received: Dict[int, int] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.loop: asyncio.AbstractEventLoop = None  # type: ignore
+        self.loop_thread: Optional[threading.Thread] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def start(self) -> int:
+        """Starts accepting connections, and returns the port the server listens on."""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.current_thread()
+        self.server = await asyncio.start_server(self._accept, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def connect_to(self, host: str, port: int) -> RemotePeer:
+        """Opens a connection to the node server at the given address, and connects our node to it."""
+        reader, writer = await asyncio.open_connection(host, port)
+        return await self._handshake(reader, writer)
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await self._handshake(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, asyncio.TimeoutError):
+            writer.close()
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> RemotePeer:
+        tip, length = await self.call(lambda: (self.node.get_latest_hash(), len(self.node.blockchain)))
+        writer.write(self._hello_frame(tip, length))
+        kind, _, payload = await asyncio.wait_for(read_frame(reader), self.request_timeout)
+        if kind != HELLO:
+            raise ValueError("Expected a HELLO frame")
+        peer_tip, peer_length = unpack_list(payload)
+        peer = RemotePeer(self, reader, writer, BlockHash(peer_tip), _COUNT.unpack(peer_length)[0])
+        self.peers.append(peer)
+        task = asyncio.ensure_future(peer.serve())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        await self.call(self.node.connect, peer)
+        return peer
+
+    @staticmethod
+    def _hello_frame(tip: BlockHash, length: int) -> bytes:
+        payload = pack_list([tip, _COUNT.pack(length)])
+        return _FRAME_HEADER.pack(len(payload), HELLO, 0) + payload
+
+    def run_in_node(self, function: Callable[..., Any], *args: Any) -> 'concurrent.futures.Future[Any]':
+        """Calls the function on the node thread (after the calls queued before it), and notifies the listeners
+        if it changed the node's tip. Returns a future of its result."""
+        return self.executor.submit(self._run_locked, function, *args)
+
+    def _run_locked(self, function: Callable[..., Any], *args: Any) -> Any:
+        with self.node_lock:
+            self.node_thread = threading.current_thread()
+            if self.reported_tip is None:
+                self.reported_tip = self.node.get_latest_hash()
+            try:
+                return function(*args)
+            except BaseException as error:
+                self.errors.append(error)
+                raise
+            finally:
+                new_tip = self.node.get_latest_hash()
+                if new_tip != self.reported_tip:
+                    self.reported_tip = new_tip
+                    for listener in self.listeners:
+                        listener(new_tip)
+
+    @contextlib.contextmanager
+    def unlocked(self) -> Iterator[None]:
+        """
+        Releases the node lock while the thread that runs the node waits for a peer, so that the node answers requests
+        meanwhile. Does nothing on other threads.
+        """
+        if threading.current_thread() is not self.node_thread:
+            yield
+            return
+        self.calls_waiting += 1
+        self.node_lock.release()
+        try:
+            yield
+        finally:
+            self.node_lock.acquire()
+            self.calls_waiting -= 1
+            self.node_thread = threading.current_thread()
+            self.call_continued.notify_all()
+
+    @contextlib.contextmanager
+    def _search_unlocked(self) -> Iterator[None]:
+        """
+        Releases the node lock during the nonce search of mine(), so that the node thread handles the messages of peers
+        (and a competing block cancels the search). The miner continues once no call into the node is halfway.
+        """
+        if threading.current_thread() is not self.node_thread:
+            yield
+            return
+        self.node_lock.release()
+        try:
+            yield
+        finally:
+            self.node_lock.acquire()
+            while self.calls_waiting:
+                self.call_continued.wait()
+            self.node_thread = threading.current_thread()
+
+    async def mine(self) -> Optional[BlockHash]:
+        """
+        Mines a block (node.mine_block) on the miner thread, holding the node lock except during the nonce search,
+        so that a competing block that arrives meanwhile is connected and cancels the search (the result is then None).
+        """
+        return await asyncio.wrap_future(self.miner_executor.submit(self._run_locked, self.node.mine_block))
+
+    async def call(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Calls the function on the node thread and waits for its result (e.g. await server.call(node.mine_block))."""
+        return await asyncio.wrap_future(self.run_in_node(function, *args))
+
+    async def close(self) -> None:
+        """Stops accepting connections, closes the connections to all peers and stops the node thread."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for peer in list(self.peers):
+            peer.close()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.loop.run_in_executor(None, self.miner_executor.shutdown)
+        await self.loop.run_in_executor(None, self.executor.shutdown)
+        await self.loop.run_in_executor(None, self.request_executor.shutdown)
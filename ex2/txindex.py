@@ -0,0 +1,72 @@
+"""
+Indexes of the transactions of a node's chain: TxIndex finds the block (and the position in it) of a transaction
+by txid, and AddressIndex lists the transactions that paid or spent from an address, in chain order.
+Both are updated as blocks are connected and disconnected (see Node.enable_tx_index, Node.enable_address_index).
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .block import Block
+from .transaction import Transaction
+from .utils import BlockHash, PublicKey, TxID
+
+
+class TxIndex:
+    """The block hash and position in the block of every transaction on the chain, by txid."""
+
+    def __init__(self) -> None:
+        self.locations: Dict[TxID, Tuple[BlockHash, int]] = {}
+
+    def connect_block(self, block: Block, spent: Iterable[Transaction]) -> None:
+        block_hash = block.get_block_hash()
+        for position, tx in enumerate(block.get_transactions()):
+            self.locations[tx.get_txid()] = (block_hash, position)
+
+    def disconnect_block(self, block: Block, spent: Iterable[Transaction]) -> None:
+        for tx in block.get_transactions():
+            self.locations.pop(tx.get_txid(), None)
+
+    def get(self, txid: TxID) -> Optional[Tuple[BlockHash, int]]:
+        return self.locations.get(txid)
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+
+class AddressIndex:
+    """The txids of the transactions on the chain that paid an address or spent one of its coins, by address."""
+
+    def __init__(self) -> None:
+        self.history: Dict[PublicKey, List[TxID]] = {}
+
+    @staticmethod
+    def _get_addresses(tx: Transaction, spent_outputs: Dict[TxID, PublicKey]) -> Set[PublicKey]:
+        addresses = {tx.output}
+        if tx.input is not None and tx.input in spent_outputs:
+            addresses.add(spent_outputs[tx.input])
+        return addresses
+
+    def connect_block(self, block: Block, spent: Iterable[Transaction]) -> None:
+        """Adds the transactions of the block. spent are the coins the block spent, to find the spenders."""
+        spent_outputs = {coin.get_txid(): coin.output for coin in spent}
+        for tx in block.get_transactions():
+            txid = tx.get_txid()
+            for address in self._get_addresses(tx, spent_outputs):
+                self.history.setdefault(address, []).append(txid)
+
+    def disconnect_block(self, block: Block, spent: Iterable[Transaction]) -> None:
+        """Removes the transactions of the block, which must be the last block connected."""
+        spent_outputs = {coin.get_txid(): coin.output for coin in spent}
+        for tx in reversed(block.get_transactions()):
+            txid = tx.get_txid()
+            for address in self._get_addresses(tx, spent_outputs):
+                txids = self.history.get(address)
+                if txids and txids[-1] == txid:
+                    txids.pop()
+                    if not txids:
+                        del self.history[address]
+
+    def get(self, address: PublicKey) -> List[TxID]:
+        return list(self.history.get(address, []))
+
+    def __len__(self) -> int:
+        return len(self.history)
@@ -1,6 +1,9 @@
 from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, PrivateFormat, NoEncryption
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
-from typing import NewType, Tuple
+from contextlib import contextmanager
+from typing import Iterator, NewType, Optional, Tuple
+import random
+import secrets
 
 # The following types are used to distinguish between bytes that are used as private keys, public keys and signature.
 # This utilizes typechecking to ensure we won't be using them interchangeably.
@@ -18,6 +21,37 @@ GENESIS_BLOCK_PREV = BlockHash(b"Genesis")
 # The maximal size of a block. Larger blocks are illegal. Do not change this value.
 BLOCK_SIZE = 10
 
+# When set (see set_deterministic_seed), keys and coinbase signatures are drawn from this generator instead of
+# the OS, so that a run that creates its nodes and mines its blocks in the same order gets the same keys and blocks.
+_deterministic_rng: Optional[random.Random] = None
+
+
+def set_deterministic_seed(seed: Optional[int]) -> None:
+    """Makes random_bytes() and gen_keys() deterministic, starting from the given seed (None goes back to the OS).
+    Meant for simulations and benchmarks: the keys it generates are predictable."""
+    global _deterministic_rng
+    _deterministic_rng = random.Random(seed) if seed is not None else None
+
+
+@contextmanager
+def deterministic_randomness(rng: random.Random) -> Iterator[None]:
+    """Draws random_bytes() and gen_keys() from the given generator inside the with block only, and then goes back
+    to the previous source (so a failure inside the block doesn't leave predictable keys behind)."""
+    global _deterministic_rng
+    previous = _deterministic_rng
+    _deterministic_rng = rng
+    try:
+        yield
+    finally:
+        _deterministic_rng = previous
+
+
+def random_bytes(count: int) -> bytes:
+    """Returns count random bytes, from the OS unless a deterministic seed is set."""
+    if _deterministic_rng is not None:
+        return _deterministic_rng.randbytes(count)
+    return secrets.token_bytes(count)
+
 
 def sign(message: bytes, private_key: PrivateKey) -> Signature:
     """Signs the given message using the given private key"""
@@ -41,7 +75,10 @@ def verify(message: bytes, sig: Signature, pub_key: PublicKey) -> bool:
 def gen_keys() -> Tuple[PrivateKey, PublicKey]:
     """generates a private key and a corresponding public key. 
     The keys are returned in byte format to allow them to be serialized easily."""
-    private_key = Ed25519PrivateKey.generate()
+    if _deterministic_rng is not None:
+        private_key = Ed25519PrivateKey.from_private_bytes(random_bytes(32))
+    else:
+        private_key = Ed25519PrivateKey.generate()
     priv_key_bytes = private_key.private_bytes(
         Encoding.Raw, PrivateFormat.Raw, encryption_algorithm=NoEncryption())
     pub_key_bytes = private_key.public_key().public_bytes(
@@ -0,0 +1,47 @@
+"""
+The coins a node owns, indexed so that its wallet methods don't scan the whole UTXO set (see Node.get_balance and
+Node.create_transaction).
+"""
+from typing import Dict
+
+from .transaction import Transaction
+from .utils import TxID
+
+
+class OwnedCoins:
+    """
+    The coins of the node's address in the UTXO set, split into spendable coins and pending coins (ones that a
+    transaction in the mempool already spends). The node keeps it up to date as blocks connect and disconnect
+    and as transactions enter and leave the mempool.
+    """
+
+    def __init__(self) -> None:
+        # insertion ordered, so the oldest coin is spent first
+        self.spendable: Dict[TxID, Transaction] = {}
+        self.pending: Dict[TxID, Transaction] = {}
+
+    def __len__(self) -> int:
+        return len(self.spendable) + len(self.pending)
+
+    def __contains__(self, txid: TxID) -> bool:
+        return txid in self.spendable or txid in self.pending
+
+    def add(self, coin: Transaction, pending: bool = False) -> None:
+        """Adds a coin that entered the UTXO set (pending if a mempool transaction spends it)."""
+        (self.pending if pending else self.spendable)[coin.get_txid()] = coin
+
+    def remove(self, txid: TxID) -> None:
+        """Removes a coin that left the UTXO set. Coins that are not ours are ignored."""
+        if self.spendable.pop(txid, None) is None:
+            self.pending.pop(txid, None)
+
+    def set_pending(self, txid: TxID, pending: bool) -> None:
+        """Marks a coin as spent (or no longer spent) by a mempool transaction. Coins that are not ours are ignored."""
+        source, target = (self.spendable, self.pending) if pending else (self.pending, self.spendable)
+        coin = source.pop(txid, None)
+        if coin is not None:
+            target[txid] = coin
+
+    def get_balance(self) -> int:
+        """The number of coins owned, including pending ones (they are still ours until a block spends them)."""
+        return len(self)
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the ex2 node. Each module is a script, run from the repository root, e.g.:
+    python -m ex2_bench.bench_sync
+"""
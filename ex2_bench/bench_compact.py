@@ -0,0 +1,98 @@
+"""
+Compact block relay benchmark: bytes transferred and time to accept a new block, announced either as a compact
+block (rebuilt from the receiver's mempool) or by hash (full download), for several levels of overlap between
+the block's transactions and the receiver's mempool.
+
+    python -m ex2_bench.bench_compact --trials 50
+"""
+import argparse
+import time
+from typing import Any, Dict, List, Tuple
+
+from ex2 import BlockHash, Node, BLOCK_SIZE
+from ex2.compact import HEADER_SIZE, TRANSACTION_INDEX_SIZE, get_block_size, get_transaction_size
+
+
+class MeteredPeer:
+    """Forwards every call to the wrapped node and adds up the bytes of the data it returns."""
+
+    def __init__(self, node: Node) -> None:
+        self.node = node
+        self.bytes_received = 0
+        self.SUPPORTS_HEADERS_FIRST = True
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.node, name)
+
+    def get_headers(self, *args: Any) -> Any:
+        headers = self.node.get_headers(*args)
+        self.bytes_received += HEADER_SIZE * len(headers)
+        return headers
+
+    def get_blocks(self, block_hashes: List[bytes]) -> Any:
+        blocks = self.node.get_blocks(block_hashes)  # type: ignore
+        self.bytes_received += sum(get_block_size(block) for block in blocks)
+        return blocks
+
+    def get_block_transactions(self, block_hash: bytes, indexes: List[int]) -> Any:
+        transactions = self.node.get_block_transactions(block_hash, indexes)  # type: ignore
+        self.bytes_received += TRANSACTION_INDEX_SIZE * len(indexes)
+        self.bytes_received += sum(get_transaction_size(tx) for tx in transactions)
+        return transactions
+
+
+def prepare(overlap: float) -> Tuple[Node, Node, Node, BlockHash]:
+    """Returns a miner with a new block, and two receivers synced up to the block before it, whose mempools hold
+    the given fraction of the new block's transactions."""
+    miner, compact_receiver, full_receiver = Node(), Node(), Node()
+    for _ in range(BLOCK_SIZE - 1):
+        miner.mine_block()
+    for receiver in (compact_receiver, full_receiver):
+        receiver.notify_of_block(miner.get_latest_hash(), miner)
+    transactions = [miner.create_transaction(miner.get_address()) for _ in range(BLOCK_SIZE - 1)]
+    for tx in transactions[:round(overlap * len(transactions))]:
+        assert tx is not None
+        compact_receiver.add_transaction_to_mempool(tx)
+        full_receiver.add_transaction_to_mempool(tx)
+    block_hash = miner.mine_block()
+    assert block_hash is not None
+    return miner, compact_receiver, full_receiver, block_hash
+
+
+def run(overlap: float, trials: int) -> Dict[str, float]:
+    totals = {"compact_bytes": 0.0, "compact_seconds": 0.0, "full_bytes": 0.0, "full_seconds": 0.0}
+    for _ in range(trials):
+        miner, compact_receiver, full_receiver, block_hash = prepare(overlap)
+
+        peer = MeteredPeer(miner)
+        compact_block = miner.get_compact_block(block_hash)
+        start = time.perf_counter()
+        compact_receiver.notify_of_compact_block(compact_block, peer)  # type: ignore
+        totals["compact_seconds"] += time.perf_counter() - start
+        totals["compact_bytes"] += compact_block.get_size() + peer.bytes_received
+        assert compact_receiver.get_latest_hash() == block_hash
+
+        peer = MeteredPeer(miner)
+        start = time.perf_counter()
+        full_receiver.notify_of_block(block_hash, peer)  # type: ignore
+        totals["full_seconds"] += time.perf_counter() - start
+        totals["full_bytes"] += HEADER_SIZE + peer.bytes_received
+        assert full_receiver.get_latest_hash() == block_hash
+    return {key: value / trials for key, value in totals.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"blocks of {BLOCK_SIZE} transactions, average of {args.trials} trials per overlap level")
+    for overlap in (0.0, 0.25, 0.5, 0.75, 1.0):
+        result = run(overlap, args.trials)
+        print(f"overlap {overlap:4.0%}: compact {result['compact_bytes']:6.0f} bytes "
+              f"{result['compact_seconds'] * 1e6:7.0f}us | full {result['full_bytes']:6.0f} bytes "
+              f"{result['full_seconds'] * 1e6:7.0f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Block filter benchmark: builds a chain of full blocks (a coinbase and 9 payments each) that pays a light wallet
+every --pay-every blocks, and reports the size of the block filters against the blocks, the time to build them,
+and the bytes a light wallet following the chain downloads (headers, filters and matching blocks) against a
+full download of the chain.
+
+    python -m ex2_bench.bench_filters --blocks 10000 --pay-every 100
+"""
+import argparse
+import time
+from typing import List
+
+from ex2 import BLOCK_SIZE, Block, BlockHash, Node, gen_keys
+from ex2.filters import build_block_filter
+from ex2.light_wallet import LightWallet
+from ex2.storage import serialize_block
+from ex2.transport import encode_header
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=10000)
+    parser.add_argument("--pay-every", type=int, default=100, help="blocks between payments to the light wallet")
+    args = parser.parse_args()
+
+    _, wallet_address = gen_keys()
+    source = Node()
+    for height in range(args.blocks):
+        if height % args.pay_every == args.pay_every // 2:
+            source.create_transaction(wallet_address)
+        while len(source.mem_pool) < BLOCK_SIZE - 1:
+            if source.create_transaction(source.get_address()) is None:
+                break
+        source.mine_block()
+    block_bytes = [len(serialize_block(block)) for block in source.blockchain]
+    header_bytes = sum(len(encode_header(block.get_header())) for block in source.blockchain)
+    print(f"chain of {args.blocks} blocks, {sum(block_bytes) / 1e6:.1f}MB of blocks")
+
+    began = time.perf_counter()
+    filters = [build_block_filter(block) for block in source.blockchain]
+    elapsed = time.perf_counter() - began
+    print(f"filters: {sum(map(len, filters)) / len(filters):.1f} bytes per block on average "
+          f"({sum(map(len, filters)) / sum(block_bytes):.2%} of the block size), "
+          f"built in {elapsed / len(filters) * 1e6:.0f}us per block")
+
+    source.enable_block_filters()
+    get_blocks = source.get_blocks
+    downloaded: List[Block] = []
+
+    def counting_get_blocks(block_hashes: List[BlockHash]) -> List[Block]:
+        blocks = get_blocks(block_hashes)
+        downloaded.extend(blocks)
+        return blocks
+    source.get_blocks = counting_get_blocks  # type: ignore
+
+    wallet = LightWallet(wallet_address)
+    began = time.perf_counter()
+    wallet.sync(source)
+    elapsed = time.perf_counter() - began
+    light_bytes = header_bytes + wallet.stats["filter_bytes"] + sum(len(serialize_block(block)) for block in downloaded)
+    full_bytes = header_bytes + sum(block_bytes)
+    print(f"light wallet: balance {wallet.get_balance()}, {wallet.stats['blocks']} blocks downloaded "
+          f"({wallet.stats['false_positives']} false positives), synced in {elapsed:.2f}s")
+    print(f"bandwidth: {light_bytes / 1e6:.2f}MB (headers, filters and matching blocks) vs {full_bytes / 1e6:.2f}MB "
+          f"for a full download, {1 - light_bytes / full_bytes:.1%} saved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Fork race benchmark: two miners on a partitioned network take turns overtaking each other's branch (the one behind
+mines until it leads by one block), with full blocks (a coinbase and 9 payments each), and a third node follows
+every lead change. Reports the blocks the follower downloads, the signatures it verifies and its time, with
+side-chain retention and without it.
+
+    python -m ex2_bench.bench_forks --races 20
+"""
+import argparse
+import time
+from typing import List, Tuple
+
+from ex2 import BLOCK_SIZE, Block, BlockHash, Node
+
+
+def mine(node: Node) -> None:
+    for _ in range(BLOCK_SIZE - 1):
+        if node.create_transaction(node.get_address()) is None:
+            break
+    node.mine_block()
+
+
+def count_downloads(miner: Node, downloaded: List[int]) -> None:
+    """Records the number of blocks every get_blocks call on the miner asks for."""
+    get_blocks = miner.get_blocks
+
+    def counting_get_blocks(block_hashes: List[BlockHash]) -> List[Block]:
+        downloaded.append(len(block_hashes))
+        return get_blocks(block_hashes)
+    miner.get_blocks = counting_get_blocks  # type: ignore
+
+
+def follow(miners: List[Node], lead_changes: List[Tuple[int, BlockHash]], max_depth: int) -> None:
+    downloaded: List[int] = []
+    for miner in miners:
+        count_downloads(miner, downloaded)
+
+    follower = Node()
+    follower.side_chains.max_depth = max_depth
+    began = time.perf_counter()
+    for miner_index, tip in lead_changes:
+        follower.notify_of_block(tip, miners[miner_index])
+        assert follower.get_latest_hash() == tip
+    elapsed = time.perf_counter() - began
+    for miner in miners:
+        del miner.get_blocks  # type: ignore
+
+    label = f"max depth {max_depth}" if max_depth > 0 else "no retention"
+    print(f"{label}: {sum(downloaded)} blocks downloaded, "
+          f"{follower.validation_stats['signatures_verified']} signatures verified, "
+          f"{follower.validation_stats['signatures_skipped']} skipped, {elapsed:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--races", type=int, default=20, help="number of lead changes")
+    parser.add_argument("--max-depth", type=int, default=100, help="side-chain retention depth")
+    args = parser.parse_args()
+
+    miners = [Node(), Node()]
+    lead_changes: List[Tuple[int, BlockHash]] = []
+    for race in range(args.races):
+        miner, other = miners[race % 2], miners[1 - race % 2]
+        while len(miner.blockchain) <= len(other.blockchain):
+            mine(miner)
+        lead_changes.append((race % 2, miner.get_latest_hash()))
+    print(f"{args.races} lead changes, branches of {len(miners[0].blockchain)} and {len(miners[1].blockchain)} "
+          f"blocks")
+
+    follow(miners, lead_changes, 0)
+    follow(miners, lead_changes, args.max_depth)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Block hashing benchmark: how many times block hashes are computed, and how long it takes, when a fresh node
+catches up on a chain and when blocks propagate through a small network, with plain blocks and with sealed
+blocks (hash computed once, see SealedBlock). Also compares hashing a block by concatenating its content
+with streaming the txids into the hasher.
+
+    python -m ex2_bench.bench_hashing --blocks 2000
+"""
+import argparse
+import hashlib
+import time
+from typing import Any, Callable, Dict
+
+from ex2 import Node, Block
+from ex2.block import SealedBlock
+from ex2_bench.bench_propagation import random_graph
+
+
+def count_hashes(run: Callable[[], Any]) -> Dict[str, float]:
+    calls = 0
+    compute = Block._compute_block_hash
+
+    def counted(self: Block) -> bytes:
+        nonlocal calls
+        calls += 1
+        return compute(self)
+
+    Block._compute_block_hash = counted  # type: ignore
+    try:
+        start = time.perf_counter()
+        run()
+        return {"hashes": calls, "seconds": time.perf_counter() - start}
+    finally:
+        Block._compute_block_hash = compute  # type: ignore
+
+
+def catch_up(blocks: int, seal: bool) -> Dict[str, float]:
+    source = Node()
+    source.seal_blocks = seal
+    for _ in range(blocks):
+        source.mine_block()
+    fresh = Node()
+    fresh.seal_blocks = seal
+    return count_hashes(lambda: fresh.notify_of_block(source.get_latest_hash(), source))
+
+
+def propagate(nodes_count: int, blocks: int, seal: bool) -> Dict[str, float]:
+    nodes = random_graph(nodes_count, 4, seed=1)
+    for node in nodes:
+        node.seal_blocks = seal
+
+    def run() -> None:
+        for i in range(blocks):
+            nodes[i % nodes_count].mine_block()
+    return count_hashes(run)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=2000, help="length of the chain to catch up on")
+    parser.add_argument("--nodes", type=int, default=20, help="size of the network blocks propagate in")
+    parser.add_argument("--mined", type=int, default=50, help="blocks mined in the network")
+    args = parser.parse_args()
+
+    for seal in (False, True):
+        label = "sealed" if seal else "plain "
+        result = catch_up(args.blocks, seal)
+        print(f"{label} catch-up of {args.blocks} blocks: {result['hashes']:8d} block hashes, "
+              f"{result['seconds']:.3f}s")
+        result = propagate(args.nodes, args.mined, seal)
+        print(f"{label} {args.mined} blocks through {args.nodes} nodes: {result['hashes']:8d} block hashes, "
+              f"{result['seconds']:.3f}s")
+
+    source = Node()
+    source.mine_block()
+    block = source.blockchain[-1]
+    repeats = 100000
+    start = time.perf_counter()
+    for _ in range(repeats):
+        hashlib.sha256(block.get_prev_block_hash() + b"".join(tx.get_txid() for tx in block.get_transactions()))
+    concatenated = time.perf_counter() - start
+    plain = Block(block.get_prev_block_hash(), block.get_transactions())
+    start = time.perf_counter()
+    for _ in range(repeats):
+        plain.get_block_hash()
+    streamed = time.perf_counter() - start
+    start = time.perf_counter()
+    sealed_block = SealedBlock.seal(block)
+    for _ in range(repeats):
+        sealed_block.get_block_hash()
+    sealed = time.perf_counter() - start
+    print(f"per block hash: concatenated {concatenated / repeats * 1e6:.2f}us, "
+          f"streamed {streamed / repeats * 1e6:.2f}us, sealed {sealed / repeats * 1e6:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
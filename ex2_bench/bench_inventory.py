@@ -0,0 +1,66 @@
+"""
+Gossip benchmark on a dense random graph: how many announcements are sent, and how many of them reach a node
+that already had the item (a wasted receive and lookup), with and without per-peer inventory tracking.
+Runs with direct calls between nodes (depth first, so nodes often hear of an item from several peers before
+relaying it) and with the deterministic scheduler (breadth first, so most of the saving is not echoing the sender).
+
+    python -m ex2_bench.bench_inventory --nodes 100 --degree 30
+"""
+import argparse
+import random
+import time
+from typing import Any, Dict
+
+from ex2 import Node
+from ex2.scheduler import DeterministicScheduler
+from ex2_bench.bench_propagation import random_graph
+
+
+def run(nodes_count: int, degree: int, blocks: int, seed: int, track: bool, scheduled: bool) -> Dict[str, Any]:
+    nodes = random_graph(nodes_count, degree, seed)
+    for node in nodes:
+        node.track_peer_inventory = track
+    scheduler = DeterministicScheduler()
+    if scheduled:
+        scheduler.attach(nodes)
+    rng = random.Random(seed)
+
+    start = time.perf_counter()
+    miners = rng.sample(nodes, blocks)
+    for miner in miners:
+        miner.mine_block()
+        scheduler.run()
+    # every miner spends its coin to a random node
+    for miner in miners:
+        miner.create_transaction(rng.choice(nodes).get_address())
+        scheduler.run()
+    elapsed = time.perf_counter() - start
+
+    totals = {key: sum(node.relay_stats[key] for node in nodes) for key in nodes[0].relay_stats}
+    return {"messages": totals["announcements_sent"], "duplicates": totals["duplicates_received"],
+            "skipped": totals["announcements_skipped"], "seconds": elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--degree", type=int, default=30)
+    parser.add_argument("--blocks", type=int, default=20, help="blocks mined (and transactions sent)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.nodes} nodes, degree ~{args.degree}, {args.blocks} blocks and {args.blocks} transactions")
+    for scheduled in (False, True):
+        results = {track: run(args.nodes, args.degree, args.blocks, args.seed, track, scheduled)
+                   for track in (False, True)}
+        for track, result in results.items():
+            print(f"{'scheduler' if scheduled else 'direct':>9}, tracking {'on ' if track else 'off'}: "
+                  f"{result['messages']:7d} messages, {result['duplicates']:7d} duplicate receives, "
+                  f"{result['skipped']:7d} skipped announcements, {result['seconds']:.3f}s")
+        saved_messages = results[False]["messages"] - results[True]["messages"]
+        saved_receives = results[False]["duplicates"] - results[True]["duplicates"]
+        print(f"{'':>9}  saved {saved_messages} messages and {saved_receives} redundant receives")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Mempool stress benchmark: floods a single node with valid transactions, each spending a different coin,
+and reports the admission rate, the size and estimated memory of the mempool, evictions and the process's
+peak resident memory. The node's UTXO set is seeded directly with the coins being spent, and signing happens
+outside the timed part.
+
+    python -m ex2_bench.bench_mempool --transactions 1000000 --max-mb 300
+"""
+import argparse
+import resource
+import secrets
+import time
+
+from ex2 import Node, Transaction, Signature, TxID, sign, gen_keys
+
+CHUNK = 10000
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--max-mb", type=float, default=300, help="memory cap of the mempool")
+    args = parser.parse_args()
+
+    node = Node()
+    node.mem_pool.max_bytes = int(args.max_mb * 1000 * 1000)
+    private_key, public_key = gen_keys()
+    target = gen_keys()[1]
+    rss_before = peak_rss_mb()
+
+    admitted = 0
+    admit_seconds = 0.0
+    for start in range(0, args.transactions, CHUNK):
+        spends = []
+        for _ in range(min(CHUNK, args.transactions - start)):
+            coin = Transaction(public_key, TxID(secrets.token_bytes(32)), Signature(secrets.token_bytes(64)))
+            node.utxos[coin.get_txid()] = coin
+            spends.append(Transaction(target, coin.get_txid(), sign(coin.get_txid() + target, private_key)))
+
+        begin = time.perf_counter()
+        for tx in spends:
+            admitted += node.add_transaction_to_mempool(tx)
+        admit_seconds += time.perf_counter() - begin
+
+    print(f"{args.transactions} transactions, mempool cap {args.max_mb:.0f}MB")
+    print(f"admitted {admitted} at {admitted / admit_seconds:,.0f} tx/s (signature check included)")
+    print(f"mempool: {len(node.mem_pool)} transactions, ~{node.mem_pool.size_bytes / 1e6:.1f}MB estimated, "
+          f"{node.mem_pool.evictions} evicted")
+    print(f"peak RSS grew by {peak_rss_mb() - rss_before:.0f}MB (includes the seeded UTXO set)")
+
+
+if __name__ == "__main__":
+    main()
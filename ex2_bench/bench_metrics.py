@@ -0,0 +1,53 @@
+"""
+Metrics benchmark: a fresh node catches up with a chain of full blocks (a coinbase and 9 payments each) with
+metrics disabled and enabled, best of a few repeats, and reports the overhead of collecting the metrics and the
+time to render them.
+
+    python -m ex2_bench.bench_metrics --blocks 1000 --repeats 3
+"""
+import argparse
+import time
+
+from ex2 import BLOCK_SIZE, Node
+
+
+def catch_up(source: Node, metrics: bool) -> float:
+    node = Node()
+    if metrics:
+        node.enable_metrics()
+    began = time.perf_counter()
+    source.connect(node)
+    elapsed = time.perf_counter() - began
+    source.disconnect_from(node)
+    assert node.get_latest_hash() == source.get_latest_hash()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    source = Node()
+    for _ in range(args.blocks):
+        for _ in range(BLOCK_SIZE - 1):
+            if source.create_transaction(source.get_address()) is None:
+                break
+        source.mine_block()
+
+    disabled = min(catch_up(source, False) for _ in range(args.repeats))
+    enabled = min(catch_up(source, True) for _ in range(args.repeats))
+    print(f"catch-up of {args.blocks} blocks: {disabled:.3f}s without metrics, {enabled:.3f}s with metrics "
+          f"({(enabled / disabled - 1) * 100:+.1f}%)")
+
+    node = Node()
+    metrics = node.enable_metrics()
+    source.connect(node)
+    began = time.perf_counter()
+    text = metrics.registry.render()
+    print(f"render: {(time.perf_counter() - began) * 1e3:.2f}ms, {len(text)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Invalid-block flood benchmark: a peer that served a node an honest chain turns adversarial and keeps announcing an
+invalid block on top of it (a full block whose last payment has a bad signature), extending it with a new
+descendant every few announcements. Reports the CPU time the node spends on the flood, the blocks it downloads
+and the signatures it verifies, without defences, with the invalid-block cache only, and with the cache and
+misbehaviour scoring (which disconnects the peer). Then checks the node still follows an honest peer.
+
+    python -m ex2_bench.bench_misbehaviour --announcements 1000 --new-every 10
+"""
+import argparse
+import secrets
+import sys
+import time
+from typing import List
+
+from ex2 import BLOCK_SIZE, Block, BlockHash, Node, Signature, Transaction
+from ex2.misbehaviour import InvalidBlockCache, PeerScores
+
+
+def count_downloads(peer: Node, downloaded: List[int]) -> None:
+    """Records the number of blocks every get_blocks call on the peer asks for."""
+    get_blocks = peer.get_blocks
+
+    def counting_get_blocks(block_hashes: List[BlockHash]) -> List[Block]:
+        downloaded.append(len(block_hashes))
+        return get_blocks(block_hashes)
+    peer.get_blocks = counting_get_blocks  # type: ignore
+
+
+def make_invalid_block(attacker: Node) -> Block:
+    """A block of signed payments on top of the attacker's chain, except for the last one."""
+    payments = []
+    for _ in range(BLOCK_SIZE - 1):
+        payment = attacker.create_transaction(attacker.get_address())
+        assert payment is not None
+        payments.append(payment)
+    last = payments.pop()
+    forged = Transaction(last.output, last.input, Signature(secrets.token_bytes(64)))
+    coinbase = Transaction(attacker.get_address(), None, Signature(secrets.token_bytes(64)))
+    return Block(attacker.get_latest_hash(), [coinbase] + payments + [forged])
+
+
+def make_child(prev: BlockHash) -> Block:
+    return Block(prev, [Transaction(Node().get_address(), None, Signature(secrets.token_bytes(64)))])
+
+
+def flood(attacker: Node, invalid_branch: List[Block], new_every: int, announcements: int, label: str,
+          cache: bool, scoring: bool) -> None:
+    shared_chain = list(attacker.blockchain)
+    honest = Node()
+    honest.notify_of_block(attacker.get_latest_hash(), attacker)
+    victim = Node()
+    if not cache:
+        victim.invalid_blocks = InvalidBlockCache(max_size=0)
+    if not scoring:
+        victim.peer_scores = PeerScores(threshold=sys.maxsize)
+    victim.notify_of_block(attacker.get_latest_hash(), attacker)
+    victim.connect(attacker)
+    victim.connect(honest)
+    downloaded: List[int] = []
+    count_downloads(attacker, downloaded)
+    verified = victim.validation_stats["signatures_verified"]
+
+    began = time.process_time()
+    for announcement in range(announcements):
+        if announcement % new_every == 0:
+            # the attacker builds one more block on its invalid branch
+            attacker.blockchain = shared_chain + invalid_branch[:2 + announcement // new_every]
+            attacker.latest_block_hash = attacker.blockchain[-1].get_block_hash()
+        victim.notify_of_block(attacker.get_latest_hash(), attacker)
+    elapsed = time.process_time() - began
+    attacker.blockchain = shared_chain
+    attacker.latest_block_hash = shared_chain[-1].get_block_hash()
+    del attacker.get_blocks  # type: ignore
+
+    status = "connected" if attacker in victim.get_connections() else "disconnected"
+    # the attacker's chain must not change, so it doesn't hear of the honest block
+    attacker.disconnect_from(victim)
+    honest.mine_block()
+    follows_honest = victim.get_latest_hash() == honest.get_latest_hash()
+    honest.disconnect_from(victim)
+    print(f"{label}: {elapsed * 1000:.0f}ms CPU ({elapsed / announcements * 1e6:.0f}us per announcement), "
+          f"{sum(downloaded)} blocks downloaded, "
+          f"{victim.validation_stats['signatures_verified'] - verified} signatures verified, "
+          f"attacker {status}, follows honest peer: {follows_honest}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=50, help="length of the honest chain")
+    parser.add_argument("--announcements", type=int, default=1000)
+    parser.add_argument("--new-every", type=int, default=10, help="announcements per new invalid descendant")
+    args = parser.parse_args()
+
+    attacker = Node()
+    for _ in range(args.blocks):
+        attacker.mine_block()
+    invalid_branch = [make_invalid_block(attacker)]
+    attacker.clear_mempool()
+    for _ in range(args.announcements // args.new_every + 1):
+        invalid_branch.append(make_child(invalid_branch[-1].get_block_hash()))
+    print(f"honest chain of {args.blocks} blocks, {args.announcements} announcements of an invalid branch "
+          f"growing by one block every {args.new_every}")
+
+    flood(attacker, invalid_branch, args.new_every, args.announcements, "no defences", False, False)
+    flood(attacker, invalid_branch, args.new_every, args.announcements, "invalid-block cache", True, False)
+    flood(attacker, invalid_branch, args.new_every, args.announcements, "cache and scoring", True, True)
+
+
+if __name__ == "__main__":
+    main()
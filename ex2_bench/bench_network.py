@@ -0,0 +1,63 @@
+"""
+Network benchmark harness: runs the simulator (ex2.simulator) for one or more seeds and prints a summary,
+optionally writing the full reports as JSON for regression tracking, and the spans of all nodes as a Chrome trace
+(with stack samples of a sampling profiler, if asked for).
+
+    python -m ex2_bench.bench_network --nodes 200 --topology scale_free --seeds 1 2 3 --report network.json
+    python -m ex2_bench.bench_network --nodes 50 --duration 100 --trace network_trace.json --profile
+"""
+import argparse
+import json
+
+from ex2.simulator import TOPOLOGIES, Simulation
+from ex2.tracing import Tracer
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="random")
+    parser.add_argument("--degree", type=int, default=8)
+    parser.add_argument("--latency", type=float, nargs=2, default=(0.05, 0.2), metavar=("MIN", "MAX"),
+                        help="range of link latencies in seconds")
+    parser.add_argument("--block-interval", type=float, default=10.0, help="mean seconds between blocks")
+    parser.add_argument("--tx-rate", type=float, default=1.0, help="mean transactions per second")
+    parser.add_argument("--duration", type=float, default=300.0, help="simulated seconds of workload")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--report", help="write the reports to this JSON file")
+    parser.add_argument("--trace", help="write the spans of all runs to this Chrome trace file")
+    parser.add_argument("--profile", action="store_true", help="add stack samples to the trace")
+    args = parser.parse_args()
+
+    tracer = Tracer() if args.trace else None
+    if tracer is not None and args.profile:
+        tracer.start_profiler()
+
+    reports = []
+    for seed in args.seeds:
+        simulation = Simulation(nodes=args.nodes, topology=args.topology, degree=args.degree,
+                                latency=tuple(args.latency), block_interval=args.block_interval,
+                                tx_rate=args.tx_rate, duration=args.duration, seed=seed)
+        if tracer is not None:
+            simulation.enable_tracing(tracer)
+        report = simulation.run()
+        reports.append(report)
+        propagation = report["propagation_seconds"].get("p90_nodes", {})
+        print(f"seed {seed}: {report['blocks']['mined']} blocks ({report['blocks']['stale_rate']:.1%} stale), "
+              f"90% of nodes reached in {propagation.get('mean', float('nan')):.3f}s on average, "
+              f"{report['messages']['per_block']:.0f} messages per block, "
+              f"{report['validation']['cpu_seconds']:.3f}s validating, "
+              f"{report['transactions']['confirmed']}/{report['transactions']['created']} transactions confirmed, "
+              f"consistent={report['consistent']}, {report['wall_seconds']:.1f}s wall")
+
+    if tracer is not None:
+        tracer.stop_profiler()
+        tracer.write_chrome_trace(args.trace)
+        print(f"{len(tracer.spans)} spans written to {args.trace}")
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(reports, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Proof-of-work mining benchmark: hashes per second of the nonce search with 1, 2, ... worker processes
+(up to the number of cores), per core, and the scaling efficiency relative to a single process.
+Each run searches a fixed number of nonces per process against an impossible target.
+
+    python -m ex2_bench.bench_pow --hashes-per-process 2000000
+"""
+import argparse
+import os
+import time
+
+from ex2.pow import ProofOfWorkMiner, search_nonce
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hashes-per-process", type=int, default=2000000)
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    prefix = os.urandom(32 + 10 * 32)  # previous hash and ten txids
+
+    began = time.perf_counter()
+    search_nonce(prefix, 0, 0, args.hashes_per_process)
+    in_process_rate = args.hashes_per_process / (time.perf_counter() - began)
+    print(f"in process: {in_process_rate:,.0f} hashes/s")
+
+    single_rate = None
+    counts = sorted({2 ** i for i in range(args.max_processes.bit_length())} | {args.max_processes})
+    for processes in counts:
+        miner = ProofOfWorkMiner(processes)
+        try:
+            miner.find_nonce(prefix, 0, stop=processes)  # start the workers before measuring
+            miner.hashes, miner.seconds = 0, 0.0
+            miner.find_nonce(prefix, 0, stop=processes * args.hashes_per_process)
+            rate = miner.get_hash_rate()
+        finally:
+            miner.close()
+        single_rate = single_rate or rate
+        print(f"{processes:3d} processes: {rate:12,.0f} hashes/s, {rate / processes:12,.0f} per core, "
+              f"scaling efficiency {rate / (processes * single_rate):6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Block propagation benchmark on a random graph of nodes: one node mines a block and we measure how long it takes
+to reach every node and how many announcements were sent, with direct recursive calls, with the deterministic
+scheduler (simulated clock) and with the asyncio scheduler (real clock).
+
+    python -m ex2_bench.bench_propagation --nodes 1000 --degree 8 --latency 0.01
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from ex2 import BlockHash, Node
+from ex2.scheduler import AsyncioScheduler, DeterministicScheduler, Message, Scheduler
+
+
+def random_graph(count: int, degree: int, seed: int) -> List[Node]:
+    """Connects the nodes in a ring (so the graph is connected) plus random links up to about the given degree."""
+    rng = random.Random(seed)
+    nodes = [Node() for _ in range(count)]
+    for i, node in enumerate(nodes):
+        node.connect(nodes[(i + 1) % count])
+    for node in nodes:
+        while len(node.get_connections()) < degree:
+            other = rng.choice(nodes)
+            if other is not node:
+                node.connect(other)
+    return nodes
+
+
+def track_arrivals(scheduler: Scheduler, nodes: List[Node], block_hash: BlockHash) -> Dict[Node, float]:
+    arrivals: Dict[Node, float] = {nodes[0]: 0.0}
+
+    def on_delivery(message: Message, now: float) -> None:
+        if message.receiver not in arrivals and message.receiver.get_latest_hash() == block_hash:
+            arrivals[message.receiver] = now
+    scheduler.listeners.append(on_delivery)
+    return arrivals
+
+
+def run_direct(nodes: List[Node]) -> Dict[str, Any]:
+    # announcements go out as notify_of_block or notify_of_compact_block calls, every one is counted by the sender
+    sent_before = sum(node.relay_stats["announcements_sent"] for node in nodes)
+    start = time.perf_counter()
+    error = ""
+    try:
+        nodes[0].mine_block()
+    except RecursionError:
+        error = "RecursionError"
+    calls = sum(node.relay_stats["announcements_sent"] for node in nodes) - sent_before
+    block_hash = nodes[0].get_latest_hash()
+    reached = sum(1 for node in nodes if node.get_latest_hash() == block_hash)
+    return {"mode": "direct", "messages": calls, "reached": reached, "wall_seconds": time.perf_counter() - start,
+            "propagation": None, "error": error}
+
+
+def run_deterministic(nodes: List[Node], latency: float) -> Dict[str, Any]:
+    scheduler = DeterministicScheduler(latency)
+    scheduler.attach(nodes)
+    start = time.perf_counter()
+    block_hash = nodes[0].mine_block()
+    assert block_hash is not None
+    arrivals = track_arrivals(scheduler, nodes, block_hash)
+    scheduler.run()
+    return {"mode": "deterministic", "messages": scheduler.get_message_count(), "reached": len(arrivals),
+            "wall_seconds": time.perf_counter() - start, "propagation": max(arrivals.values()), "error": ""}
+
+
+def run_asyncio(nodes: List[Node], latency: float) -> Dict[str, Any]:
+    async def run() -> Dict[str, Any]:
+        scheduler = AsyncioScheduler(latency)
+        scheduler.attach(nodes)
+        start = time.perf_counter()
+        block_hash = nodes[0].mine_block()
+        assert block_hash is not None
+        arrivals = track_arrivals(scheduler, nodes, block_hash)
+        await scheduler.run_until_idle()
+        await scheduler.close()
+        return {"mode": "asyncio", "messages": scheduler.get_message_count(), "reached": len(arrivals),
+                "wall_seconds": time.perf_counter() - start, "propagation": max(arrivals.values()), "error": ""}
+    return asyncio.run(run())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--degree", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.01, help="link latency in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.nodes} nodes, degree ~{args.degree}, link latency {args.latency}s, "
+          f"recursion limit {sys.getrecursionlimit()}")
+    results = [run_direct(random_graph(args.nodes, args.degree, args.seed)),
+               run_deterministic(random_graph(args.nodes, args.degree, args.seed), args.latency),
+               run_asyncio(random_graph(args.nodes, args.degree, args.seed), args.latency)]
+    for result in results:
+        propagation = "-" if result["propagation"] is None else f"{result['propagation']:.3f}s"
+        print(f"{result['mode']:>13}: {result['messages']:7d} messages, reached {result['reached']:5d} nodes, "
+              f"propagation {propagation:>8}, wall {result['wall_seconds']:.3f}s {result['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Pruning benchmark: mines a long chain on a single node (with payments from the miner to itself in every block),
+once keeping every block body and once in prune mode, and reports the peak resident memory as the chain grows.
+Each mode runs in its own process.
+
+    python -m ex2_bench.bench_prune --blocks 1000000 --keep 1000
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import time
+
+from ex2 import Node
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(blocks: int, keep: int, payments: int, samples: int) -> None:
+    node = Node()
+    if keep > 0:
+        node.enable_pruning(keep)
+    label = f"keep {keep}" if keep > 0 else "no pruning"
+    began = time.perf_counter()
+    for height in range(1, blocks + 1):
+        for _ in range(payments):
+            node.create_transaction(node.get_address())
+        node.mine_block()
+        if height % max(1, blocks // samples) == 0:
+            print(f"{label}: {height} blocks, peak RSS {peak_rss_mb():.0f}MB, "
+                  f"{time.perf_counter() - began:.0f}s", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=1000000)
+    parser.add_argument("--keep", type=int, default=1000, help="block bodies kept in prune mode")
+    parser.add_argument("--payments", type=int, default=1, help="payments in every block")
+    parser.add_argument("--samples", type=int, default=10, help="memory samples per run")
+    parser.add_argument("--mode", choices=("full", "pruned"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        run(args.blocks, args.keep if args.mode == "pruned" else 0, args.payments, args.samples)
+        return
+    for mode in ("full", "pruned"):
+        subprocess.run([sys.executable, "-m", "ex2_bench.bench_prune", "--mode", mode, "--blocks", str(args.blocks),
+                        "--keep", str(args.keep), "--payments", str(args.payments),
+                        "--samples", str(args.samples)], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Transaction relay benchmark: a seeded random network on the simulated clock (link latencies of 50-200ms) gets
+--transactions payments submitted at random nodes at --tx-rate per second, relayed one message per transaction
+and then with batched relay at each --batches setting (max batch size:max delay in seconds). Reports the
+messages sent per transaction and the time until every node had a transaction (mean, median and 95th percentile).
+
+    python -m ex2_bench.bench_relay --nodes 30 --transactions 500 --tx-rate 200 --batches 10:0.05,50:0.1,200:0.25
+"""
+import argparse
+import random
+import statistics
+from typing import Dict, List, Optional, Set, Tuple
+
+from ex2 import Node, Transaction, TxID, sign
+from ex2.scheduler import DeterministicScheduler, Message
+from ex2.simulator import build_network, make_topology, percentile
+
+
+def fund(nodes: List[Node], count: int) -> None:
+    """Every node mines in turn until count blocks were mined, so that the senders own coins."""
+    for i in range(count):
+        nodes[i % len(nodes)].mine_block()
+
+
+def make_payments(nodes: List[Node], count: int, rng: random.Random) -> List[Tuple[Node, Transaction]]:
+    """Signed payments to random nodes, each spending another coin of its sender (without sending them)."""
+    coins: Dict[Node, List[TxID]] = {node: [coin.get_txid() for coin in node.get_utxo()
+                                            if coin.output == node.get_address()] for node in nodes}
+    payments = []
+    for i in range(count):
+        sender = nodes[i % len(nodes)]
+        txid = coins[sender].pop()
+        target = rng.choice(nodes).get_address()
+        payments.append((sender, Transaction(target, txid, sign(txid + target, sender.private_key))))
+    return payments
+
+
+def relay(nodes: List[Node], links: List[Tuple[int, int]], payments: List[Tuple[Node, Transaction]],
+          tx_rate: float, batch: Optional[Tuple[int, float]], seed: int) -> None:
+    rng = random.Random(seed)
+    index = {node: i for i, node in enumerate(nodes)}
+    link_latency = {link: rng.uniform(0.05, 0.2) for link in links}
+    scheduler = DeterministicScheduler(
+        lambda sender, receiver: link_latency[(min(index[sender], index[receiver]),
+                                               max(index[sender], index[receiver]))])
+    for node in nodes:
+        node.clear_mempool()
+        node.peer_inventory.clear()
+        node.relay_batcher = None
+        if batch is not None:
+            node.enable_transaction_batching(*batch)
+    scheduler.attach(nodes)
+
+    submitted: Dict[TxID, float] = {}
+    # the nodes that have each transaction, and how many of them there are with the time the last one got it
+    seen: Dict[TxID, Set[Node]] = {tx.get_txid(): {sender} for sender, tx in payments}
+    reached: Dict[TxID, List[float]] = {}
+
+    def record(message: Message, now: float) -> None:
+        if message.kind not in (Message.TRANSACTION, Message.TRANSACTIONS):
+            return
+        transactions = message.payload if message.kind == Message.TRANSACTIONS else [message.payload]
+        for tx in transactions:
+            txid = tx.get_txid()
+            if tx in message.receiver.mem_pool and message.receiver not in seen[txid]:
+                seen[txid].add(message.receiver)
+                reached[txid] = [len(seen[txid]), now]
+    scheduler.listeners.append(record)
+
+    def submit(sender: Node, tx: Transaction) -> None:
+        submitted[tx.get_txid()] = scheduler.now
+        reached[tx.get_txid()] = [1, scheduler.now]
+        assert sender.add_transaction_to_mempool(tx)
+
+    delay = 0.0
+    for sender, tx in payments:
+        delay += rng.expovariate(tx_rate)
+        scheduler.call_later(delay, lambda sender=sender, tx=tx: submit(sender, tx))  # type: ignore
+    scheduler.run()
+
+    latencies = [last - submitted[txid] for txid, (count, last) in reached.items() if count == len(nodes)]
+    assert len(latencies) == len(payments), "some transactions did not reach every node"
+    messages = sum(scheduler.messages_sent.get(kind, 0) for kind in (Message.TRANSACTION, Message.TRANSACTIONS))
+    label = "one message per transaction" if batch is None else f"batches of {batch[0]}, {batch[1] * 1000:.0f}ms"
+    print(f"{label}: {messages / len(payments):.2f} messages per transaction, "
+          f"latency to all nodes mean {statistics.mean(latencies) * 1000:.0f}ms, "
+          f"median {percentile(latencies, 0.5) * 1000:.0f}ms, p95 {percentile(latencies, 0.95) * 1000:.0f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=30)
+    parser.add_argument("--degree", type=int, default=8)
+    parser.add_argument("--transactions", type=int, default=500)
+    parser.add_argument("--tx-rate", type=float, default=200, help="transactions per second")
+    parser.add_argument("--batches", default="10:0.05,50:0.1,200:0.25",
+                        help="comma separated batch settings, each max batch size:max delay in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    links = make_topology("random", args.nodes, args.degree, rng)
+    nodes = build_network(args.nodes, links)
+    fund(nodes, args.transactions)
+    payments = make_payments(nodes, args.transactions, rng)
+    print(f"{args.nodes} nodes, {len(links)} links, {args.transactions} transactions at {args.tx_rate:g} per second")
+
+    relay(nodes, links, payments, args.tx_rate, None, args.seed)
+    for setting in args.batches.split(","):
+        size, delay = setting.split(":")
+        relay(nodes, links, payments, args.tx_rate, (int(size), float(delay)), args.seed)
+
+
+if __name__ == "__main__":
+    main()
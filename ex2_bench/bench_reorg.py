@@ -0,0 +1,64 @@
+"""
+Reorg benchmark: a node with a large mempool (valid transactions spending seeded coins) receives a block that
+extends its chain, and then a longer competing chain that disconnects its last blocks. Reports the time of both,
+which includes updating the mempool (transactions of disconnected blocks go back into it).
+
+    python -m ex2_bench.bench_reorg --mempool 100000 --depth 3
+"""
+import argparse
+import secrets
+import time
+
+from ex2 import Node, Signature, Transaction, TxID, gen_keys, sign
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mempool", type=int, default=100000)
+    parser.add_argument("--depth", type=int, default=3, help="blocks disconnected by the reorg")
+    args = parser.parse_args()
+    if args.depth < 1:
+        parser.error("--depth must be at least 1")
+
+    node, rival = Node(), Node()
+    node.connect(rival)
+    node.mine_block()
+    node.disconnect_from(rival)
+
+    # the node's own blocks, with payments that return to the mempool when they are disconnected (together with the
+    # extending block below, the reorg disconnects depth blocks)
+    for _ in range(args.depth - 1):
+        node.create_transaction(node.get_address())
+        node.mine_block()
+    for _ in range(args.depth + 1):
+        rival.mine_block()
+
+    private_key, public_key = gen_keys()
+    target = gen_keys()[1]
+    for _ in range(args.mempool):
+        coin = Transaction(public_key, TxID(secrets.token_bytes(32)), Signature(secrets.token_bytes(64)))
+        node.utxos[coin.get_txid()] = coin
+        assert node.add_transaction_to_mempool(
+            Transaction(target, coin.get_txid(), sign(coin.get_txid() + target, private_key)))
+
+    # a block extending the node's chain (sent by a peer that shares it)
+    extender = Node()
+    node.connect(extender)
+    node.disconnect_from(extender)
+    extender.mine_block()
+    began = time.perf_counter()
+    node.notify_of_block(extender.get_latest_hash(), extender)
+    connected = time.perf_counter() - began
+    assert node.get_latest_hash() == extender.get_latest_hash()
+    print(f"mempool of {len(node.mem_pool)}: connecting a block took {connected * 1e3:.1f}ms")
+
+    began = time.perf_counter()
+    node.notify_of_block(rival.get_latest_hash(), rival)
+    reorged = time.perf_counter() - began
+    assert node.get_latest_hash() == rival.get_latest_hash()
+    print(f"reorg disconnecting {args.depth} blocks took {reorged * 1e3:.1f}ms, "
+          f"mempool now holds {len(node.mem_pool)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Record/replay benchmark: runs a deterministic simulation (ex2.simulator) once without and once with a recorder,
+reports the recording overhead and the size of the recording, then replays it against the stock Node and against
+a variant (nodes that keep their chain as sealed blocks) and checks that every replayed node reaches its recorded
+tip. With --profile, the stock replay runs under cProfile and the functions with the most cumulative time are
+printed. An existing recording can be replayed with --replay.
+
+    python -m ex2_bench.bench_replay --nodes 50 --duration 300 --out run.rec --profile
+    python -m ex2_bench.bench_replay --replay run.rec
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import tempfile
+from typing import Callable, Dict
+
+from ex2 import Node
+from ex2.replay import Replayer
+from ex2.simulator import Simulation
+
+
+def make_sealing_node() -> Node:
+    node = Node()
+    node.seal_blocks = True
+    return node
+
+
+def replay(replayer: Replayer, label: str, node_factory: Callable[[], Node], profile: bool) -> None:
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    nodes = replayer.run(node_factory)
+    if profiler is not None:
+        profiler.disable()
+    mismatched = replayer.get_mismatched_tips(nodes)
+    print(f"replay with {label}: {replayer.stats['events']} events in {replayer.stats['seconds']:.2f}s, "
+          f"{replayer.stats['messages_sent']} messages sent, "
+          f"{len(nodes) - len(mismatched)}/{len(nodes)} nodes reached their recorded tip")
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--degree", type=int, default=8)
+    parser.add_argument("--block-interval", type=float, default=10.0, help="mean seconds between blocks")
+    parser.add_argument("--tx-rate", type=float, default=2.0, help="mean transactions per second")
+    parser.add_argument("--duration", type=float, default=300.0, help="simulated seconds of workload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="keep the recording in this file")
+    parser.add_argument("--replay", help="replay this recording instead of recording a new one")
+    parser.add_argument("--profile", action="store_true", help="profile the replay against the stock Node")
+    args = parser.parse_args()
+
+    path = args.replay
+    if path is None:
+        settings: Dict = {"nodes": args.nodes, "degree": args.degree, "block_interval": args.block_interval,
+                          "tx_rate": args.tx_rate, "duration": args.duration, "seed": args.seed,
+                          "deterministic": True}
+        plain = Simulation(**settings).run()
+        path = args.out or os.path.join(tempfile.mkdtemp(), "run.rec")
+        simulation = Simulation(**settings)
+        recorder = simulation.record(path)
+        recorded = simulation.run()
+        size = os.path.getsize(path)
+        print(f"{recorded['blocks']['mined']} blocks, {recorded['transactions']['created']} transactions, "
+              f"{recorder.events} events: run {plain['wall_seconds']:.2f}s, recorded run "
+              f"{recorded['wall_seconds']:.2f}s, recording {size / 1024:.0f}KB ({size / recorder.events:.1f} "
+              f"bytes per event)")
+
+    replayer = Replayer(path)
+    replay(replayer, "stock nodes", Node, args.profile)
+    replay(replayer, "sealed-block nodes", make_sealing_node, False)
+    if args.replay is None and args.out is None:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
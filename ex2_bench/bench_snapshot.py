@@ -0,0 +1,61 @@
+"""
+UTXO snapshot benchmark: a source node mines a chain of --blocks blocks (with --payments payments from the miner to
+itself in every block), takes a UTXO snapshot at its tip, and then mines one more block. A fresh node then gets to
+that new block once by a full sync from genesis, and once by loading the snapshot (with the headers up to its block)
+and downloading only the new block. Reports the time until each has validated the new block, the size of the
+snapshot, and how long the check of the history below the snapshot takes afterwards (run at once here, since the
+nodes have no scheduler to run it in steps between their messages).
+
+    python -m ex2_bench.bench_snapshot --blocks 5000 --payments 5
+"""
+import argparse
+import time
+
+from ex2 import Node
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=5000)
+    parser.add_argument("--payments", type=int, default=5, help="payments in every block")
+    args = parser.parse_args()
+
+    source = Node()
+    for _ in range(args.blocks):
+        for _ in range(args.payments):
+            source.create_transaction(source.get_address())
+        source.mine_block()
+    snapshot = source.create_utxo_snapshot()
+    data = snapshot.serialize()
+    for _ in range(args.payments):
+        source.create_transaction(source.get_address())
+    new_block = source.mine_block()
+    print(f"{args.blocks} blocks with {args.payments} payments each, snapshot of {len(snapshot.utxos)} coins "
+          f"({len(data) / 1024:.0f}KB)")
+
+    full = Node()
+    began = time.perf_counter()
+    full.notify_of_block(new_block, source)  # type: ignore
+    full_seconds = time.perf_counter() - began
+    assert full.get_latest_hash() == new_block
+    print(f"full sync: first new block validated after {full_seconds:.2f}s")
+
+    node = Node()
+    node.assume_utxo = (snapshot.block_hash, snapshot.content_hash)
+    began = time.perf_counter()
+    check = node.load_utxo_snapshot(data, source)
+    loaded = time.perf_counter()
+    node.notify_of_block(new_block, source)  # type: ignore
+    snapshot_seconds = time.perf_counter() - began
+    assert node.get_latest_hash() == new_block
+    print(f"snapshot: loaded in {loaded - began:.2f}s, first new block validated after {snapshot_seconds:.2f}s "
+          f"({full_seconds / snapshot_seconds:.0f}x sooner)")
+
+    began = time.perf_counter()
+    status = check.run()
+    print(f"history check: {status} after {time.perf_counter() - began:.2f}s ({check.stats['blocks']} blocks in "
+          f"{check.stats['steps']} steps)")
+
+
+if __name__ == "__main__":
+    main()
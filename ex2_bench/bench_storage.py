@@ -0,0 +1,84 @@
+"""
+Storage benchmark: builds a chain (one payment per block, from the miner to itself) in memory, writes it to a
+sqlite file, and then starts a fresh process from that file. Reports the resident memory of the in-memory node,
+the time to write the chain, and the startup time and resident memory of the node loaded from storage (block index
+and UTXO set; bodies are read on demand), plus the time of cold and cached get_block calls.
+
+    python -m ex2_bench.bench_storage --blocks 100000
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from ex2 import Node
+from ex2.storage import SqliteStorage
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build(path: str, blocks: int) -> None:
+    node = Node()
+    rss_before = peak_rss_mb()
+    began = time.perf_counter()
+    for _ in range(blocks):
+        node.create_transaction(node.get_address())
+        node.mine_block()
+    built = time.perf_counter() - began
+    print(f"built {blocks} blocks in memory in {built:.1f}s, RSS grew by {peak_rss_mb() - rss_before:.0f}MB")
+
+    began = time.perf_counter()
+    node.attach_storage(SqliteStorage(path))
+    print(f"wrote the chain to storage in {time.perf_counter() - began:.1f}s "
+          f"({os.path.getsize(path) / 1e6:.0f}MB file)")
+
+
+def startup(path: str) -> None:
+    rss_before = peak_rss_mb()
+    began = time.perf_counter()
+    node = Node()
+    node.attach_storage(SqliteStorage(path))
+    loaded = time.perf_counter() - began
+    print(f"started from storage in {loaded:.2f}s: {len(node.blockchain)} blocks, {len(node.utxos)} coins, "
+          f"RSS grew by {peak_rss_mb() - rss_before:.0f}MB")
+
+    rng = random.Random(0)
+    heights = [rng.randrange(len(node.blockchain)) for _ in range(1000)]
+    hashes = [node.blockchain.get_hash(height) for height in heights]  # type: ignore
+    for label in ("cold", "cached"):
+        began = time.perf_counter()
+        for block_hash in hashes:
+            node.get_block(block_hash)
+        print(f"get_block ({label}): {(time.perf_counter() - began) / len(hashes) * 1e6:.0f}us")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=100000)
+    parser.add_argument("--path", help="sqlite file to use (a temporary file by default)")
+    parser.add_argument("--phase", choices=("build", "startup"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase == "build":
+        build(args.path, args.blocks)
+        return
+    if args.phase == "startup":
+        startup(args.path)
+        return
+
+    # each phase runs in its own process, so their memory is measured separately
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.path or os.path.join(directory, "chain.db")
+        for phase in ("build", "startup"):
+            subprocess.run([sys.executable, "-m", "ex2_bench.bench_storage", "--phase", phase,
+                            "--path", path, "--blocks", str(args.blocks)], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Catch-up benchmark: a fresh node syncs a long chain from a single peer.
+Compares walking back one get_block call per block with headers-first sync (get_headers + batched get_blocks),
+counting the round trips made to the peer and the wall time of the whole catch-up.
+
+    python -m ex2_bench.bench_sync --blocks 10000
+"""
+import argparse
+import time
+from typing import Any, Dict
+
+from ex2 import Node
+
+
+class CountingPeer:
+    """Forwards every call to the wrapped node and counts the requests made to it."""
+
+    PEER_REQUESTS = ("get_block", "get_blocks", "get_headers")
+
+    def __init__(self, node: Node, headers_first: bool) -> None:
+        self.node = node
+        self.SUPPORTS_HEADERS_FIRST = headers_first
+        self.round_trips: Dict[str, int] = {name: 0 for name in self.PEER_REQUESTS}
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.node, name)
+        if name not in self.PEER_REQUESTS:
+            return attr
+
+        def counted(*args: Any, **kwargs: Any) -> Any:
+            self.round_trips[name] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+def catch_up(source: Node, headers_first: bool) -> Dict[str, Any]:
+    peer = CountingPeer(source, headers_first)
+    fresh = Node()
+    start = time.perf_counter()
+    fresh.notify_of_block(source.get_latest_hash(), peer)  # type: ignore
+    elapsed = time.perf_counter() - start
+    assert fresh.get_latest_hash() == source.get_latest_hash()
+    return {"mode": "headers-first" if headers_first else "block-by-block",
+            "round_trips": sum(peer.round_trips.values()),
+            "calls": peer.round_trips,
+            "seconds": elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=10000, help="length of the chain to catch up on")
+    args = parser.parse_args()
+
+    source = Node()
+    for _ in range(args.blocks):
+        source.mine_block()
+
+    print(f"catch-up of {args.blocks} blocks")
+    for headers_first in (False, True):
+        result = catch_up(source, headers_first)
+        print(f"{result['mode']:>15}: {result['round_trips']:6d} round trips "
+              f"{result['seconds']:8.3f}s  {result['calls']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Inter-process propagation benchmark: starts every node in its own process, connects them over TCP on localhost
+(ex2.transport) in the chosen topology, lets the first node mine blocks and reports how long each block takes to
+reach every node (as measured by the wall clock of the machine), and how many frames were sent.
+
+    python -m ex2_bench.bench_transport --nodes 8 --topology ring --blocks 20
+"""
+import argparse
+import asyncio
+import multiprocessing
+import queue
+import random
+import statistics
+import time
+from multiprocessing.connection import Connection
+from typing import Dict, List
+
+from ex2 import BlockHash, Node
+from ex2.simulator import TOPOLOGIES, make_topology
+from ex2.transport import NodeServer
+
+
+def run_node(index: int, commands: Connection, reports: 'multiprocessing.Queue[tuple]') -> None:
+    """The main function of a node process: follows the commands of the benchmark, and reports tip changes."""
+    async def run() -> None:
+        server = NodeServer(Node())
+        server.listeners.append(lambda tip: reports.put(("tip", index, tip, time.time())))
+        reports.put(("port", index, await server.start()))
+        loop = asyncio.get_running_loop()
+        while True:
+            command, argument = await loop.run_in_executor(None, commands.recv)
+            if command == "connect":
+                for port in argument:
+                    await server.connect_to("127.0.0.1", port)
+            elif command == "mine":
+                await server.call(server.node.mine_block)
+            elif command == "stop":
+                reports.put(("frames", index, sum(server.frames_sent.values())))
+                await server.close()
+                break
+            commands.send("done")
+    asyncio.run(run())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=8)
+    parser.add_argument("--topology", choices=TOPOLOGIES, default="ring")
+    parser.add_argument("--degree", type=int, default=3)
+    parser.add_argument("--blocks", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    reports: 'multiprocessing.Queue[tuple]' = multiprocessing.Queue()
+    pipes: List[Connection] = []
+    processes = []
+    for index in range(args.nodes):
+        parent_end, child_end = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=run_node, args=(index, child_end, reports))
+        process.start()
+        pipes.append(parent_end)
+        processes.append(process)
+    ports: Dict[int, int] = {}
+    while len(ports) < args.nodes:
+        _, index, port = reports.get()
+        ports[index] = port
+
+    links = make_topology(args.topology, args.nodes, args.degree, random.Random(args.seed))
+    for index in range(args.nodes):
+        pipes[index].send(("connect", [ports[b] for a, b in links if a == index]))
+        pipes[index].recv()
+
+    # arrival time of every block at every node
+    arrivals: Dict[BlockHash, Dict[int, float]] = {}
+
+    def collect(until: float) -> None:
+        while time.time() < until or not reports.empty():
+            try:
+                kind, index, tip, at = reports.get(timeout=max(0.01, until - time.time()))
+            except queue.Empty:
+                continue
+            arrivals.setdefault(tip, {}).setdefault(index, at)
+
+    for _ in range(args.blocks):
+        pipes[0].send(("mine", None))
+        pipes[0].recv()
+        collect(time.time() + 0.2)
+    collect(time.time() + 1.0)
+
+    # the blocks mined by the first node are the tips it reported, in order
+    mined = [tip for tip, times in arrivals.items() if 0 in times]
+    delays = [max(times.values()) - times[0] for tip, times in arrivals.items()
+              if 0 in times and len(times) == args.nodes]
+    for pipe in pipes:
+        pipe.send(("stop", None))
+    frames = 0
+    for _ in range(args.nodes):
+        while True:
+            report = reports.get()
+            if report[0] == "frames":
+                frames += report[2]
+                break
+    for process in processes:
+        process.join()
+
+    print(f"{args.nodes} processes, {args.topology} topology ({len(links)} links), {args.blocks} blocks")
+    print(f"{len(delays)}/{len(mined)} blocks reached every node; "
+          f"time to reach all nodes: mean {statistics.mean(delays) * 1e3:.1f}ms, max {max(delays) * 1e3:.1f}ms")
+    print(f"{frames} frames sent ({frames / max(1, len(mined)):.0f} per block)")
+
+
+if __name__ == "__main__":
+    main()
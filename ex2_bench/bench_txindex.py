@@ -0,0 +1,108 @@
+"""
+Transaction index benchmark: builds a synthetic chain of --transactions transactions (blocks of a coinbase and 9
+payments between --addresses addresses, with made up signatures, since the indexes don't validate), connects it
+to the tx index and to the address index, and reports the memory each index takes, the time to connect and
+disconnect a block, and the query latency. Each index is measured in its own process.
+
+    python -m ex2_bench.bench_txindex --transactions 1000000 --addresses 10000
+"""
+import argparse
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import List, Tuple, Union
+
+from ex2 import BLOCK_SIZE, Block, BlockHash, PublicKey, Signature, Transaction
+from ex2.txindex import AddressIndex, TxIndex
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_chain(transactions: int, addresses: int, rng: random.Random) -> List[Tuple[Block, List[Transaction]]]:
+    """Blocks in chain order, with the coins each one spends."""
+    keys = [PublicKey(rng.randbytes(91)) for _ in range(addresses)]
+    coins: List[Transaction] = []
+    chain: List[Tuple[Block, List[Transaction]]] = []
+    prev_hash = BlockHash(b"Genesis")
+    created = 0
+    while created < transactions:
+        spent: List[Transaction] = []
+        block_txs = [Transaction(rng.choice(keys), None, Signature(rng.randbytes(64)))]
+        while len(block_txs) < BLOCK_SIZE and coins and len(coins) > len(spent):
+            # spend a random coin created before this block
+            position = rng.randrange(len(coins) - len(spent))
+            coin = coins[position]
+            coins[position] = coins[len(coins) - len(spent) - 1]
+            coins[len(coins) - len(spent) - 1] = coin
+            spent.append(coin)
+            block_txs.append(Transaction(rng.choice(keys), coin.get_txid(), Signature(rng.randbytes(64))))
+        del coins[len(coins) - len(spent):]
+        coins += block_txs
+        block = Block(prev_hash, block_txs)
+        chain.append((block, spent))
+        prev_hash = block.get_block_hash()
+        created += len(block_txs)
+    return chain
+
+
+def run(kind: str, transactions: int, addresses: int, seed: int) -> None:
+    rng = random.Random(seed)
+    chain = make_chain(transactions, addresses, rng)
+    baseline = peak_rss_mb()
+    index: Union[TxIndex, AddressIndex] = TxIndex() if kind == "tx" else AddressIndex()
+
+    began = time.perf_counter()
+    for block, spent in chain:
+        index.connect_block(block, spent)
+    connect_seconds = time.perf_counter() - began
+    memory = peak_rss_mb() - baseline
+
+    queries = 10000
+    if isinstance(index, TxIndex):
+        txids = [block.get_transactions()[rng.randrange(len(block.get_transactions()))].get_txid()
+                 for block, _ in rng.choices(chain, k=queries)]
+        began = time.perf_counter()
+        for txid in txids:
+            assert index.get(txid) is not None
+    else:
+        keys = rng.choices(list(index.history), k=queries)
+        began = time.perf_counter()
+        for key in keys:
+            index.get(key)
+    query_seconds = time.perf_counter() - began
+
+    tail = chain[-100:]
+    began = time.perf_counter()
+    for block, spent in reversed(tail):
+        index.disconnect_block(block, spent)
+    disconnect_seconds = time.perf_counter() - began
+
+    print(f"{kind} index: {memory:.0f}MB for {transactions} transactions ({memory * 2 ** 20 / transactions:.0f} "
+          f"bytes per transaction), connect {connect_seconds / len(chain) * 1e6:.0f}us per block, "
+          f"disconnect {disconnect_seconds / len(tail) * 1e6:.0f}us per block, "
+          f"query {query_seconds / queries * 1e6:.2f}us", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--addresses", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("tx", "address"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        run(args.mode, args.transactions, args.addresses, args.seed)
+        return
+    for mode in ("tx", "address"):
+        subprocess.run([sys.executable, "-m", "ex2_bench.bench_txindex", "--mode", mode,
+                        "--transactions", str(args.transactions), "--addresses", str(args.addresses),
+                        "--seed", str(args.seed)], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Wallet benchmark: a node that mined a chain holds one coin per block. Reports the time of get_balance and of
+creating payments (each spending a new coin while the previous payments wait in the mempool) using the owned-coin
+index, against a scan of the whole UTXO set like the one the index replaces. Signing and mempool admission are
+included in the payment times.
+
+    python -m ex2_bench.bench_wallet --coins 100000 --payments 10000
+"""
+import argparse
+import time
+from typing import Optional
+
+from ex2 import Node, Transaction
+
+
+def scan_balance(node: Node) -> int:
+    return sum(1 for coin in node.utxos.values() if coin.output == node.get_address())
+
+
+def scan_select(node: Node) -> Optional[Transaction]:
+    for txid, coin in node.utxos.items():
+        if node.mem_pool.get_spender(txid) is None and coin.output == node.get_address():
+            return coin
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--coins", type=int, default=100000)
+    parser.add_argument("--payments", type=int, default=10000)
+    args = parser.parse_args()
+
+    node = Node()
+    target = Node().get_address()
+    for _ in range(args.coins):
+        node.mine_block()
+
+    began = time.perf_counter()
+    balance = node.get_balance()
+    indexed_balance = time.perf_counter() - began
+    began = time.perf_counter()
+    assert scan_balance(node) == balance
+    scanned_balance = time.perf_counter() - began
+    print(f"get_balance with {balance} coins: {indexed_balance * 1e6:.1f}us indexed, "
+          f"{scanned_balance * 1e3:.1f}ms scanning")
+
+    # the scan is timed on its own, interleaved with the payments that make its early coins pending
+    scan_seconds = 0.0
+    began = time.perf_counter()
+    for _ in range(args.payments):
+        scan_began = time.perf_counter()
+        coin = scan_select(node)
+        scan_seconds += time.perf_counter() - scan_began
+        tx = node.create_transaction(target)
+        assert tx is not None and coin is not None and tx.input == coin.get_txid()
+    total = time.perf_counter() - began - scan_seconds
+    print(f"{args.payments} payments: {total / args.payments * 1e6:.0f}us each with the index, "
+          f"{(total + scan_seconds) / args.payments * 1e6:.0f}us each with a scan for the coin")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from ex2 import *
+import secrets
+from typing import Callable, List
+from unittest.mock import Mock
+
+
+def make_paying_chain(node: Node, blocks: int) -> List[BlockHash]:
+    """mines blocks that each contain a payment (from the second block on)"""
+    hashes = []
+    for _ in range(blocks):
+        node.create_transaction(node.get_address())
+        hashes.append(node.mine_block())
+    return hashes  # type: ignore
+
+
+def forge_payment(source: Node, target: PublicKey) -> Transaction:
+    """a payment from one of the source's coins, with a made up signature"""
+    payment = source.create_transaction(target)
+    assert payment is not None
+    source.clear_mempool()
+    return Transaction(target, payment.input, Signature(secrets.token_bytes(64)))
+
+
+def make_coinbase(owner: Node) -> Transaction:
+    return Transaction(owner.get_address(), None, Signature(secrets.token_bytes(64)))
+
+
+def test_ancestors_of_checkpoint_skip_signatures(alice: Node, bob: Node) -> None:
+    hashes = make_paying_chain(alice, 10)
+    bob.assume_valid = hashes[6]
+    alice.connect(bob)
+
+    assert bob.get_latest_hash() == hashes[-1]
+    assert bob.validation_stats == {"signatures_skipped": 6, "signatures_verified": 3}
+    assert bob.get_utxo() and {tx.get_txid() for tx in bob.get_utxo()} == {tx.get_txid() for tx in alice.get_utxo()}
+
+
+def test_unknown_checkpoint_verifies_everything(alice: Node, bob: Node) -> None:
+    make_paying_chain(alice, 5)
+    bob.assume_valid = BlockHash(secrets.token_bytes(32))
+    alice.connect(bob)
+    assert bob.get_latest_hash() == alice.get_latest_hash()
+    assert bob.validation_stats == {"signatures_skipped": 0, "signatures_verified": 4}
+
+
+def test_forged_signature_before_checkpoint_is_trusted(alice: Node, bob: Node, charlie: Node,
+                                                       evil_node_maker: Callable[[List[Block]], Mock]) -> None:
+    alice.mine_block()
+    forged = Block(alice.get_latest_hash(), [make_coinbase(alice), forge_payment(alice, charlie.get_address())])
+    chain = alice.blockchain + [forged]
+    charlie.assume_valid = forged.get_block_hash()
+    charlie.notify_of_block(forged.get_block_hash(), evil_node_maker(chain))
+    assert charlie.get_latest_hash() == forged.get_block_hash()
+
+
+def test_forged_signature_after_checkpoint_is_rejected(alice: Node, bob: Node, charlie: Node,
+                                                       evil_node_maker: Callable[[List[Block]], Mock]) -> None:
+    alice.mine_block()
+    checkpoint = alice.mine_block()
+    forged = Block(checkpoint, [make_coinbase(alice), forge_payment(alice, charlie.get_address())])  # type: ignore
+    chain = alice.blockchain + [forged]
+    charlie.assume_valid = checkpoint
+    charlie.notify_of_block(forged.get_block_hash(), evil_node_maker(chain))
+    assert charlie.get_latest_hash() == checkpoint
+
+    # once the checkpoint is on the chain, later blocks are fully verified as well
+    charlie.notify_of_block(forged.get_block_hash(), evil_node_maker(chain))
+    assert charlie.get_latest_hash() == checkpoint
+
+
+def test_missing_coin_before_checkpoint_is_rejected(alice: Node, bob: Node, charlie: Node,
+                                                    evil_node_maker: Callable[[List[Block]], Mock]) -> None:
+    alice.mine_block()
+    spend_unknown = Transaction(charlie.get_address(), TxID(secrets.token_bytes(32)),
+                                Signature(secrets.token_bytes(64)))
+    invalid = Block(alice.get_latest_hash(), [make_coinbase(alice), spend_unknown])
+    checkpoint = Block(invalid.get_block_hash(), [make_coinbase(alice)])
+    chain = alice.blockchain + [invalid, checkpoint]
+    charlie.assume_valid = checkpoint.get_block_hash()
+    charlie.notify_of_block(checkpoint.get_block_hash(), evil_node_maker(chain))
+    assert charlie.get_latest_hash() == alice.get_latest_hash()
+
+
+def test_double_spend_before_checkpoint_is_rejected(alice: Node, charlie: Node,
+                                                    evil_node_maker: Callable[[List[Block]], Mock]) -> None:
+    alice.mine_block()
+    payment = forge_payment(alice, charlie.get_address())
+    double_spend = Transaction(alice.get_address(), payment.input, Signature(secrets.token_bytes(64)))
+    invalid = Block(alice.get_latest_hash(), [make_coinbase(alice), payment, double_spend])
+    chain = alice.blockchain + [invalid]
+    charlie.assume_valid = invalid.get_block_hash()
+    charlie.notify_of_block(invalid.get_block_hash(), evil_node_maker(chain))
+    assert charlie.get_latest_hash() == alice.get_latest_hash()
+
+
+def test_trusted_transactions_are_verified_before_returning_to_mempool(
+        alice: Node, charlie: Node, evil_node_maker: Callable[[List[Block]], Mock]) -> None:
+    alice.mine_block()
+    forged_payment = forge_payment(alice, charlie.get_address())
+    forged = Block(alice.get_latest_hash(), [make_coinbase(alice), forged_payment])
+    charlie.assume_valid = forged.get_block_hash()
+    charlie.notify_of_block(forged.get_block_hash(), evil_node_maker(alice.blockchain + [forged]))
+    assert charlie.get_latest_hash() == forged.get_block_hash()
+
+    # a longer chain disconnects the trusted block: its forged payment must not reach the mempool
+    alice.mine_block()
+    alice.mine_block()
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+    assert charlie.get_latest_hash() == alice.get_latest_hash()
+    assert forged_payment.input in charlie.utxos
+    assert charlie.get_mempool() == []
@@ -0,0 +1,37 @@
+from ex2.cluster import Cluster, MINE, PAY, workload_events
+import itertools
+import random
+from typing import Iterator, List, Tuple
+
+
+def take(events: Iterator[Tuple[float, str]], count: int) -> List[Tuple[float, str]]:
+    return list(itertools.islice(events, count))
+
+
+def test_workload_is_seeded() -> None:
+    first = take(workload_events(random.Random(5), 1.0, 0.1), 100)
+    assert first == take(workload_events(random.Random(5), 1.0, 0.1), 100)
+    assert first != take(workload_events(random.Random(6), 1.0, 0.1), 100)
+    times = [at for at, _ in first]
+    assert times == sorted(times)
+    assert {kind for _, kind in first} == {MINE, PAY}
+
+
+def test_workload_without_payments() -> None:
+    assert {kind for _, kind in take(workload_events(random.Random(0), 1.0, 0), 20)} == {MINE}
+    assert take(workload_events(random.Random(0), 0, 0), 1) == []
+
+
+def test_cluster_run() -> None:
+    cluster = Cluster(nodes=3, topology="ring", block_interval=0.1, tx_rate=20, duration=1.0, seed=1,
+                      consistency_timeout=10)
+    report = cluster.run()
+    assert all(not process.is_alive() for process in cluster.processes)
+    assert report["consistent"]
+    assert report["time_to_consistency"] is not None
+    assert len(report["nodes"]) == 3
+    assert all(node["peers"] == 2 and not node["errors"] for node in report["nodes"])
+    assert report["blocks"]["final_height"] > 0
+    assert report["blocks"]["mined"] >= report["blocks"]["final_height"]
+    assert report["transactions"]["confirmed"] <= report["transactions"]["created"]
+    assert report["transactions"]["confirmed_per_second"] >= 0
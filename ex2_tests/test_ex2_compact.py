@@ -0,0 +1,74 @@
+from ex2 import *
+from ex2.compact import CompactBlock, get_block_size
+import pytest
+from unittest.mock import Mock
+
+
+def test_block_is_rebuilt_from_mempool(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    alice.mine_block()
+    tx = alice.create_transaction(bob.get_address())
+    assert tx in bob.get_mempool()
+
+    alice.disconnect_from(bob)
+    spy = Mock(wraps=alice)
+    bob.notify_of_compact_block(alice.get_compact_block(alice.mine_block()), spy)
+
+    assert bob.get_latest_hash() == alice.get_latest_hash()
+    assert tx in bob.get_utxo()
+    assert bob.get_mempool() == []
+    assert bob.relay_stats["compact_blocks_reconstructed"] == 2
+    assert bob.relay_stats["compact_block_transactions_requested"] == 0
+    assert spy.get_block_transactions.call_count == 0
+    assert spy.get_blocks.call_count == 0
+
+
+def test_missing_transactions_are_requested(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    alice.mine_block()
+    alice.mine_block()
+    tx1 = alice.create_transaction(bob.get_address())
+    tx2 = alice.create_transaction(bob.get_address())
+    bob.clear_mempool()
+    bob.add_transaction_to_mempool(tx2)
+
+    alice.mine_block()
+    assert bob.get_latest_hash() == alice.get_latest_hash()
+    assert tx1 in bob.get_utxo() and tx2 in bob.get_utxo()
+    assert bob.relay_stats["compact_block_transactions_requested"] == 1
+
+
+def test_compact_block_not_extending_tip_is_synced(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    h2 = alice.mine_block()
+    bob.notify_of_compact_block(alice.get_compact_block(h2), alice)
+    assert bob.get_latest_hash() == h2
+    assert bob.relay_stats["compact_blocks_reconstructed"] == 0
+
+
+def test_compact_block_reconstruct(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    alice.mine_block()
+    tx1 = alice.create_transaction(bob.get_address())
+    tx2 = alice.create_transaction(bob.get_address())
+    block = alice.get_block(alice.mine_block())
+    compact_block = CompactBlock.from_block(block)
+
+    assert compact_block.get_transaction_count() == 3
+    assert compact_block.prefilled == [(0, block.get_transactions()[0])]
+    assert compact_block.get_size() < get_block_size(block)
+    transactions, missing = compact_block.reconstruct([tx2])
+    assert transactions == [block.get_transactions()[0], None, tx2] or \
+        transactions == [block.get_transactions()[0], tx2, None]
+    assert len(missing) == 1
+    transactions, missing = compact_block.reconstruct([tx1, tx2])
+    assert transactions == block.get_transactions()
+    assert missing == []
+
+
+def test_malformed_compact_block_is_rejected(alice: Node) -> None:
+    block = alice.get_block(alice.mine_block())
+    compact_block = CompactBlock.from_block(block)
+    compact_block.prefilled = [(3, block.get_transactions()[0])]
+    with pytest.raises(ValueError):
+        compact_block.reconstruct([])
@@ -0,0 +1,125 @@
+from ex2 import *
+from ex2.filters import MAX_FILTERS_PER_REQUEST, build_block_filter, build_filter, decode_filter, filter_matches_any
+from ex2.light_wallet import LightWallet
+import secrets
+from unittest.mock import Mock
+
+import pytest
+
+
+def test_filter_round_trip() -> None:
+    block_hash = BlockHash(secrets.token_bytes(32))
+    items = [secrets.token_bytes(32) for _ in range(50)]
+    data = build_filter(block_hash, items)
+    assert decode_filter(block_hash, data)[0] == 50
+    assert all(filter_matches_any(block_hash, data, [item]) for item in items)
+    others = [secrets.token_bytes(32) for _ in range(1000)]
+    assert sum(filter_matches_any(block_hash, data, [item]) for item in others) <= 2
+    assert not filter_matches_any(block_hash, build_filter(block_hash, []), items)
+    with pytest.raises(ValueError):
+        decode_filter(block_hash, data[:-5])
+
+
+def test_block_filter_items(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    payment = alice.create_transaction(bob.get_address())
+    assert payment is not None
+    alice.mine_block()
+    block = alice.blockchain[-1]
+    block_filter = build_block_filter(block)
+    assert filter_matches_any(block.get_block_hash(), block_filter, [bob.get_address()])
+    assert filter_matches_any(block.get_block_hash(), block_filter, [payment.input])  # type: ignore
+    assert not filter_matches_any(block.get_block_hash(), block_filter, [Node().get_address()])
+
+
+def test_get_filters(alice: Node) -> None:
+    with pytest.raises(ValueError):
+        alice.get_filters(0, GENESIS_BLOCK_PREV)
+    alice.mine_block()
+    index = alice.enable_block_filters()
+    for _ in range(4):
+        alice.mine_block()
+    assert len(index) == 5
+    assert alice.get_filters(0, alice.get_latest_hash()) == [build_block_filter(block) for block in alice.blockchain]
+    assert len(alice.get_filters(2, alice.blockchain[3].get_block_hash())) == 2
+    for start, stop in [(3, alice.blockchain[2].get_block_hash()), (-1, alice.get_latest_hash()),
+                        (0, BlockHash(secrets.token_bytes(32)))]:
+        with pytest.raises(ValueError):
+            alice.get_filters(start, stop)
+
+
+def test_get_filters_limit(alice: Node) -> None:
+    alice.enable_block_filters()
+    for _ in range(MAX_FILTERS_PER_REQUEST + 1):
+        alice.mine_block()
+    with pytest.raises(ValueError):
+        alice.get_filters(0, alice.get_latest_hash())
+    assert len(alice.get_filters(1, alice.get_latest_hash())) == MAX_FILTERS_PER_REQUEST
+
+
+def test_filter_index_follows_reorgs(alice: Node, bob: Node) -> None:
+    index = alice.enable_block_filters()
+    alice.connect(bob)
+    alice.mine_block()
+    alice.disconnect_from(bob)
+    alice.mine_block()
+    for _ in range(2):
+        bob.mine_block()
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    assert set(index.filters) == {block.get_block_hash() for block in alice.blockchain}
+
+
+def test_light_wallet_downloads_matching_blocks(alice: Node, charlie: Node) -> None:
+    alice.enable_block_filters()
+    wallet = LightWallet(charlie.get_address())
+    for height in range(30):
+        if height % 10 == 5:
+            alice.create_transaction(charlie.get_address())
+        alice.mine_block()
+    wallet.sync(alice)
+    assert wallet.get_latest_hash() == alice.get_latest_hash()
+    assert wallet.get_balance() == 3
+    assert wallet.stats["filters"] == 30 and wallet.stats["headers"] == 30
+    assert wallet.stats["blocks"] == 3 + wallet.stats["false_positives"]
+
+    # charlie spends a coin and receives one, and the wallet follows
+    alice.connect(charlie)
+    charlie.create_transaction(alice.get_address())
+    charlie.mine_block()
+    wallet.sync(alice)
+    assert wallet.get_balance() == charlie.get_balance() == 3
+    assert set(wallet.coins) == {tx.get_txid() for tx in charlie.get_utxo() if tx.output == charlie.get_address()}
+    wallet.sync(alice)
+    assert wallet.stats["filters"] == 31
+
+
+def test_light_wallet_follows_reorg(alice: Node, bob: Node, charlie: Node) -> None:
+    alice.enable_block_filters()
+    alice.connect(bob)
+    alice.mine_block()
+    alice.disconnect_from(bob)
+    alice.create_transaction(charlie.get_address())
+    alice.mine_block()
+    wallet = LightWallet(charlie.get_address())
+    wallet.sync(alice)
+    assert wallet.get_balance() == 1
+
+    for _ in range(2):
+        bob.mine_block()
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    alice.mine_block()
+    wallet.sync(alice)
+    assert wallet.get_latest_hash() == alice.get_latest_hash()
+    # the payment went back to alice's mempool, and from there into her last block
+    assert wallet.get_balance() == 1
+    assert set(wallet.coins) == {alice.blockchain[-1].get_transactions()[1].get_txid()}
+
+
+def test_light_wallet_needs_filters(alice: Node) -> None:
+    wallet = LightWallet(alice.get_address())
+    with pytest.raises(ValueError):
+        wallet.sync(Mock())
+    alice.mine_block()
+    with pytest.raises(ValueError):
+        wallet.sync(alice)
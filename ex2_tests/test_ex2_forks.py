@@ -0,0 +1,128 @@
+from ex2 import *
+import secrets
+from typing import Callable, List
+from unittest.mock import Mock
+
+
+def make_spy(node: Node) -> Mock:
+    """wraps a node so that the calls made to it can be counted"""
+    spy = Mock(wraps=node)
+    spy.SUPPORTS_HEADERS_FIRST = True
+    return spy
+
+
+def requested_blocks(spy: Mock) -> List[BlockHash]:
+    return [block_hash for call in spy.get_blocks.call_args_list for block_hash in call.args[0]]
+
+
+def mine_paying_blocks(node: Node, count: int) -> List[BlockHash]:
+    hashes = []
+    for _ in range(count):
+        node.create_transaction(node.get_address())
+        hashes.append(node.mine_block())
+    return hashes  # type: ignore
+
+
+def test_reorg_back_reuses_disconnected_blocks(alice: Node, bob: Node, charlie: Node) -> None:
+    alice_branch = mine_paying_blocks(alice, 3)
+    mine_paying_blocks(bob, 4)
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+    charlie.notify_of_block(bob.get_latest_hash(), bob)
+    assert charlie.get_latest_hash() == bob.get_latest_hash()
+    assert charlie.get_chain_tips() == {bob.get_latest_hash(): 4, alice_branch[-1]: 3}
+
+    # alice's branch overtakes again: only her new blocks are downloaded, and the old ones are not verified again
+    new_blocks = mine_paying_blocks(alice, 2)
+    spy = make_spy(alice)
+    verified = charlie.validation_stats["signatures_verified"]
+    charlie.notify_of_block(alice.get_latest_hash(), spy)
+
+    assert charlie.get_latest_hash() == alice.get_latest_hash()
+    assert requested_blocks(spy) == new_blocks
+    assert charlie.validation_stats["signatures_verified"] == verified + 2
+    assert charlie.validation_stats["signatures_skipped"] == 2
+    assert charlie.side_chains.stats["reused"] == 3
+    assert set(charlie.get_utxo()) == set(alice.get_utxo())
+    assert charlie.get_chain_tips() == {alice.get_latest_hash(): 5, bob.get_latest_hash(): 4}
+
+
+def test_shorter_branch_downloaded_block_by_block_is_kept(alice: Node, bob: Node,
+                                                          evil_node_maker: Callable[[List[Block]], Mock]) -> None:
+    for _ in range(3):
+        alice.mine_block()
+    for _ in range(2):
+        bob.mine_block()
+    peer = evil_node_maker(list(bob.blockchain))
+    alice.notify_of_block(bob.get_latest_hash(), peer)
+    assert alice.get_latest_hash() != bob.get_latest_hash()
+    assert peer.get_block.call_count == 2
+    assert len(alice.side_chains) == 2
+
+    for _ in range(2):
+        bob.mine_block()
+    peer = evil_node_maker(list(bob.blockchain))
+    alice.notify_of_block(bob.get_latest_hash(), peer)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    assert peer.get_block.call_count == 2
+    assert len(alice.side_chains) == 3
+
+
+def test_announcing_a_kept_block_is_a_duplicate(alice: Node, bob: Node, charlie: Node) -> None:
+    mine_paying_blocks(alice, 1)
+    mine_paying_blocks(bob, 2)
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+    charlie.notify_of_block(bob.get_latest_hash(), bob)
+    spy = make_spy(alice)
+    charlie.notify_of_block(alice.get_latest_hash(), spy)
+    assert spy.get_headers.call_count == 0
+    assert charlie.relay_stats["duplicates_received"] == 1
+
+
+def test_depth_limit(alice: Node, bob: Node, charlie: Node) -> None:
+    charlie.side_chains.max_depth = 2
+    alice.mine_block()
+    bob.mine_block()
+    bob.mine_block()
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+    charlie.notify_of_block(bob.get_latest_hash(), bob)
+    assert alice.get_latest_hash() in charlie.side_chains
+
+    bob.mine_block()
+    charlie.notify_of_block(bob.get_latest_hash(), bob)
+    assert len(charlie.side_chains) == 0
+    assert charlie.side_chains.stats["evicted"] == 1
+
+
+def test_retention_disabled(alice: Node, bob: Node, charlie: Node) -> None:
+    charlie.side_chains.max_depth = 0
+    alice.mine_block()
+    bob.mine_block()
+    bob.mine_block()
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+    charlie.notify_of_block(bob.get_latest_hash(), bob)
+    assert len(charlie.side_chains) == 0
+    assert charlie.get_chain_tips() == {bob.get_latest_hash(): 2}
+
+
+def test_switch_back_when_longer_chain_is_invalid_partway(alice: Node, bob: Node, charlie: Node,
+                                                          evil_node_maker: Callable[[List[Block]], Mock]) -> None:
+    honest = mine_paying_blocks(alice, 3)
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+
+    # a longer fork whose second block spends a coin that doesn't exist
+    bob.mine_block()
+    invalid = Block(bob.get_latest_hash(), [Transaction(bob.get_address(), TxID(secrets.token_bytes(32)),
+                                                        Signature(secrets.token_bytes(64)))])
+    children = [Block(invalid.get_block_hash(), [Transaction(bob.get_address(), None,
+                                                             Signature(secrets.token_bytes(64)))])]
+    children.append(Block(children[0].get_block_hash(), [Transaction(bob.get_address(), None,
+                                                                      Signature(secrets.token_bytes(64)))]))
+    attacker = evil_node_maker(bob.blockchain + [invalid] + children)
+    charlie.notify_of_block(children[-1].get_block_hash(), attacker)
+
+    # the fork is cut at the invalid block, so the honest chain is longer again
+    assert charlie.get_latest_hash() == honest[-1]
+    assert len(charlie.blockchain) == 3
+    assert set(charlie.get_utxo()) == set(alice.get_utxo())
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+    assert charlie.get_latest_hash() == honest[-1]
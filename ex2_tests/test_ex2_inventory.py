@@ -0,0 +1,74 @@
+from ex2 import *
+from ex2.inventory import KnownInventory
+from ex2.scheduler import DeterministicScheduler, Message
+from typing import List
+
+
+def make_clique(count: int) -> List[Node]:
+    nodes = [Node() for _ in range(count)]
+    for i, node in enumerate(nodes):
+        for other in nodes[i + 1:]:
+            node.connect(other)
+    return nodes
+
+
+def test_block_is_not_announced_back_to_sender(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    alice.mine_block()
+    assert bob.relay_stats["announcements_sent"] == 0
+    assert alice.relay_stats["duplicates_received"] == 0
+
+
+def test_transaction_is_not_sent_back_to_sender(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    alice.mine_block()
+    skipped = bob.relay_stats["announcements_skipped"]
+    tx = alice.create_transaction(bob.get_address())
+    assert tx in bob.get_mempool()
+    assert bob.relay_stats["announcements_skipped"] == skipped + 1
+    assert alice.relay_stats["duplicates_received"] == 0
+
+
+def test_clique_announces_each_item_once_per_link() -> None:
+    nodes = make_clique(5)
+    scheduler = DeterministicScheduler()
+    scheduler.attach(nodes)
+    nodes[0].mine_block()
+    scheduler.run()
+    nodes[0].create_transaction(nodes[1].get_address())
+    scheduler.run()
+
+    # every node learns each item once, and only tells the nodes that didn't tell it first
+    assert all(len(node.get_mempool()) == 1 for node in nodes)
+    assert scheduler.messages_sent[Message.COMPACT_BLOCK] <= 4 + 3 * 4
+    assert scheduler.messages_sent[Message.TRANSACTION] <= 4 + 3 * 4
+    duplicates = sum(node.relay_stats["duplicates_received"] for node in nodes)
+
+    untracked = make_clique(5)
+    for node in untracked:
+        node.track_peer_inventory = False
+    scheduler = DeterministicScheduler()
+    scheduler.attach(untracked)
+    untracked[0].mine_block()
+    scheduler.run()
+    untracked[0].create_transaction(untracked[1].get_address())
+    scheduler.run()
+    assert sum(node.relay_stats["duplicates_received"] for node in untracked) > duplicates
+
+
+def test_inventory_is_forgotten_on_disconnect(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    alice.mine_block()
+    assert bob in alice.peer_inventory
+    alice.disconnect_from(bob)
+    assert bob not in alice.peer_inventory
+    assert alice not in bob.peer_inventory
+
+
+def test_known_inventory_is_bounded() -> None:
+    inventory = KnownInventory(max_size=2)
+    for item in (b"a", b"b", b"c"):
+        inventory.add(item)
+    assert len(inventory) == 2
+    assert b"a" not in inventory
+    assert b"c" in inventory
@@ -0,0 +1,69 @@
+from ex2 import *
+from ex2.mempool import Mempool, get_entry_size
+import secrets
+from typing import List
+
+
+def make_spends(count: int) -> List[Transaction]:
+    """transactions spending different (made up) coins"""
+    return [Transaction(gen_keys()[1], TxID(secrets.token_bytes(32)), Signature(secrets.token_bytes(64)))
+            for _ in range(count)]
+
+
+def test_mempool_indexes_by_txid_and_spent_coin() -> None:
+    mempool = Mempool()
+    tx1, tx2 = make_spends(2)
+    assert mempool.add(tx1) and mempool.add(tx2)
+    assert tx1 in mempool
+    assert mempool.get(tx2.get_txid()) is tx2
+    assert mempool.get_spender(tx1.input) is tx1  # type: ignore
+
+    double_spend = Transaction(gen_keys()[1], tx1.input, Signature(secrets.token_bytes(64)))
+    assert not mempool.add(double_spend)
+    assert mempool.get_transactions() == [tx1, tx2]
+
+    mempool.remove(tx1.get_txid())
+    assert mempool.get_spender(tx1.input) is None  # type: ignore
+    assert mempool.size_bytes == get_entry_size(tx2)
+
+
+def test_mempool_evicts_oldest_over_memory_cap() -> None:
+    transactions = make_spends(5)
+    mempool = Mempool(max_bytes=3 * get_entry_size(transactions[0]))
+    for tx in transactions:
+        assert mempool.add(tx)
+    assert mempool.get_transactions() == transactions[2:]
+    assert mempool.evictions == 2
+    assert mempool.get_spender(transactions[0].input) is None  # type: ignore
+
+
+def test_block_removes_included_and_conflicting_transactions() -> None:
+    mempool = Mempool()
+    tx1, tx2, tx3 = make_spends(3)
+    for tx in (tx1, tx2, tx3):
+        mempool.add(tx)
+    conflict = Transaction(gen_keys()[1], tx2.input, Signature(secrets.token_bytes(64)))
+    mempool.remove_for_block(Block(GENESIS_BLOCK_PREV, [tx1, conflict]))
+    assert mempool.get_transactions() == [tx3]
+
+
+def test_node_drops_mempool_spend_of_coin_spent_in_block(alice: Node, bob: Node, charlie: Node) -> None:
+    alice.connect(bob)
+    alice.mine_block()
+    alice.disconnect_from(bob)
+    tx_to_bob = alice.create_transaction(bob.get_address())
+    alice.clear_mempool()
+    tx_to_charlie = alice.create_transaction(charlie.get_address())
+    assert bob.add_transaction_to_mempool(tx_to_bob)  # type: ignore
+
+    alice.mine_block()
+    alice.connect(bob)
+    assert tx_to_charlie in bob.get_utxo()
+    assert bob.get_mempool() == []
+
+
+def test_get_mempool_returns_a_copy(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    tx = alice.create_transaction(bob.get_address())
+    alice.get_mempool().clear()
+    assert alice.get_mempool() == [tx]
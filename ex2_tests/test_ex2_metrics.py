@@ -0,0 +1,145 @@
+from ex2 import *
+from ex2.metrics import MetricsRegistry, MetricsServer
+import secrets
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, List
+from unittest.mock import Mock
+
+import pytest
+
+
+def parse(text: str) -> Dict[str, float]:
+    """the samples of a Prometheus text exposition, by name (with labels)"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_registry_renders_prometheus_text() -> None:
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests")
+    counter.inc()
+    counter.inc(2)
+    registry.gauge("queue_length", "Queue length", lambda: 7)
+    histogram = registry.histogram("latency_seconds", "Latency", [0.1, 1.0])
+    for value in [0.05, 0.5, 0.5, 3.0]:
+        histogram.observe(value)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert "# HELP queue_length Queue length" in text
+    assert "# TYPE latency_seconds histogram" in text
+    assert parse(text) == {"requests_total": 3, "queue_length": 7,
+                           'latency_seconds_bucket{le="0.1"}': 1, 'latency_seconds_bucket{le="1.0"}': 3,
+                           'latency_seconds_bucket{le="+Inf"}': 4, "latency_seconds_sum": 4.05,
+                           "latency_seconds_count": 4}
+
+
+def test_registry_rejects_bad_metrics() -> None:
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests")
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "Requests again")
+    with pytest.raises(ValueError):
+        counter.inc(-1)
+    with pytest.raises(ValueError):
+        registry.histogram("latency_seconds", "Latency", [1.0, 0.1])
+
+
+def test_node_metrics(alice: Node, bob: Node) -> None:
+    metrics = bob.enable_metrics()
+    for _ in range(3):
+        alice.create_transaction(alice.get_address())
+        alice.mine_block()
+    alice.connect(bob)
+    alice.create_transaction(bob.get_address())
+
+    samples = parse(metrics.registry.render())
+    assert samples["ex2_blocks_received_total"] == 3
+    assert samples["ex2_blocks_validated_total"] == 3
+    assert samples["ex2_blocks_rejected_total"] == 0
+    assert samples["ex2_signatures_verified_total"] == 2
+    assert samples["ex2_reorgs_total"] == 0
+    assert samples["ex2_chain_height"] == 3
+    assert samples["ex2_mempool_transactions"] == 1
+    assert samples["ex2_utxo_count"] == 3
+    assert samples["ex2_validate_block_seconds_count"] == 3
+    assert samples["ex2_update_mempool_and_utxo_seconds_count"] == 3
+    assert samples["ex2_notify_of_block_seconds_count"] == 1
+
+    with pytest.raises(ValueError):
+        bob.enable_metrics()
+
+
+def test_blocks_received_by_compact_relay_are_timed(alice: Node, bob: Node) -> None:
+    metrics = bob.enable_metrics()
+    alice.connect(bob)
+    alice.create_transaction(bob.get_address())
+    received = metrics.notify_of_block_seconds.count
+    alice.mine_block()
+    assert bob.relay_stats["compact_blocks_reconstructed"] == 1
+    assert metrics.notify_of_block_seconds.count == received + 1
+
+    # a compact block that doesn't extend bob's chain is synced through notify_of_block, and still timed once
+    alice.disconnect_from(bob)
+    alice.mine_block()
+    # (linked without connect(), which would sync bob right away)
+    bob.connections.add(alice)
+    alice.connections.add(bob)
+    received = metrics.notify_of_block_seconds.count
+    alice.mine_block()
+    assert bob.get_latest_hash() == alice.get_latest_hash()
+    assert bob.relay_stats["compact_blocks_reconstructed"] == 1
+    assert metrics.notify_of_block_seconds.count == received + 1
+
+
+def test_rejected_block_is_counted(alice: Node, bob: Node, evil_node_maker: Callable[[List[Block]], Mock]) -> None:
+    metrics = bob.enable_metrics()
+    alice.mine_block()
+    bad = Block(alice.get_latest_hash(), [Transaction(bob.get_address(), TxID(secrets.token_bytes(32)),
+                                                      Signature(secrets.token_bytes(64)))])
+    bob.notify_of_block(bad.get_block_hash(), evil_node_maker(alice.blockchain + [bad]))
+    assert bob.get_latest_hash() == alice.get_latest_hash()
+    assert metrics.blocks_validated.get() == 1
+    assert metrics.blocks_rejected.get() == 1
+
+
+def test_reorg_is_counted(alice: Node, bob: Node) -> None:
+    metrics = alice.enable_metrics()
+    alice.connect(bob)
+    alice.mine_block()
+    alice.disconnect_from(bob)
+    alice.mine_block()
+    alice.mine_block()
+    for _ in range(3):
+        bob.mine_block()
+
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    assert metrics.reorgs.get() == 1
+    assert metrics.reorg_depth.count == 1 and metrics.reorg_depth.sum == 2
+
+
+def test_metrics_are_off_by_default(alice: Node) -> None:
+    assert alice.metrics is None
+    assert "notify_of_block" not in vars(alice)
+    assert "validate_block" not in vars(alice)
+
+
+def test_metrics_server(alice: Node) -> None:
+    metrics = alice.enable_metrics()
+    alice.mine_block()
+    server = MetricsServer(metrics.registry)
+    port = server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert parse(response.read().decode())["ex2_chain_height"] == 1
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other")
+    finally:
+        server.close()
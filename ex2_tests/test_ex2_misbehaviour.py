@@ -0,0 +1,144 @@
+from ex2 import *
+from ex2.misbehaviour import INVALID_BLOCK_PENALTY, KNOWN_INVALID_PENALTY, InvalidBlockCache, PeerScores
+import secrets
+from typing import Callable, Dict, List
+from unittest.mock import Mock
+
+EvilNodeMaker = Callable[[List[Block]], Mock]
+
+
+def make_invalid_block(prev: BlockHash) -> Block:
+    """a block that spends a coin that doesn't exist"""
+    coinbase = Transaction(gen_keys()[1], None, Signature(secrets.token_bytes(64)))
+    spend = Transaction(gen_keys()[1], TxID(secrets.token_bytes(32)), Signature(secrets.token_bytes(64)))
+    return Block(prev, [coinbase, spend])
+
+
+def make_child(prev: BlockHash) -> Block:
+    return Block(prev, [Transaction(gen_keys()[1], None, Signature(secrets.token_bytes(64)))])
+
+
+def test_invalid_block_is_not_fetched_again(alice: Node, bob: Node, evil_node_maker: EvilNodeMaker) -> None:
+    bob.mine_block()
+    invalid = make_invalid_block(bob.get_latest_hash())
+    peer = evil_node_maker(bob.blockchain + [invalid])
+    alice.notify_of_block(invalid.get_block_hash(), peer)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    assert invalid.get_block_hash() in alice.invalid_blocks
+    assert peer.get_block.call_count == 2
+
+    alice.notify_of_block(invalid.get_block_hash(), peer)
+    assert peer.get_block.call_count == 2
+    assert alice.invalid_blocks.stats["rejected"] == 1
+    assert alice.peer_scores.get(peer) == INVALID_BLOCK_PENALTY + KNOWN_INVALID_PENALTY
+
+
+def test_descendants_of_invalid_block_are_rejected(alice: Node, evil_node_maker: EvilNodeMaker) -> None:
+    invalid = make_invalid_block(GENESIS_BLOCK_PREV)
+    alice.notify_of_block(invalid.get_block_hash(), evil_node_maker([invalid]))
+    child = make_child(invalid.get_block_hash())
+    grandchild = make_child(child.get_block_hash())
+    peer = evil_node_maker([invalid, child, grandchild])
+
+    alice.notify_of_block(grandchild.get_block_hash(), peer)
+    assert peer.get_block.call_count == 2
+    assert child.get_block_hash() in alice.invalid_blocks
+    assert grandchild.get_block_hash() in alice.invalid_blocks
+    assert len(alice.orphans) == 0
+    assert alice.blockchain == []
+
+
+def test_invalid_chain_served_headers_first(alice: Node, bob: Node) -> None:
+    bob.mine_block()
+    invalid = make_invalid_block(bob.get_latest_hash())
+    child = make_child(invalid.get_block_hash())
+    bob.blockchain = bob.blockchain + [invalid, child]
+    bob.latest_block_hash = child.get_block_hash()
+
+    spy = Mock(wraps=bob)
+    spy.SUPPORTS_HEADERS_FIRST = True
+    alice.notify_of_block(child.get_block_hash(), spy)
+    assert len(alice.blockchain) == 1
+    assert child.get_block_hash() in alice.invalid_blocks
+    assert spy.get_blocks.call_count == 1
+
+    # a longer chain built on the invalid block is not downloaded either
+    grandchild = make_child(child.get_block_hash())
+    bob.blockchain = bob.blockchain + [grandchild]
+    bob.latest_block_hash = grandchild.get_block_hash()
+    alice.notify_of_block(grandchild.get_block_hash(), spy)
+    assert spy.get_blocks.call_count == 1
+    assert grandchild.get_block_hash() in alice.invalid_blocks
+
+
+def test_flooding_peer_is_disconnected(alice: Node, bob: Node, evil_node_maker: EvilNodeMaker) -> None:
+    alice.connect(bob)
+    invalid_blocks = [make_invalid_block(GENESIS_BLOCK_PREV) for _ in range(5)]
+    peer = evil_node_maker(invalid_blocks)
+    alice.connections.add(peer)
+    peer.connections = {alice}
+    for block in invalid_blocks[:2]:
+        alice.notify_of_block(block.get_block_hash(), peer)
+    assert peer not in alice.get_connections()
+    assert alice not in peer.connections
+    assert alice.relay_stats["peers_banned"] == 1
+
+    # whatever a banned peer sends is ignored
+    alice.notify_of_block(invalid_blocks[2].get_block_hash(), peer)
+    assert peer.get_block.call_count == 2
+    assert bob in alice.get_connections()
+    assert alice.peer_scores.get(bob) == 0
+
+
+def test_invalid_orphan_is_blamed_on_the_peer_that_served_it(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    planted: Dict[BlockHash, Block] = {}
+
+    def serve_planted(block_hash: BlockHash) -> Block:
+        if block_hash not in planted:
+            raise ValueError("Unknown block")
+        return planted[block_hash]
+
+    attacker = Mock()
+    attacker.get_block.side_effect = serve_planted
+    # (with the penalty charged to the announcing peer, bob was banned after these two rounds)
+    for _ in range(2):
+        # the attacker plants an invalid block on the honest block that alice hasn't heard of yet
+        alice.disconnect_from(bob)
+        honest = bob.mine_block()
+        assert honest is not None
+        invalid = make_invalid_block(honest)
+        planted[invalid.get_block_hash()] = invalid
+        alice.notify_of_block(invalid.get_block_hash(), attacker)
+        assert invalid.get_block_hash() in alice.orphans
+
+        # bob announces the honest block: the orphan turns out invalid, but bob didn't serve it
+        alice.connect(bob)
+        assert alice.get_latest_hash() == honest
+        assert invalid.get_block_hash() in alice.invalid_blocks
+        assert invalid.get_block_hash() not in alice.orphans
+        assert alice.peer_scores.get(bob) == 0
+
+    assert bob in alice.get_connections()
+    assert alice.peer_scores.is_banned(attacker)
+    bob.mine_block()
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+
+
+def test_cache_is_bounded() -> None:
+    cache = InvalidBlockCache(max_size=2)
+    hashes = [BlockHash(secrets.token_bytes(32)) for _ in range(3)]
+    cache.add(hashes)
+    assert len(cache) == 2
+    assert hashes[0] not in cache
+    assert cache.check(hashes[2])
+    assert cache.stats == {"added": 3, "rejected": 1, "evicted": 1}
+
+
+def test_threshold_is_crossed_once() -> None:
+    scores = PeerScores(threshold=30)
+    assert not scores.add("peer", 20)
+    assert scores.add("peer", 20)
+    assert not scores.add("peer", 20)
+    assert scores.is_banned("peer")
+    assert not scores.is_banned("other")
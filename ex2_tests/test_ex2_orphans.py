@@ -0,0 +1,78 @@
+from ex2 import *
+from ex2.orphans import OrphanPool
+import secrets
+from typing import Callable, List
+from unittest.mock import Mock
+
+EvilNodeMaker = Callable[[List[Block]], Mock]
+
+
+def make_chain(length: int, prev: BlockHash = GENESIS_BLOCK_PREV) -> List[Block]:
+    chain = []
+    for _ in range(length):
+        block = Block(prev, [Transaction(gen_keys()[1], None, Signature(secrets.token_bytes(64)))])
+        chain.append(block)
+        prev = block.get_block_hash()
+    return chain
+
+
+def test_partial_chain_is_kept_and_connected_when_parent_arrives(alice: Node,
+                                                                 evil_node_maker: EvilNodeMaker) -> None:
+    chain = make_chain(4)
+    # eve doesn't have the first block, so alice can't connect the chain
+    eve = evil_node_maker(chain[1:])
+    alice.notify_of_block(chain[-1].get_block_hash(), eve)
+    assert alice.get_latest_hash() == GENESIS_BLOCK_PREV
+    assert len(alice.orphans) == 3
+
+    # later someone serves the missing parent: the waiting blocks connect without being refetched
+    frank = evil_node_maker(chain[:1])
+    alice.notify_of_block(chain[0].get_block_hash(), frank)
+    assert alice.get_latest_hash() == chain[-1].get_block_hash()
+    assert len(alice.orphans) == 0
+    assert eve.get_block.call_count == 4
+    assert alice.orphans.get_stats()["hits"] == 3
+
+
+def test_orphans_are_not_refetched_when_walking_back(alice: Node, evil_node_maker: EvilNodeMaker) -> None:
+    chain = make_chain(3)
+    eve = evil_node_maker(chain[1:])
+    alice.notify_of_block(chain[-1].get_block_hash(), eve)
+
+    full = evil_node_maker(chain)
+    alice.notify_of_block(chain[-1].get_block_hash(), full)
+    assert alice.get_latest_hash() == chain[-1].get_block_hash()
+    # only the missing first block is requested from the second peer
+    assert [call.args[0] for call in full.get_block.call_args_list] == [chain[0].get_block_hash()]
+
+
+def test_pool_evicts_oldest_block() -> None:
+    pool = OrphanPool(max_size=2)
+    chain = make_chain(3)
+    for block in chain:
+        pool.add(block)
+    assert len(pool) == 2
+    assert chain[0].get_block_hash() not in pool
+    assert pool.get_stats()["evictions"] == 1
+
+
+def test_pool_takes_longest_branch() -> None:
+    pool = OrphanPool()
+    parent = make_chain(1)[0]
+    short_branch = make_chain(1, parent.get_block_hash())
+    long_branch = make_chain(3, parent.get_block_hash())
+    for block in short_branch + long_branch:
+        pool.add(block)
+
+    assert pool.take_longest_branch(parent.get_block_hash()) == long_branch
+    assert len(pool) == 1
+    assert pool.take_longest_branch(long_branch[-1].get_block_hash()) == []
+
+
+def test_hit_rate() -> None:
+    pool = OrphanPool()
+    block = make_chain(1)[0]
+    pool.add(block)
+    assert pool.lookup(block.get_block_hash()) is block
+    assert pool.lookup(block.get_prev_block_hash()) is None
+    assert pool.get_hit_rate() == 0.5
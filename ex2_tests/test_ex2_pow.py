@@ -0,0 +1,91 @@
+from ex2 import *
+from ex2 import pow as pow_module
+from ex2.pow import ProofOfWorkMiner, check_proof_of_work, search_nonce, target_from_bits
+import secrets
+import threading
+import time
+from typing import Any, Callable, List, Optional
+from unittest.mock import Mock
+
+EvilNodeMaker = Callable[[List[Block]], Mock]
+TARGET = target_from_bits(8)
+
+
+def test_mined_block_meets_target(alice: Node) -> None:
+    alice.pow_target = TARGET
+    block_hash = alice.mine_block()
+    assert block_hash is not None
+    assert check_proof_of_work(block_hash, TARGET)
+    assert alice.get_block(block_hash).get_nonce() is not None
+
+
+def test_blocks_without_work_are_rejected(alice: Node, evil_node_maker: EvilNodeMaker) -> None:
+    alice.pow_target = TARGET
+    block = Block(GENESIS_BLOCK_PREV, [Transaction(gen_keys()[1], None, Signature(secrets.token_bytes(64)))])
+    while check_proof_of_work(block.get_block_hash(), TARGET):
+        block = Block(GENESIS_BLOCK_PREV, [Transaction(gen_keys()[1], None, Signature(secrets.token_bytes(64)))])
+    alice.notify_of_block(block.get_block_hash(), evil_node_maker([block]))
+    assert alice.get_latest_hash() == GENESIS_BLOCK_PREV
+
+
+def test_pow_blocks_propagate(alice: Node, bob: Node) -> None:
+    alice.pow_target = bob.pow_target = TARGET
+    alice.connect(bob)
+    alice.mine_block()
+    alice.create_transaction(bob.get_address())
+    block_hash = alice.mine_block()
+    assert bob.get_latest_hash() == block_hash
+    assert bob.relay_stats["compact_blocks_reconstructed"] == 2
+
+
+def test_search_stops_when_cancelled() -> None:
+    cancel = threading.Event()
+    cancel.set()
+    assert search_nonce(b"prefix", 0, 0, 10 ** 9, cancel) == (None, 0)
+    nonce, hashes = search_nonce(b"prefix", TARGET, 0, 10 ** 6)
+    assert nonce is not None and hashes == nonce + 1
+
+
+def test_miner_finds_nonce_and_can_be_cancelled() -> None:
+    miner = ProofOfWorkMiner(processes=2, chunk_size=5000)
+    try:
+        nonce = miner.find_nonce(b"prefix", TARGET)
+        assert nonce is not None
+        assert search_nonce(b"prefix", TARGET, nonce, nonce + 1)[0] == nonce
+
+        timer = threading.Timer(0.2, miner.cancel)
+        timer.start()
+        began = time.perf_counter()
+        assert miner.find_nonce(b"prefix", 0) is None
+        assert time.perf_counter() - began < 5
+        assert miner.hashes > 0 and miner.get_hash_rate() > 0
+    finally:
+        miner.close()
+
+
+def test_competing_block_cancels_pow_mining(alice: Node, bob: Node, monkeypatch: Any) -> None:
+    alice.pow_target = bob.pow_target = TARGET
+    competing = bob.mine_block()
+    alice.miner = ProofOfWorkMiner(processes=2, chunk_size=5000)
+    results: List[Optional[int]] = []
+    find_nonce = alice.miner.find_nonce
+    monkeypatch.setattr(alice.miner, "find_nonce", lambda *args: results.append(find_nonce(*args)) or results[-1])
+    original_wait = pow_module.wait
+
+    def wait_then_receive_block(*args: Any, **kwargs: Any) -> Any:
+        # a worker has found a nonce by now, and the competing block arrives (on another thread) before it is used
+        done = original_wait(*args, **kwargs)
+        if not results and alice.get_latest_hash() != competing:
+            receiver = threading.Thread(target=alice.notify_of_block, args=(competing, bob))
+            receiver.start()
+            receiver.join()
+        return done
+
+    monkeypatch.setattr(pow_module, "wait", wait_then_receive_block)
+    try:
+        assert alice.mine_block() is None
+        assert results == [None]
+        assert alice.get_latest_hash() == competing
+        assert len(alice.blockchain) == 1
+    finally:
+        alice.miner.close()
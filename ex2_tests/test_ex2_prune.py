@@ -0,0 +1,75 @@
+from ex2 import *
+from ex2.prune import PrunedBlockError, PrunedChain
+
+import pytest
+
+
+def test_pruned_node_keeps_recent_bodies_and_all_headers(alice: Node) -> None:
+    alice.enable_pruning(10)
+    hashes = [alice.mine_block() for _ in range(25)]
+    assert isinstance(alice.blockchain, PrunedChain)
+    assert len(alice.blockchain) == 25
+    assert len(alice.blockchain.bodies) == 10
+    assert len(alice.block_undo) == 10
+
+    assert alice.get_block(hashes[-1]).get_block_hash() == hashes[-1]  # type: ignore
+    assert alice.get_block(hashes[15]).get_block_hash() == hashes[15]  # type: ignore
+    with pytest.raises(PrunedBlockError):
+        alice.get_block(hashes[14])  # type: ignore
+    with pytest.raises(ValueError):
+        alice.get_block(BlockHash(b"unknown"))
+
+    headers = alice.get_headers([GENESIS_BLOCK_PREV])
+    assert [header.get_block_hash() for header in headers] == hashes
+    assert alice.get_balance() == 25
+
+
+def test_pruning_existing_chain(alice: Node) -> None:
+    hashes = [alice.mine_block() for _ in range(15)]
+    alice.enable_pruning(10)
+    with pytest.raises(PrunedBlockError):
+        alice.get_block(hashes[0])  # type: ignore
+    assert alice.get_latest_hash() == hashes[-1]
+    with pytest.raises(ValueError):
+        alice.enable_pruning(5)
+    with pytest.raises(ValueError):
+        alice.blockchain = []
+    with pytest.raises(PrunedBlockError):
+        alice.blockchain + []
+    assert isinstance(alice.blockchain, PrunedChain)
+
+
+def test_pruned_node_follows_shallow_reorgs(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    shared = [alice.mine_block() for _ in range(20)]
+    alice.disconnect_from(bob)
+    alice.enable_pruning(10)
+    assert bob.get_latest_hash() == shared[-1]
+
+    alice.mine_block()
+    longer = [bob.mine_block() for _ in range(3)]
+    alice.connect(bob)
+    assert alice.get_latest_hash() == longer[-1]
+    assert alice.get_balance() == 20
+
+
+def test_pruned_node_ignores_reorgs_below_its_bodies(alice: Node, bob: Node) -> None:
+    alice.enable_pruning(10)
+    for _ in range(15):
+        alice.mine_block()
+    for _ in range(20):
+        bob.mine_block()
+    tip = alice.get_latest_hash()
+
+    alice.connect(bob)
+    assert alice.get_latest_hash() == tip
+    assert alice.get_balance() == 15
+
+
+def test_syncing_from_a_pruned_node_fails_cleanly(alice: Node, bob: Node) -> None:
+    alice.enable_pruning(10)
+    for _ in range(15):
+        alice.mine_block()
+    alice.connect(bob)
+    assert bob.get_latest_hash() == GENESIS_BLOCK_PREV
+    assert bob.blockchain == []
@@ -0,0 +1,112 @@
+from ex2 import *
+from ex2.scheduler import AsyncioScheduler, DeterministicScheduler, Message
+import asyncio
+import secrets
+from typing import List, Tuple
+from unittest.mock import Mock
+
+import pytest
+
+
+def make_payments(node: Node, count: int) -> List[Transaction]:
+    """signed payments that are not in the node's mempool, each spending another coin of the node"""
+    for _ in range(count):
+        node.mine_block()
+    payments = [tx for tx in (node.create_transaction(node.get_address()) for _ in range(count)) if tx is not None]
+    node.clear_mempool()
+    return payments
+
+
+def make_line_with_payments(length: int, payment_count: int) -> Tuple[List[Node], List[Transaction]]:
+    """a line of nodes that share a chain, and payments of the first node that none of them has seen"""
+    nodes = [Node() for _ in range(length)]
+    payments = make_payments(nodes[0], payment_count)
+    for left, right in zip(nodes, nodes[1:]):
+        left.connect(right)
+    return nodes, payments
+
+
+def test_bulk_add(alice: Node, bob: Node) -> None:
+    payments = make_payments(alice, 3)
+    alice.connect(bob)
+    double_spend = Transaction(bob.get_address(), payments[0].input, payments[0].signature)
+    coinbase = Transaction(bob.get_address(), None, Signature(secrets.token_bytes(64)))
+    results = alice.add_transactions_to_mempool(payments[:2] + [double_spend, coinbase, payments[0], payments[2]])
+    assert results == [True, True, False, False, True, True]
+    assert set(alice.get_mempool()) == set(payments)
+    assert set(bob.get_mempool()) == set(payments)
+
+
+def test_batch_is_sent_in_one_call_without_scheduler() -> None:
+    nodes, payments = make_line_with_payments(3, 5)
+    for node in nodes:
+        node.enable_transaction_batching()
+    nodes[0].add_transactions_to_mempool(payments)
+    assert set(nodes[2].get_mempool()) == set(payments)
+    assert nodes[0].relay_stats["transaction_batches_sent"] == 1
+    assert nodes[1].relay_stats["transaction_batches_sent"] == 1
+
+    with pytest.raises(ValueError):
+        nodes[0].enable_transaction_batching()
+
+
+def test_batches_are_flushed_on_size_or_timer() -> None:
+    nodes, payments = make_line_with_payments(3, 4)
+    scheduler = DeterministicScheduler(latency=0.01)
+    scheduler.attach(nodes)
+    for node in nodes:
+        node.enable_transaction_batching(max_batch=3, max_delay=1.0)
+    arrivals: List[float] = []
+    scheduler.listeners.append(lambda message, now: arrivals.append(now))
+
+    for payment in payments:
+        nodes[0].add_transaction_to_mempool(payment)
+    scheduler.run()
+    assert set(nodes[2].get_mempool()) == set(payments)
+    assert scheduler.messages_sent == {Message.TRANSACTIONS: 4}
+    # the first three go at once, the last one waits for the timer at every hop
+    assert arrivals == pytest.approx([0.01, 0.02, 1.01, 2.02])
+
+
+def test_timer_of_a_sent_batch_does_not_send_the_next_one() -> None:
+    nodes, payments = make_line_with_payments(2, 4)
+    scheduler = DeterministicScheduler(latency=0.01)
+    scheduler.attach(nodes)
+    for node in nodes:
+        node.enable_transaction_batching(max_batch=3, max_delay=1.0)
+    arrivals: List[float] = []
+    scheduler.listeners.append(lambda message, now: arrivals.append(now))
+
+    # the first batch fills up and goes at once, the next one starts before the first one's timer fires
+    nodes[0].add_transactions_to_mempool(payments[:3])
+    scheduler.call_later(0.5, lambda: nodes[0].add_transaction_to_mempool(payments[3]))
+    scheduler.run()
+    assert set(nodes[1].get_mempool()) == set(payments)
+    assert arrivals == pytest.approx([0.01, 1.51])
+
+
+def test_peer_without_batches_gets_single_transactions(alice: Node) -> None:
+    payments = make_payments(alice, 2)
+    peer = Mock()
+    alice.connections.add(peer)
+    alice.enable_transaction_batching()
+    alice.add_transactions_to_mempool(payments)
+    assert peer.notify_of_transactions.call_count == 0
+    assert [call.args[0] for call in peer.notify_of_transaction.call_args_list] == payments
+
+
+def test_asyncio_scheduler_flushes_on_timer() -> None:
+    nodes, payments = make_line_with_payments(3, 2)
+
+    async def run() -> None:
+        scheduler = AsyncioScheduler()
+        scheduler.attach(nodes)
+        for node in nodes:
+            node.enable_transaction_batching(max_batch=10, max_delay=0.01)
+        nodes[0].add_transactions_to_mempool(payments)
+        await scheduler.run_until_idle()
+        await scheduler.close()
+        assert scheduler.messages_sent == {Message.TRANSACTIONS: 2}
+
+    asyncio.run(run())
+    assert set(nodes[2].get_mempool()) == set(payments)
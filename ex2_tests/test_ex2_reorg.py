@@ -0,0 +1,80 @@
+from ex2 import *
+import ex2.node
+from typing import List
+
+import pytest
+
+
+def split(alice: Node, bob: Node, shared_blocks: int) -> None:
+    """alice and bob share a chain of the given length, and are then disconnected"""
+    alice.connect(bob)
+    for _ in range(shared_blocks):
+        alice.mine_block()
+    alice.disconnect_from(bob)
+    assert bob.get_latest_hash() == alice.get_latest_hash()
+
+
+def test_disconnected_transactions_return_to_mempool(alice: Node, bob: Node, charlie: Node,
+                                                     monkeypatch: pytest.MonkeyPatch) -> None:
+    split(alice, bob, 1)
+    payment = alice.create_transaction(charlie.get_address())
+    assert payment is not None
+    alice.mine_block()
+    for _ in range(2):
+        bob.mine_block()
+
+    verified: List[bytes] = []
+    original_verify = ex2.node.verify
+    monkeypatch.setattr(ex2.node, "verify", lambda message, *args: verified.append(message) or
+                        original_verify(message, *args))
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    assert alice.get_mempool() == [payment]
+    assert verified == []
+    assert payment.input in alice.owned_coins.pending
+
+
+def test_transactions_on_both_chains_are_not_restored(alice: Node, bob: Node, charlie: Node) -> None:
+    split(alice, bob, 1)
+    payment = alice.create_transaction(charlie.get_address())
+    assert payment is not None
+    assert bob.add_transaction_to_mempool(payment)
+    alice.mine_block()
+    for _ in range(2):
+        bob.mine_block()
+
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    assert alice.get_mempool() == []
+
+
+def test_spends_of_vanished_coins_are_dropped(alice: Node, bob: Node, charlie: Node) -> None:
+    split(alice, bob, 1)
+    alice.mine_block()
+    # the only coin alice can spend now is the one her last block created
+    alice.create_transaction(charlie.get_address())
+    spend = alice.create_transaction(charlie.get_address())
+    assert spend is not None and spend.input == alice.blockchain[-1].get_transactions()[0].get_txid()
+    for _ in range(2):
+        bob.mine_block()
+
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    assert spend not in alice.mem_pool
+    assert spend.input not in alice.utxos
+
+
+def test_mempool_conflicts_with_new_chain_are_dropped(alice: Node, bob: Node, charlie: Node) -> None:
+    split(alice, bob, 1)
+    coin = alice.blockchain[0].get_transactions()[0].get_txid()
+    to_charlie = alice.create_transaction(charlie.get_address())
+    assert to_charlie is not None and to_charlie.input == coin
+
+    # the same coin paid to bob reaches bob's chain
+    to_bob = Transaction(bob.get_address(), coin, sign(coin + bob.get_address(), alice.private_key))
+    assert bob.add_transaction_to_mempool(to_bob)
+    bob.mine_block()
+
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    assert alice.get_mempool() == []
+    assert alice.get_balance() == 0
@@ -0,0 +1,106 @@
+from ex2 import *
+from ex2.compact import CompactBlock
+from ex2.replay import Recorder, Replayer, decode_compact_block, encode_compact_block
+from ex2.scheduler import DeterministicScheduler
+from ex2.simulator import Simulation
+from ex2 import utils
+from ex2.utils import set_deterministic_seed
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def os_randomness() -> Iterator[None]:
+    """makes sure no test leaves the deterministic mode on"""
+    yield
+    set_deterministic_seed(None)
+
+
+class CountingNode(Node):
+    """a modified node, as an A/B comparison would replay against"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.validated = 0
+
+    def validate_block(self, block: Block) -> bool:
+        self.validated += 1
+        return super().validate_block(block)
+
+
+def test_deterministic_keys_and_coinbases() -> None:
+    set_deterministic_seed(5)
+    first = Node()
+    first.mine_block()
+    set_deterministic_seed(5)
+    second = Node()
+    second.mine_block()
+    assert first.get_address() == second.get_address()
+    assert first.get_latest_hash() == second.get_latest_hash()
+
+    set_deterministic_seed(None)
+    assert gen_keys() != gen_keys()
+
+
+def test_replay_reaches_the_recorded_state(tmp_path: Path) -> None:
+    path = str(tmp_path / "run.rec")
+    simulation = Simulation(nodes=8, degree=3, block_interval=5, tx_rate=2, duration=60, seed=4, deterministic=True)
+    recorder = simulation.record(path)
+    report = simulation.run()
+    assert report["transactions"]["created"] > 0
+
+    replayer = Replayer(path)
+    assert len(replayer.events) == recorder.events - 8
+    nodes = replayer.run()
+    assert replayer.get_mismatched_tips(nodes) == []
+    for replayed, original in zip(nodes, simulation.nodes):
+        assert replayed.get_address() == original.get_address()
+        assert [block.get_block_hash() for block in replayed.blockchain] == \
+               [block.get_block_hash() for block in original.blockchain]
+        assert set(replayed.get_mempool()) == set(original.get_mempool())
+    assert replayer.stats["messages_sent"] == simulation.scheduler.get_message_count()
+
+    # the same events against a modified node
+    counting_nodes = replayer.run(CountingNode)
+    assert replayer.get_mismatched_tips(counting_nodes) == []
+    assert sum(node.validated for node in counting_nodes) > 0  # type: ignore
+
+
+def test_only_fresh_deterministic_runs_are_recorded(tmp_path: Path, alice: Node) -> None:
+    with pytest.raises(ValueError):
+        Simulation(nodes=3, duration=10).record(str(tmp_path / "run.rec"))
+    alice.mine_block()
+    with pytest.raises(ValueError):
+        Recorder(str(tmp_path / "run.rec"), [alice], [], DeterministicScheduler(), 0)
+
+
+def test_compact_block_encoding(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    alice.create_transaction(bob.get_address())
+    alice.mine_block()
+    compact_block = CompactBlock.from_block(alice.blockchain[-1])
+    decoded = decode_compact_block(encode_compact_block(compact_block))
+    assert decoded.get_header().get_block_hash() == compact_block.get_header().get_block_hash()
+    assert [(index, tx.get_txid()) for index, tx in decoded.prefilled] == \
+           [(index, tx.get_txid()) for index, tx in compact_block.prefilled]
+    assert decoded.short_ids == compact_block.short_ids
+
+
+def test_deterministic_keys_stay_inside_the_simulation() -> None:
+    # building a simulation that never runs leaves the keys of other nodes random
+    Simulation(nodes=3, degree=2, duration=10, seed=1, deterministic=True)
+    first = gen_keys()
+    Simulation(nodes=3, degree=2, duration=10, seed=1, deterministic=True)
+    assert gen_keys() != first
+
+    # and so does a run that fails
+    simulation = Simulation(nodes=3, degree=2, block_interval=1, duration=10, seed=1, deterministic=True)
+
+    def fail() -> None:
+        raise RuntimeError("mining failed")
+    simulation._mine = fail  # type: ignore
+    with pytest.raises(RuntimeError):
+        simulation.run()
+    assert utils._deterministic_rng is None
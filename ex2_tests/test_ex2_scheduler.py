@@ -0,0 +1,87 @@
+from ex2 import *
+from ex2.scheduler import AsyncioScheduler, DeterministicScheduler, Message
+import asyncio
+from typing import List
+
+
+def make_line(length: int) -> List[Node]:
+    nodes = [Node() for _ in range(length)]
+    for left, right in zip(nodes, nodes[1:]):
+        left.connect(right)
+    return nodes
+
+
+def test_blocks_are_delivered_by_the_scheduler(alice: Node, bob: Node, charlie: Node) -> None:
+    alice.connect(bob)
+    bob.connect(charlie)
+    scheduler = DeterministicScheduler()
+    scheduler.attach([alice, bob, charlie])
+
+    block_hash = alice.mine_block()
+    assert bob.get_latest_hash() == GENESIS_BLOCK_PREV
+    assert scheduler.get_inbox_size(bob) == 1
+
+    scheduler.run()
+    assert bob.get_latest_hash() == block_hash
+    assert charlie.get_latest_hash() == block_hash
+    assert scheduler.messages_sent == {Message.COMPACT_BLOCK: 2}
+    assert scheduler.messages_delivered == {Message.COMPACT_BLOCK: 2}
+
+
+def test_transactions_are_delivered_by_the_scheduler(alice: Node, bob: Node, charlie: Node) -> None:
+    alice.connect(bob)
+    bob.connect(charlie)
+    alice.mine_block()
+    scheduler = DeterministicScheduler()
+    scheduler.attach([alice, bob, charlie])
+
+    tx = alice.create_transaction(bob.get_address())
+    assert tx not in bob.get_mempool()
+    scheduler.run()
+    assert tx in bob.get_mempool()
+    assert tx in charlie.get_mempool()
+
+
+def test_link_latency_advances_the_clock() -> None:
+    nodes = make_line(4)
+    scheduler = DeterministicScheduler(latency=0.5)
+    scheduler.attach(nodes)
+    arrivals = {}
+    scheduler.listeners.append(lambda message, now: arrivals.setdefault(message.receiver, now))
+
+    block_hash = nodes[0].mine_block()
+    scheduler.run(until=1.0)
+    assert nodes[2].get_latest_hash() == block_hash
+    assert nodes[3].get_latest_hash() == GENESIS_BLOCK_PREV
+
+    scheduler.run()
+    assert arrivals[nodes[3]] == 1.5
+    assert scheduler.now == 1.5
+
+
+def test_long_line_does_not_recurse() -> None:
+    nodes = make_line(1500)
+    scheduler = DeterministicScheduler()
+    scheduler.attach(nodes)
+    block_hash = nodes[0].mine_block()
+    scheduler.run()
+    assert all(node.get_latest_hash() == block_hash for node in nodes)
+
+
+def test_asyncio_scheduler_delivers_with_latency() -> None:
+    nodes = make_line(5)
+
+    async def run() -> float:
+        scheduler = AsyncioScheduler(latency=0.01)
+        scheduler.attach(nodes)
+        arrivals: List[float] = []
+        scheduler.listeners.append(lambda message, now: arrivals.append(now))
+        nodes[0].mine_block()
+        await scheduler.run_until_idle()
+        await scheduler.close()
+        assert scheduler.get_message_count() == 4
+        return max(arrivals)
+
+    last_arrival = asyncio.run(run())
+    assert last_arrival >= 0.04
+    assert len({node.get_latest_hash() for node in nodes}) == 1
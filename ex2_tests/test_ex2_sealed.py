@@ -0,0 +1,65 @@
+from ex2 import *
+from ex2.block import SealedBlock
+import hashlib
+import pytest
+import secrets
+from typing import Any, Iterator
+
+
+@pytest.fixture
+def integrity_checks() -> Iterator[None]:
+    SealedBlock.integrity_checks = True
+    yield
+    SealedBlock.integrity_checks = False
+
+
+def make_block() -> Block:
+    transactions = [Transaction(gen_keys()[1], None, Signature(secrets.token_bytes(64))) for _ in range(3)]
+    return Block(GENESIS_BLOCK_PREV, transactions)
+
+
+def test_streamed_hash_matches_concatenation() -> None:
+    block = make_block()
+    content = block.get_prev_block_hash() + b"".join(tx.get_txid() for tx in block.get_transactions())
+    assert block.get_block_hash() == hashlib.sha256(content).digest()
+
+
+def test_sealed_block_has_same_hash_and_cannot_be_changed() -> None:
+    block = make_block()
+    sealed = SealedBlock.seal(block)
+    assert sealed.get_block_hash() == block.get_block_hash()
+    assert sealed.get_header().get_block_hash() == block.get_block_hash()
+    assert SealedBlock.seal(sealed) is sealed
+    with pytest.raises(AttributeError):
+        sealed.prev_block_hash = BlockHash(hashlib.sha256(b"other").digest())  # type: ignore
+
+
+def test_integrity_check_detects_changes(integrity_checks: None) -> None:
+    sealed = SealedBlock.seal(make_block())
+    sealed.get_block_hash()
+    sealed.get_transactions().pop()
+    with pytest.raises(RuntimeError):
+        sealed.get_block_hash()
+
+
+def test_node_with_sealed_blocks_hashes_less(alice: Node, bob: Node, monkeypatch: Any) -> None:
+    calls = 0
+    compute = Block._compute_block_hash
+
+    def counted(self: Block) -> BlockHash:
+        nonlocal calls
+        calls += 1
+        return compute(self)
+
+    monkeypatch.setattr(Block, "_compute_block_hash", counted)
+    for _ in range(20):
+        alice.mine_block()
+    bob.notify_of_block(alice.get_latest_hash(), alice)
+    unsealed_calls, calls = calls, 0
+
+    charlie = Node()
+    charlie.seal_blocks = True
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+    assert all(isinstance(block, SealedBlock) for block in charlie.blockchain)
+    assert charlie.get_latest_hash() == bob.get_latest_hash()
+    assert calls < unsealed_calls
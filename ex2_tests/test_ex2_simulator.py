@@ -0,0 +1,77 @@
+from ex2.scheduler import DeterministicScheduler
+from ex2.simulator import Simulation, build_network, make_topology
+import json
+import random
+from typing import Dict, List, Tuple
+
+import pytest
+
+
+def get_degrees(count: int, links: List[Tuple[int, int]]) -> Dict[int, int]:
+    degrees = {i: 0 for i in range(count)}
+    for a, b in links:
+        degrees[a] += 1
+        degrees[b] += 1
+    return degrees
+
+
+def test_ring_topology() -> None:
+    links = make_topology("ring", 10, 8, random.Random(0))
+    assert len(links) == 10
+    assert set(get_degrees(10, links).values()) == {2}
+
+
+def test_random_topology_reaches_the_degree() -> None:
+    links = make_topology("random", 50, 6, random.Random(0))
+    assert min(get_degrees(50, links).values()) >= 6
+    assert links == make_topology("random", 50, 6, random.Random(0))
+    assert links != make_topology("random", 50, 6, random.Random(1))
+
+
+def test_scale_free_topology_has_hubs() -> None:
+    links = make_topology("scale_free", 200, 4, random.Random(0))
+    degrees = get_degrees(200, links)
+    assert min(degrees.values()) >= 2
+    assert max(degrees.values()) > 4 * 4
+    assert len(links) == 2 + 2 * (200 - 3)
+
+
+def test_unknown_topology_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        make_topology("star", 10, 2, random.Random(0))
+
+
+def test_network_is_connected_along_links() -> None:
+    nodes = build_network(4, [(0, 1), (1, 2)])
+    assert nodes[1] in nodes[0].get_connections()
+    assert nodes[2] in nodes[1].get_connections()
+    assert not nodes[3].get_connections()
+
+
+def test_call_later_runs_in_time_order() -> None:
+    scheduler = DeterministicScheduler()
+    calls: List[Tuple[str, float]] = []
+    scheduler.call_later(2, lambda: calls.append(("late", scheduler.now)))
+    scheduler.call_later(1, lambda: calls.append(("early", scheduler.now)))
+    scheduler.run()
+    assert calls == [("early", 1), ("late", 2)]
+
+
+def test_simulation_report() -> None:
+    report = Simulation(nodes=15, topology="scale_free", degree=4, duration=60, block_interval=5, seed=7).run()
+    json.dumps(report)
+    assert report["consistent"]
+    assert report["blocks"]["mined"] > 0
+    assert report["blocks"]["mined"] == report["blocks"]["final_height"] + report["blocks"]["stale"]
+    assert report["propagation_seconds"]["all_nodes"]["mean"] > 0
+    assert report["validation"]["calls"] > 0
+    assert report["messages"]["total"] > 0
+    assert report["transactions"]["confirmed"] <= report["transactions"]["created"]
+
+
+def test_simulation_is_seeded() -> None:
+    first = Simulation(nodes=10, duration=30, seed=3)
+    second = Simulation(nodes=10, duration=30, seed=3)
+    assert first.links == second.links
+    assert first.link_latency == second.link_latency
+    assert first.run()["blocks"]["mined"] == second.run()["blocks"]["mined"]
@@ -0,0 +1,148 @@
+from ex2 import *
+from ex2.prune import PrunedBlockError
+from ex2.scheduler import DeterministicScheduler
+from ex2.snapshot import CHECK_STEP_BLOCKS, INVALID, PENDING, VALID, UtxoSnapshot, compute_utxo_hash
+
+import pytest
+
+
+def mine_with_payments(node: Node, target: Node, blocks: int) -> None:
+    for _ in range(blocks):
+        node.create_transaction(target.get_address())
+        node.mine_block()
+
+
+def trusting(snapshot: UtxoSnapshot) -> Node:
+    """a fresh node configured to trust the given snapshot"""
+    node = Node()
+    node.assume_utxo = (snapshot.block_hash, snapshot.content_hash)
+    return node
+
+
+def test_snapshot_roundtrip(alice: Node, bob: Node) -> None:
+    mine_with_payments(alice, bob, 5)
+    snapshot = alice.create_utxo_snapshot()
+    assert snapshot.height == 4
+    assert snapshot.block_hash == alice.get_latest_hash()
+
+    loaded = UtxoSnapshot.deserialize(snapshot.serialize())
+    assert loaded.block_hash == snapshot.block_hash
+    assert loaded.height == 4
+    assert loaded.content_hash == compute_utxo_hash(alice.get_utxo())
+    assert {coin.get_txid() for coin in loaded.utxos} == set(alice.utxos)
+
+    data = snapshot.serialize()
+    with pytest.raises(ValueError):
+        UtxoSnapshot.deserialize(b"garbage" + data)
+    with pytest.raises(ValueError):
+        UtxoSnapshot.deserialize(data[:-5])
+    tampered = UtxoSnapshot(snapshot.block_hash, snapshot.height, snapshot.utxos[1:])
+    tampered.content_hash = snapshot.content_hash
+    with pytest.raises(ValueError):
+        UtxoSnapshot.deserialize(tampered.serialize())
+
+
+def test_node_validates_new_blocks_right_after_loading(alice: Node, bob: Node) -> None:
+    mine_with_payments(alice, bob, 20)
+    snapshot = alice.create_utxo_snapshot()
+    charlie = trusting(snapshot)
+    check = charlie.load_utxo_snapshot(snapshot.serialize(), alice)
+    assert check.status == PENDING
+    assert charlie.get_latest_hash() == alice.get_latest_hash()
+    assert len(charlie.blockchain) == 20
+    assert charlie.get_headers([GENESIS_BLOCK_PREV])[0].get_block_hash() == alice.blockchain[0].get_block_hash()
+    with pytest.raises(PrunedBlockError):
+        charlie.get_block(alice.get_latest_hash())
+
+    # new blocks (spending coins from the snapshot) are validated and connected
+    alice.connect(charlie)
+    mine_with_payments(alice, bob, 3)
+    assert charlie.get_latest_hash() == alice.get_latest_hash()
+    assert set(charlie.utxos) == set(alice.utxos)
+    assert charlie.get_block(alice.get_latest_hash()).get_block_hash() == alice.get_latest_hash()
+
+    assert check.run() == VALID
+    assert check.stats["blocks"] == 20
+
+
+def test_only_the_trusted_snapshot_is_loaded(alice: Node, bob: Node) -> None:
+    mine_with_payments(alice, bob, 5)
+    snapshot = alice.create_utxo_snapshot()
+    with pytest.raises(ValueError):
+        Node().load_utxo_snapshot(snapshot.serialize(), alice)
+
+    node = trusting(snapshot)
+    alice.mine_block()
+    other = alice.create_utxo_snapshot()
+    with pytest.raises(ValueError):
+        node.load_utxo_snapshot(other.serialize(), alice)
+    with pytest.raises(ValueError):
+        node.load_utxo_snapshot(snapshot.serialize(), bob)  # bob doesn't have the snapshot block
+
+    node.mine_block()
+    with pytest.raises(ValueError):
+        node.load_utxo_snapshot(snapshot.serialize(), alice)  # not a fresh node anymore
+
+
+def test_check_runs_between_messages_on_the_scheduler(alice: Node, bob: Node) -> None:
+    for _ in range(CHECK_STEP_BLOCKS + 50):
+        alice.mine_block()
+    snapshot = alice.create_utxo_snapshot()
+    charlie = trusting(snapshot)
+    scheduler = DeterministicScheduler(latency=0.001)
+    scheduler.attach([alice, charlie])
+    check = charlie.load_utxo_snapshot(snapshot.serialize(), alice)
+    alice.connect(charlie)
+    scheduler.call_later(0.001, alice.mine_block)
+    scheduler.run()
+
+    assert check.status == VALID
+    assert check.stats["steps"] == 2
+    assert charlie.get_latest_hash() == alice.get_latest_hash()
+
+
+def test_failed_check_drops_the_snapshot_chainstate(alice: Node, bob: Node) -> None:
+    mine_with_payments(alice, bob, 10)
+    honest = alice.create_utxo_snapshot()
+    assert trusting(honest).load_utxo_snapshot(honest.serialize(), alice).run() == VALID
+
+    # a trusted snapshot that doesn't match the history (e.g. a wrong assume_utxo setting) is found out later
+    forged = UtxoSnapshot(honest.block_hash, honest.height,
+                          honest.utxos + [Transaction(bob.get_address(), None, Signature(b"\x00" * 64))])
+    node = trusting(forged)
+    check = node.load_utxo_snapshot(forged.serialize(), alice)
+    alice.connect(node)
+    mine_with_payments(alice, bob, 1)
+    assert len(node.blockchain) == 11
+
+    assert check.run() == INVALID
+    assert check.error is not None and "different UTXO set" in check.error
+    assert check.shadow is None
+    assert node.blockchain == [] and node.utxos == {} and node.assume_utxo is None
+
+    # the node then syncs (and validates) the whole history
+    mine_with_payments(alice, bob, 1)
+    assert node.get_latest_hash() == alice.get_latest_hash()
+    assert set(node.utxos) == set(alice.utxos)
+    assert node.get_block(alice.blockchain[0].get_block_hash()).get_block_hash() == alice.blockchain[0].get_block_hash()
+
+
+def test_reorgs_below_the_snapshot_are_ignored(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    mine_with_payments(alice, bob, 5)
+    alice.disconnect_from(bob)
+    mine_with_payments(alice, bob, 3)
+    snapshot = alice.create_utxo_snapshot()
+    charlie = trusting(snapshot)
+    charlie.load_utxo_snapshot(snapshot.serialize(), alice)
+
+    # a longer branch that forks below the snapshot block
+    for _ in range(6):
+        bob.mine_block()
+    charlie.notify_of_block(bob.get_latest_hash(), bob)
+    assert charlie.get_latest_hash() == snapshot.block_hash
+
+    # while the chain still grows above it
+    alice.mine_block()
+    charlie.notify_of_block(alice.get_latest_hash(), alice)
+    assert charlie.get_latest_hash() == alice.get_latest_hash()
@@ -0,0 +1,123 @@
+from ex2 import *
+from ex2.storage import SqliteStorage, StoredChain, deserialize_block, serialize_block
+import secrets
+from pathlib import Path
+from typing import List
+
+import pytest
+
+
+def mine_blocks(node: Node, count: int) -> List[BlockHash]:
+    return [node.mine_block() for _ in range(count)]  # type: ignore
+
+
+def test_blocks_survive_serialization(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    alice.create_transaction(bob.get_address())
+    alice.mine_block()
+    for block in alice.blockchain:
+        copy = deserialize_block(serialize_block(block))
+        assert copy.get_block_hash() == block.get_block_hash()
+        assert [tx.get_txid() for tx in copy.get_transactions()] == [tx.get_txid() for tx in block.get_transactions()]
+
+    block = Block(GENESIS_BLOCK_PREV, alice.blockchain[0].get_transactions(), nonce=12345)
+    assert deserialize_block(serialize_block(block)).get_block_hash() == block.get_block_hash()
+
+
+def test_node_restarts_from_storage(alice: Node, bob: Node, tmp_path: Path) -> None:
+    path = str(tmp_path / "chain.db")
+    alice.attach_storage(SqliteStorage(path))
+    mine_blocks(alice, 3)
+    alice.create_transaction(bob.get_address())
+    tip = alice.mine_block()
+    utxos = {tx.get_txid() for tx in alice.get_utxo()}
+    alice.storage.close()  # type: ignore
+
+    restarted = Node()
+    restarted.attach_storage(SqliteStorage(path))
+    assert restarted.get_latest_hash() == tip
+    assert len(restarted.blockchain) == 4
+    assert {tx.get_txid() for tx in restarted.get_utxo()} == utxos
+    assert isinstance(restarted.blockchain, StoredChain)
+    assert restarted.blockchain.reads == 0
+
+    assert restarted.get_block(tip).get_block_hash() == tip
+    assert restarted.blockchain.reads == 1
+    with pytest.raises(ValueError):
+        restarted.get_block(BlockHash(secrets.token_bytes(32)))
+
+    # the restarted node keeps syncing, and serves its stored chain to others
+    restarted.connect(bob)
+    assert bob.get_latest_hash() == tip
+    assert bob.get_balance() == 1
+
+
+def test_existing_chain_is_written_on_attach(alice: Node, tmp_path: Path) -> None:
+    hashes = mine_blocks(alice, 3)
+    alice.attach_storage(SqliteStorage(str(tmp_path / "chain.db")))
+    assert alice.storage.get_chain() == hashes  # type: ignore
+    assert alice.storage.get_utxos().keys() == alice.utxos.keys()  # type: ignore
+
+    # the stored chain works like a list, but can't be replaced by one
+    extended = alice.blockchain + [alice.blockchain[0]]
+    assert [block.get_block_hash() for block in extended] == hashes + hashes[:1]
+    with pytest.raises(ValueError):
+        alice.blockchain = extended
+    assert isinstance(alice.blockchain, StoredChain)
+
+
+def test_reorg_is_stored(alice: Node, bob: Node, charlie: Node, tmp_path: Path) -> None:
+    path = str(tmp_path / "chain.db")
+    alice.attach_storage(SqliteStorage(path))
+    mine_blocks(alice, 2)
+    alice.create_transaction(charlie.get_address())
+    alice.mine_block()
+    longer = mine_blocks(bob, 4)
+
+    alice.connect(bob)
+    assert alice.get_latest_hash() == longer[-1]
+    assert alice.get_balance() == 0
+    assert {tx.get_txid() for tx in alice.get_utxo()} == {tx.get_txid() for tx in bob.get_utxo()}
+    alice.storage.close()  # type: ignore
+
+    storage = SqliteStorage(path)
+    assert storage.get_chain() == longer
+    assert storage.get_utxos().keys() == bob.utxos.keys()
+
+
+def test_interrupted_reorg_leaves_storage_at_old_chain(alice: Node, bob: Node, tmp_path: Path,
+                                                       monkeypatch: pytest.MonkeyPatch) -> None:
+    path = str(tmp_path / "chain.db")
+    alice.attach_storage(SqliteStorage(path))
+    old_chain = mine_blocks(alice, 2)
+    utxos = set(alice.utxos)
+    mine_blocks(bob, 4)
+
+    validated: List[Block] = []
+
+    def crashing_validate_block(block: Block) -> bool:
+        validated.append(block)
+        if len(validated) == 3:
+            raise RuntimeError("crash")
+        return True
+
+    monkeypatch.setattr(alice, "validate_block", crashing_validate_block)
+    with pytest.raises(RuntimeError):
+        alice.notify_of_block(bob.get_latest_hash(), bob)
+    alice.storage.close()  # type: ignore
+
+    storage = SqliteStorage(path)
+    assert storage.get_chain() == old_chain
+    assert set(storage.get_utxos()) == utxos
+
+
+def test_spent_coin_cannot_be_spent_again_in_a_later_block(alice: Node, bob: Node, charlie: Node) -> None:
+    alice.mine_block()
+    tx = alice.create_transaction(bob.get_address())
+    assert tx is not None
+    alice.mine_block()
+
+    double_spend = Transaction(charlie.get_address(), tx.input, sign(tx.input + charlie.get_address(),  # type: ignore
+                                                                     alice.private_key))
+    coinbase = Transaction(alice.get_address(), None, Signature(secrets.token_bytes(64)))
+    assert not alice.validate_block(Block(alice.get_latest_hash(), [coinbase, double_spend]))
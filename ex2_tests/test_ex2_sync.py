@@ -0,0 +1,138 @@
+from ex2 import *
+from ex2 import node as node_module
+from ex2.block import BlockHeader
+import hashlib
+import pytest
+from typing import Any, List
+from unittest.mock import Mock
+
+
+def make_spy(node: Node) -> Mock:
+    """wraps a node so that the calls made to it can be counted"""
+    spy = Mock(wraps=node)
+    spy.SUPPORTS_HEADERS_FIRST = True
+    return spy
+
+
+def mine_blocks(node: Node, count: int) -> List[BlockHash]:
+    return [node.mine_block() for _ in range(count)]
+
+
+def test_catch_up_downloads_bodies_in_batches(alice: Node, bob: Node, monkeypatch: Any) -> None:
+    monkeypatch.setattr(node_module, "BLOCK_DOWNLOAD_BATCH", 7)
+    hashes = mine_blocks(alice, 30)
+    spy = make_spy(alice)
+
+    bob.notify_of_block(alice.get_latest_hash(), spy)
+
+    assert bob.get_latest_hash() == hashes[-1]
+    assert [block.get_block_hash() for block in bob.blockchain] == hashes
+    assert spy.get_block.call_count == 0
+    assert spy.get_headers.call_count == 1
+    assert spy.get_blocks.call_count == 5  # ceil(30 / 7)
+    assert set(bob.get_utxo()) == set(alice.get_utxo())
+
+
+def test_headers_are_requested_in_several_rounds(alice: Node, bob: Node, monkeypatch: Any) -> None:
+    monkeypatch.setattr(node_module, "MAX_HEADERS_PER_REQUEST", 4)
+    hashes = mine_blocks(alice, 10)
+    spy = make_spy(alice)
+
+    bob.notify_of_block(alice.get_latest_hash(), spy)
+
+    assert bob.get_latest_hash() == hashes[-1]
+    assert spy.get_headers.call_count == 3
+
+
+def test_shorter_chain_bodies_are_not_downloaded(alice: Node, bob: Node) -> None:
+    mine_blocks(alice, 2)
+    mine_blocks(bob, 3)
+    spy = make_spy(alice)
+
+    bob.notify_of_block(alice.get_latest_hash(), spy)
+
+    assert spy.get_headers.call_count == 1
+    assert spy.get_blocks.call_count == 0
+    assert bob.get_latest_hash() != alice.get_latest_hash()
+
+
+def test_only_blocks_after_fork_are_downloaded(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    shared = mine_blocks(alice, 25)
+    alice.disconnect_from(bob)
+    mine_blocks(bob, 1)
+    new = mine_blocks(alice, 3)
+    spy = make_spy(alice)
+
+    bob.notify_of_block(alice.get_latest_hash(), spy)
+
+    assert bob.get_latest_hash() == new[-1]
+    assert [block.get_block_hash() for block in bob.blockchain] == shared + new
+    requested = [h for call in spy.get_blocks.call_args_list for h in call.args[0]]
+    assert requested == new
+
+
+def test_get_headers_follows_locator_and_stops(alice: Node) -> None:
+    hashes = mine_blocks(alice, 6)
+    bogus_hash = BlockHash(hashlib.sha256(b"no_such_block").digest())
+
+    headers = alice.get_headers([bogus_hash, hashes[2], hashes[0]])
+    assert [header.get_block_hash() for header in headers] == hashes[3:]
+    assert headers[0].get_prev_block_hash() == hashes[2]
+
+    headers = alice.get_headers([GENESIS_BLOCK_PREV], stop=hashes[1])
+    assert [header.get_block_hash() for header in headers] == hashes[:2]
+    assert headers[0].get_prev_block_hash() == GENESIS_BLOCK_PREV
+
+
+def test_get_blocks_fails_on_unknown_hash(alice: Node) -> None:
+    hashes = mine_blocks(alice, 2)
+    assert alice.get_blocks(hashes) == [alice.get_block(h) for h in hashes]
+    bogus_hash = BlockHash(hashlib.sha256(b"no_such_block").digest())
+    with pytest.raises(ValueError):
+        alice.get_blocks([hashes[0], bogus_hash])
+
+
+def test_block_locator_is_dense_then_sparse(alice: Node) -> None:
+    hashes = mine_blocks(alice, 40)
+    locator = alice._get_block_locator()
+    assert locator[:10] == hashes[::-1][:10]
+    assert locator[-1] == GENESIS_BLOCK_PREV
+    assert len(locator) < 20
+
+
+def test_unlinked_headers_are_rejected(alice: Node, bob: Node) -> None:
+    hashes = mine_blocks(alice, 3)
+    spy = make_spy(alice)
+    bogus_hash = BlockHash(hashlib.sha256(b"no_such_block").digest())
+    spy.get_headers.side_effect = lambda locator, stop=None: [
+        BlockHeader(hashes[0], GENESIS_BLOCK_PREV), BlockHeader(hashes[2], bogus_hash)]
+
+    bob.notify_of_block(hashes[2], spy)
+
+    assert bob.get_latest_hash() == GENESIS_BLOCK_PREV
+    assert spy.get_blocks.call_count == 0
+
+
+def test_header_rounds_are_bounded(alice: Node, bob: Node, monkeypatch: Any) -> None:
+    monkeypatch.setattr(node_module, "MAX_HEADERS_PER_REQUEST", 2)
+    monkeypatch.setattr(node_module, "MAX_HEADER_ROUNDS", 5)
+    hashes = mine_blocks(alice, 1)
+    spy = make_spy(alice)
+
+    def endless_headers(locator: List[BlockHash], stop: Any = None) -> List[BlockHeader]:
+        # full batches of linked headers that never reach the announced block
+        prev = locator[0]
+        batch = []
+        for _ in range(2):
+            block_hash = BlockHash(hashlib.sha256(prev + b"endless").digest())
+            batch.append(BlockHeader(block_hash, prev))
+            prev = block_hash
+        return batch
+
+    spy.get_headers.side_effect = endless_headers
+    bob.notify_of_block(hashes[0], spy)
+
+    assert spy.get_headers.call_count == 5
+    assert bob.get_latest_hash() == GENESIS_BLOCK_PREV
+    assert spy.get_blocks.call_count == 0
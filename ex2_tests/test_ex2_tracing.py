@@ -0,0 +1,113 @@
+from ex2 import *
+from ex2.simulator import Simulation
+from ex2.tracing import NO_SPAN, Span, Tracer
+import json
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+def find(tracer: Tracer, name: str) -> List[Span]:
+    return [span for span in tracer.spans if span.name == name]
+
+
+def ancestors(span: Span) -> List[str]:
+    names = []
+    parent: Optional[Span] = span.parent
+    while parent is not None:
+        names.append(parent.name)
+        parent = parent.parent
+    return names
+
+
+def test_spans_nest_across_peer_calls(alice: Node, bob: Node) -> None:
+    for _ in range(3):
+        alice.mine_block()
+    tracer = Tracer()
+    alice.tracer = bob.tracer = tracer
+    alice.connect(bob)
+    assert bob.get_latest_hash() == alice.get_latest_hash()
+
+    [get_headers] = find(tracer, "get_headers")
+    assert ancestors(get_headers) == ["fork_search", "chain_walk", "notify_of_block"]
+    assert get_headers.args["node"] != get_headers.parent.args["node"]  # type: ignore
+    [get_blocks] = find(tracer, "get_blocks")
+    assert get_blocks.args == {"node": get_headers.args["node"], "count": 3}
+    assert ancestors(get_blocks) == ["chain_walk", "notify_of_block"]
+    assert [span.args["height"] for span in find(tracer, "validate_block")] == [0, 1, 2]
+    assert all(ancestors(span) == ["notify_of_block"] for span in find(tracer, "connect_block"))
+    for span in tracer.spans:
+        assert span.start <= span.end
+        if span.parent is not None:
+            assert span.parent.start <= span.start and span.end <= span.parent.end
+
+
+def test_reorg_phases(alice: Node, bob: Node) -> None:
+    alice.connect(bob)
+    alice.mine_block()
+    alice.disconnect_from(bob)
+    alice.create_transaction(alice.get_address())
+    alice.mine_block()
+    for _ in range(2):
+        bob.mine_block()
+    tracer = alice.tracer = Tracer()
+
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    [rewind] = find(tracer, "state_rewind")
+    assert rewind.args["depth"] == 1
+    [restore] = find(tracer, "mempool_restore")
+    assert restore.args["blocks"] == 1
+    assert ancestors(restore) == ["notify_of_block"]
+    assert len(alice.get_mempool()) == 1
+
+
+def test_mine_block_span(alice: Node, bob: Node) -> None:
+    tracer = Tracer()
+    alice.tracer = bob.tracer = tracer
+    alice.connect(bob)
+    alice.mine_block()
+    [mine_block] = find(tracer, "mine_block")
+    # bob learns of the block inside alice's mine_block, since they are called directly
+    assert all("mine_block" in ancestors(span) for span in find(tracer, "notify_of_block"))
+    assert mine_block.parent is None
+
+
+def test_no_tracer(alice: Node) -> None:
+    assert alice.tracer is None
+    assert alice._span("mine_block") is NO_SPAN
+    alice.mine_block()
+
+
+def test_chrome_trace(alice: Node, tmp_path: Path) -> None:
+    tracer = alice.tracer = Tracer()
+    tracer.start_profiler(interval=0.0005)
+    with tracer.span("outer", label=b"bytes"):
+        alice.mine_block()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+    tracer.stop_profiler()
+
+    path = tmp_path / "trace.json"
+    tracer.write_chrome_trace(str(path))
+    trace = json.loads(path.read_text())
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert [event["name"] for event in spans] == ["outer", "mine_block"]
+    assert spans[0]["args"] == {"label": "b'bytes'"}
+    assert spans[0]["ts"] <= spans[1]["ts"] and spans[1]["dur"] <= spans[0]["dur"]
+    samples = [event for event in trace["traceEvents"] if event["ph"] == "P"]
+    assert samples
+    for sample in samples:
+        frame = trace["stackFrames"][sample["sf"]]
+        while "parent" in frame:
+            frame = trace["stackFrames"][frame["parent"]]
+
+
+def test_simulation_tracing() -> None:
+    simulation = Simulation(nodes=10, topology="ring", block_interval=5.0, tx_rate=0.5, duration=30.0, seed=2)
+    tracer = Tracer()
+    simulation.enable_tracing(tracer)
+    report = simulation.run()
+    assert len(find(tracer, "mine_block")) == report["blocks"]["mined"]
+    assert find(tracer, "validate_block")
@@ -0,0 +1,159 @@
+from ex2 import *
+from ex2.pow import target_from_bits
+from ex2.storage import SqliteStorage
+from ex2.transport import NodeServer, RemotePeer, pack_list, unpack_list
+import asyncio
+import threading
+from pathlib import Path
+import time
+from typing import Callable, Coroutine, Any, Optional
+
+import pytest
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def run_pair(alice: Node, bob: Node, test: Callable[[NodeServer, NodeServer], Coroutine[Any, Any, None]]) -> None:
+    """runs the test with alice and bob served on two ports and connected over TCP"""
+    async def run() -> None:
+        alice_server, bob_server = NodeServer(alice), NodeServer(bob)
+        port = await alice_server.start()
+        await bob_server.start()
+        try:
+            await bob_server.connect_to("127.0.0.1", port)
+            await test(alice_server, bob_server)
+        finally:
+            await bob_server.close()
+            await alice_server.close()
+        assert not alice_server.errors and not bob_server.errors
+    asyncio.run(run())
+
+
+def test_list_encoding() -> None:
+    items = [b"", b"abc", bytes(range(256))]
+    assert unpack_list(pack_list(items)) == items
+    with pytest.raises(ValueError):
+        unpack_list(pack_list(items)[:-1])
+    with pytest.raises(ValueError):
+        unpack_list(b"\x00")
+
+
+def test_connecting_syncs_the_chain(alice: Node, bob: Node) -> None:
+    for _ in range(5):
+        alice.mine_block()
+
+    async def test(alice_server: NodeServer, bob_server: NodeServer) -> None:
+        await wait_until(lambda: bob.get_latest_hash() == alice.get_latest_hash())
+        assert len(bob_server.peers) == 1 and isinstance(bob_server.peers[0], RemotePeer)
+        assert bob_server.peers[0] in bob.get_connections()
+        assert bob.get_balance() == 0 and len(bob.get_utxo()) == 5
+
+    run_pair(alice, bob, test)
+
+
+def test_blocks_and_transactions_are_relayed(alice: Node, bob: Node, charlie: Node) -> None:
+    async def test(alice_server: NodeServer, bob_server: NodeServer) -> None:
+        block_hash = await alice_server.call(alice.mine_block)
+        await wait_until(lambda: bob.get_latest_hash() == block_hash)
+
+        tx = await alice_server.call(alice.create_transaction, charlie.get_address())
+        await wait_until(lambda: tx in bob.mem_pool)
+
+        block_hash = await bob_server.call(bob.mine_block)
+        await wait_until(lambda: alice.get_latest_hash() == block_hash)
+        assert alice.get_mempool() == []
+        assert alice_server.frames_received and bob_server.frames_sent
+
+    run_pair(alice, bob, test)
+
+
+def test_remote_peer_requests(alice: Node, bob: Node) -> None:
+    block_hash = alice.mine_block()
+
+    async def test(alice_server: NodeServer, bob_server: NodeServer) -> None:
+        peer = bob_server.peers[0]
+        block = await bob_server.call(peer.get_block, block_hash)
+        assert block.get_block_hash() == block_hash
+        headers = await bob_server.call(peer.get_headers, [GENESIS_BLOCK_PREV])
+        assert [header.get_block_hash() for header in headers] == [block_hash]
+        with pytest.raises(ValueError):
+            await bob_server.call(peer.get_block, BlockHash(b"unknown"))
+        bob_server.errors.clear()
+        with pytest.raises(RuntimeError):
+            peer.get_block(block_hash)
+
+    run_pair(alice, bob, test)
+
+
+def test_closed_connection_disconnects_the_node(alice: Node, bob: Node) -> None:
+    async def test(alice_server: NodeServer, bob_server: NodeServer) -> None:
+        await wait_until(lambda: len(alice.get_connections()) == 1)
+        bob_server.peers[0].close()
+        await wait_until(lambda: not alice.get_connections() and not bob.get_connections())
+
+    run_pair(alice, bob, test)
+
+
+def test_stored_chain_is_served_while_it_grows(tmp_path: Path, alice: Node, bob: Node) -> None:
+    alice.attach_storage(SqliteStorage(str(tmp_path / "chain.db")))
+    for _ in range(20):
+        alice.mine_block()
+
+    async def test(alice_server: NodeServer, bob_server: NodeServer) -> None:
+        # bob's requests are answered on another thread than the one alice mines on, with its own connection
+        for _ in range(30):
+            alice_server.run_in_node(alice.mine_block)
+        await wait_until(lambda: len(alice.blockchain) == 50)
+        await wait_until(lambda: bob.get_latest_hash() == alice.get_latest_hash())
+        assert len(bob_server.peers) == 1 and not bob_server.peers[0].closed
+
+    run_pair(alice, bob, test)
+
+
+def test_requests_wait_while_the_node_changes(alice: Node, bob: Node) -> None:
+    for _ in range(3):
+        alice.mine_block()
+
+    async def test(alice_server: NodeServer, bob_server: NodeServer) -> None:
+        await wait_until(lambda: bob.get_latest_hash() == alice.get_latest_hash())
+        release = threading.Event()
+        # alice's node thread is busy (e.g. in the middle of a reorg), so bob's request is not answered yet
+        alice_server.run_in_node(release.wait)
+        answer = bob_server.run_in_node(bob_server.peers[0].get_headers, [GENESIS_BLOCK_PREV])
+        try:
+            await asyncio.sleep(0.1)
+            assert not answer.done()
+        finally:
+            release.set()
+        headers = await asyncio.wrap_future(answer)
+        assert [header.get_block_hash() for header in headers] == [block.get_block_hash() for block in alice.blockchain]
+
+    run_pair(alice, bob, test)
+
+
+def test_competing_block_cancels_mining_on_the_node_server(alice: Node, bob: Node) -> None:
+    alice.pow_target = bob.pow_target = target_from_bits(8)
+    searching = threading.Event()
+    find_nonce = alice._find_nonce
+
+    def slow_find_nonce(block: Block) -> Optional[int]:
+        # the search stays in progress until a competing block cancels it
+        searching.set()
+        alice.mining_cancelled.wait(5)
+        return find_nonce(block)
+
+    alice._find_nonce = slow_find_nonce  # type: ignore[method-assign]
+
+    async def test(alice_server: NodeServer, bob_server: NodeServer) -> None:
+        mining = asyncio.ensure_future(alice_server.mine())
+        await wait_until(searching.is_set)
+        competing = await bob_server.call(bob.mine_block)
+        assert await mining is None
+        await wait_until(lambda: alice.get_latest_hash() == competing)
+
+    run_pair(alice, bob, test)
@@ -0,0 +1,109 @@
+from ex2 import *
+from ex2.storage import SqliteStorage
+from ex2.txindex import AddressIndex, TxIndex
+import secrets
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+
+def expected_indexes(node: Node) -> Tuple[TxIndex, AddressIndex]:
+    """the indexes built from scratch from the node's chain"""
+    fresh = Node()
+    fresh.blockchain = list(node.blockchain)
+    return fresh.enable_tx_index(), fresh.enable_address_index()
+
+
+def assert_indexes_match_chain(node: Node) -> None:
+    tx_index, address_index = expected_indexes(node)
+    assert node.tx_index is not None and node.address_index is not None
+    assert node.tx_index.locations == tx_index.locations
+    assert node.address_index.history == address_index.history
+
+
+def test_queries(alice: Node, bob: Node, charlie: Node) -> None:
+    alice.enable_tx_index()
+    alice.enable_address_index()
+    alice.connect(bob)
+    alice.mine_block()
+    payment = alice.create_transaction(bob.get_address())
+    assert payment is not None
+    alice.mine_block()
+    spend = bob.create_transaction(charlie.get_address())
+    assert spend is not None
+    alice.mine_block()
+
+    block_hash = alice.blockchain[1].get_block_hash()
+    assert alice.get_transaction_location(payment.get_txid()) == (block_hash, 1)
+    assert alice.get_transaction_location(TxID(secrets.token_bytes(32))) is None
+    coinbases = [block.get_transactions()[0].get_txid() for block in alice.blockchain]
+    assert alice.get_address_history(alice.get_address()) == [coinbases[0], coinbases[1], payment.get_txid(),
+                                                              coinbases[2]]
+    assert alice.get_address_history(bob.get_address()) == [payment.get_txid(), spend.get_txid()]
+    assert alice.get_address_history(charlie.get_address()) == [spend.get_txid()]
+    assert_indexes_match_chain(alice)
+
+
+def test_not_enabled(alice: Node) -> None:
+    with pytest.raises(ValueError):
+        alice.get_transaction_location(TxID(secrets.token_bytes(32)))
+    with pytest.raises(ValueError):
+        alice.get_address_history(alice.get_address())
+
+
+def test_enabled_on_existing_chain(alice: Node, bob: Node) -> None:
+    for _ in range(3):
+        alice.create_transaction(bob.get_address())
+        alice.mine_block()
+    alice.enable_address_index()
+    alice.enable_tx_index()
+    assert len(alice.get_address_history(bob.get_address())) == 2
+    assert len(alice.tx_index) == 5  # type: ignore
+
+
+@pytest.mark.parametrize("with_undo", [True, False])
+def test_indexes_follow_reorgs(alice: Node, bob: Node, charlie: Node, with_undo: bool) -> None:
+    alice.enable_tx_index()
+    alice.enable_address_index()
+    alice.connect(bob)
+    alice.mine_block()
+    alice.disconnect_from(bob)
+    orphaned: List[Transaction] = []
+    for _ in range(2):
+        payment = alice.create_transaction(charlie.get_address())
+        assert payment is not None
+        orphaned.append(payment)
+        alice.mine_block()
+    for _ in range(3):
+        bob.mine_block()
+    if not with_undo:
+        alice.block_undo = {}
+
+    alice.notify_of_block(bob.get_latest_hash(), bob)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    assert all(alice.get_transaction_location(tx.get_txid()) is None for tx in orphaned)
+    assert alice.get_address_history(charlie.get_address()) == []
+    assert_indexes_match_chain(alice)
+
+    alice.mine_block()
+    assert_indexes_match_chain(alice)
+
+
+def test_indexes_rebuilt_from_storage(alice: Node, bob: Node, tmp_path: Path) -> None:
+    path = str(tmp_path / "chain.db")
+    alice.attach_storage(SqliteStorage(path))
+    for _ in range(3):
+        alice.create_transaction(bob.get_address())
+        alice.mine_block()
+    alice.storage.close()  # type: ignore
+
+    restarted = Node()
+    restarted.enable_address_index()
+    restarted.enable_tx_index()
+    restarted.attach_storage(SqliteStorage(path))
+    payments = [tx.get_txid() for block in alice.blockchain for tx in block.get_transactions()
+                if tx.output == bob.get_address()]
+    assert len(payments) == 2
+    assert restarted.get_address_history(bob.get_address()) == payments
+    assert_indexes_match_chain(restarted)
@@ -0,0 +1,96 @@
+from ex2 import *
+from ex2.mempool import get_entry_size
+
+import pytest
+
+
+def check_owned_coins(node: Node) -> None:
+    """the index matches a scan of the UTXO set and the mempool"""
+    owned = {txid for txid, coin in node.utxos.items() if coin.output == node.get_address()}
+    pending = {txid for txid in owned if node.mem_pool.get_spender(txid) is not None}
+    assert set(node.owned_coins.spendable) == owned - pending
+    assert set(node.owned_coins.pending) == pending
+    assert node.get_balance() == len(owned)
+
+
+def test_coins_become_pending_and_spent(alice: Node, bob: Node) -> None:
+    for _ in range(3):
+        alice.mine_block()
+    check_owned_coins(alice)
+
+    tx = alice.create_transaction(bob.get_address())
+    assert tx is not None
+    assert tx.input in alice.owned_coins.pending
+    assert alice.get_balance() == 3
+    check_owned_coins(alice)
+
+    alice.mine_block()
+    assert tx.input not in alice.owned_coins
+    assert alice.get_balance() == 3
+    check_owned_coins(alice)
+
+
+def test_coins_are_spent_oldest_first_and_only_once(alice: Node, bob: Node) -> None:
+    coins = []
+    for _ in range(2):
+        alice.mine_block()
+        coins.append(alice.blockchain[-1].get_transactions()[0].get_txid())
+    first = alice.create_transaction(bob.get_address())
+    second = alice.create_transaction(bob.get_address())
+    assert first is not None and second is not None
+    assert [first.input, second.input] == coins
+    assert alice.create_transaction(bob.get_address()) is None
+
+
+def test_rejected_coin_falls_through_to_the_next(alice: Node, bob: Node, monkeypatch: pytest.MonkeyPatch) -> None:
+    coins = []
+    for _ in range(3):
+        alice.mine_block()
+        coins.append(alice.blockchain[-1].get_transactions()[0].get_txid())
+    add_transaction_to_mempool = alice.add_transaction_to_mempool
+    monkeypatch.setattr(alice, "add_transaction_to_mempool",
+                        lambda tx: tx.input != coins[0] and add_transaction_to_mempool(tx))
+
+    tx = alice.create_transaction(bob.get_address())
+    assert tx is not None and tx.input == coins[1]
+    check_owned_coins(alice)
+
+    monkeypatch.setattr(alice, "add_transaction_to_mempool", lambda tx: False)
+    assert alice.create_transaction(bob.get_address()) is None
+    check_owned_coins(alice)
+
+
+def test_cleared_mempool_releases_pending_coins(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    tx = alice.create_transaction(bob.get_address())
+    assert alice.create_transaction(bob.get_address()) is None
+    alice.clear_mempool()
+    check_owned_coins(alice)
+    retry = alice.create_transaction(bob.get_address())
+    assert retry is not None and retry.input == tx.input  # type: ignore
+
+
+def test_evicted_transaction_releases_its_coin(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    alice.mine_block()
+    tx = alice.create_transaction(bob.get_address())
+    assert tx is not None
+    alice.mem_pool.max_bytes = get_entry_size(tx)
+    alice.create_transaction(bob.get_address())
+    assert alice.mem_pool.evictions == 1
+    assert tx.input in alice.owned_coins.spendable
+    check_owned_coins(alice)
+
+
+def test_reorg_updates_owned_coins(alice: Node, bob: Node) -> None:
+    alice.mine_block()
+    alice.create_transaction(bob.get_address())
+    alice.mine_block()
+    for _ in range(3):
+        bob.mine_block()
+    alice.connect(bob)
+    assert alice.get_latest_hash() == bob.get_latest_hash()
+    check_owned_coins(alice)
+    check_owned_coins(bob)
+    assert alice.get_balance() == 0
+    assert bob.get_balance() == 3